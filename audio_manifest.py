@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""audio_manifest.py
+
+This file contains the functions that create the audio manifest.  The
+manifest describes the format of each resolved recording (sample rate,
+channels, bit depth, number of frames and duration) and flags
+recordings that are truncated or invalid.  The information is read from
+the RIFF headers of the WAV files.  The manifest can be written as JSON
+or CSV.  Run as a program, it lists the (in)valid recordings in a
+manifest, so later stages (such as transcoding) do not have to open the
+audio files again.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import csv
+from diagnostics import diagnostics
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+
+
+# The fields of a manifest record in the order they are written.
+manifest_fields = ["name", "source", "size", "format", "sample_rate", "channels", "bits", "frames", "duration", "data_offset", "truncated", "invalid", "problem", "source_hash", "trimmed", "trim_start", "trim_end", "gain", "trim_settings"]
+# The numerical fields of a manifest record (needed to read CSV).
+int_fields = ["size", "format", "sample_rate", "channels", "bits", "frames", "data_offset", "trim_start", "trim_end"]
+float_fields = ["duration", "gain"]
+
+
+def read_wav_info(location):
+    """read_wav_info reads the RIFF header of the WAV file found at
+    location (using mmap, so only the pages containing the headers are
+    read).  It returns a dictionary containing the format information.
+    A file is truncated if its chunks extend beyond the end of the
+    file.  A file is invalid if the information cannot be read (the
+    reason is described in "problem").
+    """
+    info = {
+            "size" : 0,
+            "format" : None,
+            "sample_rate" : None,
+            "channels" : None,
+            "bits" : None,
+            "frames" : None,
+            "duration" : None,
+            "data_offset" : None,
+            "truncated" : False,
+            "invalid" : False,
+            "problem" : "",
+            }
+    try:
+        with open(location, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            info["size"] = size
+            if size < 12:
+                info["invalid"] = True
+                info["problem"] = "file too short"
+                return info
+            with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as m:
+                parse_riff(m, size, info)
+    except OSError as e:
+        info["invalid"] = True
+        info["problem"] = str(e)
+    return info
+
+
+def parse_riff(m, size, info):
+    """parse_riff parses the RIFF chunks in m (of length size) and
+    stores the format information in info.
+    """
+    (riff, riff_size, wave) = struct.unpack_from("<4sI4s", m, 0)
+    if riff != b"RIFF" or wave != b"WAVE":
+        info["invalid"] = True
+        info["problem"] = "not a RIFF WAVE file"
+        return
+    if riff_size + 8 > size:
+        info["truncated"] = True
+    block_align = None
+    data_size = None
+    offset = 12
+    while offset + 8 <= size:
+        (chunk_id, chunk_size) = struct.unpack_from("<4sI", m, offset)
+        if chunk_id == b"fmt ":
+            if offset + 24 > size:
+                break
+            (info["format"], info["channels"], info["sample_rate"], byte_rate, block_align, info["bits"]) = struct.unpack_from("<HHIIHH", m, offset + 8)
+        elif chunk_id == b"data":
+            info["data_offset"] = offset + 8
+            data_size = chunk_size
+            if offset + 8 + chunk_size > size:
+                info["truncated"] = True
+                data_size = size - offset - 8
+        offset += 8 + chunk_size + (chunk_size & 1) # chunks are padded to an even size
+    if info["format"] == None:
+        info["invalid"] = True
+        info["problem"] = "missing fmt chunk"
+    elif data_size == None:
+        info["invalid"] = True
+        info["problem"] = "missing data chunk"
+    elif not block_align or not info["sample_rate"]:
+        info["invalid"] = True
+        info["problem"] = "invalid fmt chunk"
+    else:
+        info["frames"] = data_size // block_align
+        info["duration"] = info["frames"] / info["sample_rate"]
+    if info["truncated"] and not info["invalid"]:
+        info["invalid"] = True
+        info["problem"] = "truncated"
+
+
+def build_manifest(resolved, jobs = None):
+    """build_manifest creates the manifest for the recordings in
+    resolved (a dictionary mapping the name of a recording to a tuple
+    of its location and a message, see prepare_audio).  Only
+    recordings with a location are included.  The headers are read in
+    a pool of jobs threads.  It returns a dictionary mapping the name
+    of a recording to its manifest record.
+    """
+    names = sorted([f for f in resolved if resolved[f][0]])
+    locations = [resolved[f][0] for f in names]
+    manifest = {}
+    with ThreadPoolExecutor(max_workers = jobs) as executor:
+        for (f, location, info) in zip(names, locations, executor.map(read_wav_info, locations)):
+            record = {"name" : f, "source" : location}
+            record.update(info)
+            if record["invalid"]:
+                diagnostics.error("invalid recording", "Invalid recording %s (%s): %s", f, location, record["problem"])
+            manifest[f] = record
+    return manifest
+
+
+def write_manifest(filename, manifest):
+    """write_manifest writes the manifest to filename.  If filename ends
+    in .csv, CSV is written, otherwise JSON.
+    """
+    logging.debug("Writing manifest to " + filename)
+    if filename.endswith(".csv"):
+        output = open(filename, "w", newline = "")
+        writer = csv.DictWriter(output, fieldnames = manifest_fields, extrasaction = "ignore")
+        writer.writeheader()
+        for f in sorted(manifest):
+            writer.writerow(manifest[f])
+    else:
+        output = open(filename, "w")
+        json.dump([manifest[f] for f in sorted(manifest)], output, indent = 1)
+    output.close()
+
+
+def read_manifest(filename):
+    """read_manifest reads the manifest written by write_manifest from
+    filename.  It returns a dictionary mapping the name of a recording
+    to its manifest record.
+    """
+    logging.debug("Reading manifest from " + filename)
+    manifest = {}
+    if filename.endswith(".csv"):
+        input = open(filename, newline = "")
+        for record in csv.DictReader(input):
+            for field in int_fields:
+                record[field] = int(record[field]) if record[field] else None
+            for field in float_fields:
+                record[field] = float(record[field]) if record[field] else None
+            record["truncated"] = record["truncated"] == "True"
+            record["invalid"] = record["invalid"] == "True"
+            manifest[record["name"]] = record
+    else:
+        input = open(filename)
+        for record in json.load(input):
+            manifest[record["name"]] = record
+    input.close()
+    return manifest
+
+
+def main():
+    """Commandline arguments are parsed and handled.  The manifest is
+    read and the names of the valid (or invalid) recordings are
+    written to stdout, one per line.
+    """
+
+    parser = argparse.ArgumentParser(description="This program lists the valid or invalid recordings in an audio manifest created by prepare_audio.py.")
+    parser.add_argument("-m", "--manifest",
+            help = "name of manifest file (.json or .csv)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("--invalid",
+            help = "list the invalid recordings (instead of the valid ones)",
+            action = "store_true")
+    args = parser.parse_args()
+
+    # Perform checks on arguments
+    if args.manifest == None:
+        parser.error("A manifest filename is required.")
+
+    manifest = read_manifest(args.manifest)
+    for f in sorted(manifest):
+        if manifest[f]["invalid"] == args.invalid:
+            sys.stdout.write(f + "\n")
+
+
+if __name__ == '__main__':
+    main()
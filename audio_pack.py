@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""audio_pack.py
+
+This file contains the implementation of the audio pack, a single file
+that contains all recordings for the dictionary app.  Recordings with
+identical contents are stored only once (they are deduplicated by their
+SHA-256 hash).  The pack consists of a header, an index that is sorted
+on the name of the recordings, the names and the audio data:
+
+    header  magic (8 bytes), version (uint32), number of names (uint32),
+            offset of the names (uint64)
+    index   for each name: offset of the name relative to the names
+            (uint32), length of the name (uint16), padding (uint16),
+            offset of the data (uint64), length of the data (uint64),
+            SHA-256 hash of the data (32 bytes)
+    names   the names (UTF-8)
+    data    the (deduplicated) recordings
+
+All numbers are little endian.  As the index entries have a fixed size,
+a reader can mmap the pack and find a recording by binary search
+without reading the whole index.  Run as a program, it verifies, lists
+or extracts the contents of a pack.
+"""
+
+import argparse
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import struct
+import sys
+
+
+pack_magic = b"NUUAUDIO"
+pack_version = 1
+header_format = "<8sIIQ"
+header_size = struct.calcsize(header_format)
+index_format = "<IHHQQ32s"
+index_size = struct.calcsize(index_format)
+
+
+def write_pack(filename, recordings):
+    """write_pack writes the recordings (a dictionary mapping the name
+    of a recording to the location of its audio file) to the pack
+    filename.  Recordings with identical contents are stored once.
+    The pack is written to a temporary file that replaces filename, so
+    a reader that has mapped the previous pack is not affected.
+    """
+    logging.debug("Writing audio pack to " + filename)
+    names = sorted(recordings, key = lambda f: f.encode("utf-8"))
+    # Find the unique blobs
+    digests = {}
+    blobs = {} # maps digest to (location, length)
+    for f in names:
+        with open(recordings[f], "rb") as input:
+            digest = hashlib.file_digest(input, "sha256").digest()
+        digests[f] = digest
+        if digest not in blobs:
+            blobs[digest] = (recordings[f], os.path.getsize(recordings[f]))
+        else:
+            logging.debug("Deduplicated " + f)
+    # Compute the layout
+    encoded = [f.encode("utf-8") for f in names]
+    names_offset = header_size + len(names) * index_size
+    offset = names_offset + sum([len(name) for name in encoded])
+    blob_offsets = {}
+    order = [] # the unique digests in the order they are written
+    for f in names:
+        digest = digests[f]
+        if digest not in blob_offsets:
+            blob_offsets[digest] = offset
+            offset += blobs[digest][1]
+            order.append(digest)
+    # Write the pack
+    temporary = filename + "." + str(os.getpid()) + ".tmp"
+    output = open(temporary, "wb")
+    output.write(struct.pack(header_format, pack_magic, pack_version, len(names), names_offset))
+    name_offset = 0
+    for (f, name) in zip(names, encoded):
+        digest = digests[f]
+        output.write(struct.pack(index_format, name_offset, len(name), 0, blob_offsets[digest], blobs[digest][1], digest))
+        name_offset += len(name)
+    for name in encoded:
+        output.write(name)
+    for digest in order:
+        with open(blobs[digest][0], "rb") as input:
+            shutil.copyfileobj(input, output)
+    output.close()
+    os.replace(temporary, filename)
+    logging.debug("Wrote " + str(len(names)) + " names and " + str(len(order)) + " recordings")
+
+
+class AudioPack:
+    """The AudioPack class provides access to the recordings in a pack
+    (see write_pack).  The pack is memory mapped, so only the pages
+    that are needed to find and return recordings are read.
+    """
+
+    def __init__(self, filename):
+        """The AudioPack is opened from filename.  A ValueError is
+        raised if filename is not an audio pack.
+        """
+        self.file = open(filename, "rb")
+        self.data = None
+        try:
+            if os.fstat(self.file.fileno()).st_size < header_size:
+                raise ValueError(filename + " is not an audio pack")
+            self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+            (magic, version, self.count, self.names_offset) = struct.unpack_from(header_format, self.data, 0)
+            if magic != pack_magic or version != pack_version:
+                raise ValueError(filename + " is not an audio pack (version " + str(pack_version) + ")")
+        except Exception:
+            self.close()
+            raise
+
+
+    def close(self):
+        """close closes the pack.
+        """
+        if self.data != None:
+            self.data.close()
+        self.file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def __len__(self):
+        return self.count
+
+
+    def get_record(self, i):
+        """get_record returns the index record i as a tuple of name,
+        offset, length and hash.
+        """
+        (name_offset, name_length, padding, offset, length, digest) = struct.unpack_from(index_format, self.data, header_size + i * index_size)
+        start = self.names_offset + name_offset
+        return (self.data[start:start + name_length].decode("utf-8"), offset, length, digest)
+
+
+    def find(self, name):
+        """find returns the index of the record of name, or -1 if name
+        is not in the pack.
+        """
+        key = name.encode("utf-8")
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            (name_offset, name_length) = struct.unpack_from("<IH", self.data, header_size + middle * index_size)
+            start = self.names_offset + name_offset
+            current = self.data[start:start + name_length]
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                return middle
+        return -1
+
+
+    def __contains__(self, name):
+        return self.find(name) != -1
+
+
+    def get(self, name):
+        """get returns the contents of the recording name as a
+        memoryview (of the mmapped pack), or None if name is not in the
+        pack.
+        """
+        i = self.find(name)
+        if i == -1:
+            return None
+        (name, offset, length, digest) = self.get_record(i)
+        return memoryview(self.data)[offset:offset + length]
+
+
+    def get_names(self):
+        """get_names returns the sorted list of names in the pack.
+        """
+        return [self.get_record(i)[0] for i in range(self.count)]
+
+
+    def verify(self):
+        """verify checks the pack and returns a list of problems (empty
+        if the pack is correct).  The index should be sorted, all
+        recordings should be inside the pack and match their hash.
+        """
+        if header_size + self.count * index_size > len(self.data):
+            return ["Index extends beyond the end of the pack"]
+        problems = []
+        previous = None
+        checked = {}
+        for i in range(self.count):
+            (name_offset, name_length) = struct.unpack_from("<IH", self.data, header_size + i * index_size)
+            if self.names_offset + name_offset + name_length > len(self.data):
+                problems.append("Name " + str(i) + " extends beyond the end of the pack")
+                continue
+            try:
+                (name, offset, length, digest) = self.get_record(i)
+            except UnicodeDecodeError:
+                problems.append("Name " + str(i) + " is not valid UTF-8")
+                continue
+            if previous != None and previous.encode("utf-8") >= name.encode("utf-8"):
+                problems.append("Index not sorted at " + name)
+            previous = name
+            if offset + length > len(self.data):
+                problems.append("Recording " + name + " extends beyond the end of the pack")
+                continue
+            if (offset, length) not in checked:
+                checked[(offset, length)] = hashlib.sha256(self.data[offset:offset + length]).digest()
+            if checked[(offset, length)] != digest:
+                problems.append("Recording " + name + " does not match its hash")
+        return problems
+
+
+def main():
+    """Commandline arguments are parsed and handled.  The pack is
+    verified, and its contents are listed or extracted if requested.
+    The exit status is 1 if the pack is not correct.
+    """
+
+    parser = argparse.ArgumentParser(description="This program verifies, lists or extracts an audio pack created by prepare_audio.py.")
+    parser.add_argument("-p", "--pack",
+            help = "name of audio pack file",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("--list",
+            help = "list the names of the recordings in the pack",
+            action = "store_true")
+    parser.add_argument("-x", "--extract",
+            help = "extract the recordings to DIR (as name.wav)",
+            action = "store",
+            metavar = "DIR")
+    args = parser.parse_args()
+
+    # Perform checks on arguments
+    if args.pack == None:
+        parser.error("A pack filename is required.")
+
+    with AudioPack(args.pack) as pack:
+        problems = pack.verify()
+        for problem in problems:
+            sys.stderr.write(problem + "\n")
+        if args.list:
+            for (name, offset, length, digest) in map(pack.get_record, range(len(pack))):
+                sys.stdout.write(name + "\t" + str(length) + "\t" + digest.hex() + "\n")
+        if args.extract != None:
+            os.makedirs(args.extract, exist_ok = True)
+            for name in pack.get_names():
+                output = open(os.path.join(args.extract, name + ".wav"), "wb")
+                output.write(pack.get(name))
+                output.close()
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""audio_trim.py
+
+This file contains the functions that remove leading and trailing
+silence from recordings and normalise their peak level.  The speech
+boundaries are found by computing the energy of short frames of the
+(memory-mapped) samples with NumPy.  The trimmed copies are written in
+a pool of processes and the edits are recorded in the audio manifest
+(see audio_manifest.py).  Recordings whose source has not changed since
+the previous run are skipped.  Requires NumPy.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from diagnostics import diagnostics
+import hashlib
+import logging
+import numpy
+import os
+import wave
+
+
+# Default settings for trimming.  threshold is the level (in dBFS) a
+# frame needs to exceed to count as speech, peak is the level (in
+# dBFS) of the loudest sample after normalisation, frame is the length
+# of the frames (in ms) and padding is the silence (in ms) that is kept
+# before and after the speech.
+default_trim_settings = {
+        "threshold" : -40.0,
+        "peak" : -1.0,
+        "frame" : 10.0,
+        "padding" : 100.0,
+        }
+
+# The sample types (NumPy) of the PCM bit depths that can be trimmed.
+sample_types = {
+        16 : numpy.int16,
+        32 : numpy.int32,
+        }
+
+
+def settings2text(settings):
+    """settings2text returns a textual representation of the trim
+    settings, which is stored in the manifest.
+    """
+    return ", ".join([key + "=" + str(settings[key]) for key in sorted(settings)])
+
+
+def hash_file(location):
+    """hash_file returns the SHA-256 hash (in hex) of the contents of
+    the file found at location.
+    """
+    with open(location, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def find_speech(samples, sample_rate, settings):
+    """find_speech finds the boundaries of the speech in samples (a
+    NumPy array of frames x channels, normalised to [-1, 1]).  It
+    returns a tuple of the first frame and the frame after the last
+    frame to keep.  If no speech is found, all frames are kept.
+    """
+    nr_frames = len(samples)
+    frame_length = max(1, int(sample_rate * settings["frame"] / 1000))
+    nr_blocks = nr_frames // frame_length
+    if nr_blocks == 0:
+        return (0, nr_frames)
+    blocks = samples[:nr_blocks * frame_length].reshape(nr_blocks, -1)
+    rms = numpy.sqrt(numpy.mean(numpy.square(blocks), axis = 1))
+    level = 20 * numpy.log10(numpy.maximum(rms, 1e-10))
+    speech = numpy.flatnonzero(level > settings["threshold"])
+    if len(speech) == 0:
+        return (0, nr_frames)
+    padding = int(sample_rate * settings["padding"] / 1000)
+    start = max(0, speech[0] * frame_length - padding)
+    end = min(nr_frames, (speech[-1] + 1) * frame_length + padding)
+    return (int(start), int(end))
+
+
+def trim_recording(record, previous, destination, settings):
+    """trim_recording writes a trimmed and peak normalised copy of the
+    recording described by record (a manifest record) to destination.
+    If previous (the manifest record of an earlier run, or None)
+    describes the same source and settings and destination exists,
+    nothing is done.  It returns a dictionary with the fields that
+    should be updated in the manifest record.
+    """
+    source_hash = hash_file(record["source"])
+    settings_text = settings2text(settings)
+    if previous and previous.get("source_hash") == source_hash and previous.get("trim_settings") == settings_text and previous.get("trimmed") == destination and os.path.exists(destination):
+        return {key : previous[key] for key in ["source_hash", "trimmed", "trim_start", "trim_end", "gain", "trim_settings"]}
+    sample_type = sample_types[record["bits"]]
+    full_scale = float(numpy.iinfo(sample_type).max)
+    samples = numpy.memmap(record["source"], dtype = numpy.dtype(sample_type).newbyteorder("<"), mode = "r", offset = record["data_offset"], shape = (record["frames"], record["channels"]))
+    (start, end) = find_speech(samples.astype(numpy.float32) / full_scale, record["sample_rate"], settings)
+    trimmed = samples[start:end].astype(numpy.float64)
+    peak = numpy.max(numpy.abs(trimmed)) if len(trimmed) else 0
+    gain = 1.0
+    if peak > 0:
+        gain = full_scale * 10 ** (settings["peak"] / 20) / peak
+    output = wave.open(destination, "wb")
+    output.setnchannels(record["channels"])
+    output.setsampwidth(record["bits"] // 8)
+    output.setframerate(record["sample_rate"])
+    output.writeframes(numpy.clip(numpy.round(trimmed * gain), -full_scale - 1, full_scale).astype(numpy.dtype(sample_type).newbyteorder("<")).tobytes())
+    output.close()
+    return {
+            "source_hash" : source_hash,
+            "trimmed" : destination,
+            "trim_start" : start,
+            "trim_end" : end,
+            "gain" : float(gain),
+            "trim_settings" : settings_text,
+            }
+
+
+def trim_recordings(manifest, previous, directory, settings, jobs = None):
+    """trim_recordings writes trimmed copies of the valid recordings in
+    the manifest to directory (as name.wav) using a pool of jobs
+    processes and records the edits in the manifest.  previous is the
+    manifest of an earlier run (possibly empty), which is used to skip
+    recordings whose source has not changed.  Recordings that cannot be
+    trimmed are left out (and will be copied as is).
+    """
+    logging.debug("Trimming recordings to " + directory)
+    os.makedirs(directory, exist_ok = True)
+    names = []
+    for f in sorted(manifest):
+        record = manifest[f]
+        if record["invalid"]:
+            continue
+        if record["format"] != 1 or record["bits"] not in sample_types:
+            diagnostics.warning("cannot trim", "Cannot trim %s (format %s, %s bits)", f, record["format"], record["bits"])
+            continue
+        names.append(f)
+    with ProcessPoolExecutor(max_workers = jobs) as executor:
+        futures = [executor.submit(trim_recording, manifest[f], previous.get(f), os.path.join(directory, f + ".wav"), settings) for f in names]
+        for (f, future) in zip(names, futures):
+            manifest[f].update(future.result())
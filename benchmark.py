@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""benchmark.py
+
+This program times the stages of the conversion pipeline (see
+convert.py) separately: reading the spreadsheet (read_ods and
+read_input), inserting the lines (insert_line), building the sort keys
+(clean_sort and entry_sort), the LaTeX of each language
+(get_lang_latex) and the portal output (get_portal).  It runs on given
+spreadsheets and/or on synthetic spreadsheets (see synthetic.py) at
+the given scales.  The cold start of the programs is timed as well:
+the import time of convert and prepare_audio (measured in a new
+interpreter using -X importtime) and the time of convert.py --help.
+The results are written as JSON and can be compared to a baseline (the
+JSON output of an earlier run).
+"""
+
+import argparse
+from convert import read_input
+from dictionary import clean_sort, entry_sort, Dictionary, latex_langs
+from entry import Entry
+import json
+import logging
+import os
+from pandas_ods_reader import read_ods
+import platform
+import subprocess
+import sys
+from synthetic import scale_entries, write_synthetic
+import tempfile
+import time
+
+
+results_version = 1
+
+
+# Directory of the programs
+directory = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_timings(times):
+    """get_timings returns the timings (a dictionary with the minimum,
+    mean and all times in seconds) of times.
+    """
+    return {"min" : min(times), "mean" : sum(times) / len(times), "runs" : times}
+
+
+def time_stage(function, repeat):
+    """time_stage runs function repeat times.  It returns a tuple of the
+    timings (see get_timings) and the result of the last run.
+    """
+    times = []
+    result = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return (get_timings(times), result)
+
+
+def time_import(module, repeat):
+    """time_import imports module repeat times, each time in a new
+    interpreter using -X importtime.  It returns the timings (see
+    get_timings) of the cumulative import time of module.
+    """
+    times = []
+    for i in range(repeat):
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module], cwd = directory, stderr = subprocess.PIPE, check = True)
+        for line in process.stderr.decode("utf-8").splitlines():
+            # import time: self [us] | cumulative | imported package
+            parts = line.split("|")
+            if len(parts) == 3 and parts[2].strip() == module:
+                times.append(int(parts[1]) / 1e6)
+    if not times:
+        raise RuntimeError("The -X importtime output of " + sys.executable + " has no line for " + module)
+    return get_timings(times)
+
+
+def benchmark_startup(repeat):
+    """benchmark_startup times the cold start of the programs, running
+    each repeat times.  It returns a dictionary with the timings.
+    """
+    stages = {}
+    for module in ["convert", "prepare_audio"]:
+        stages["import." + module] = time_import(module, repeat)
+    (stages["help.convert"], result) = time_stage(lambda: subprocess.run([sys.executable, "convert.py", "--help"], cwd = directory, stdout = subprocess.DEVNULL, check = True), repeat)
+    return {"stages" : stages}
+
+
+def insert_lines(rows):
+    """insert_lines returns a Dictionary with the rows (dictionaries
+    mapping the columns to values) inserted.
+    """
+    data = Dictionary()
+    for (index, row) in enumerate(rows):
+        try:
+            data.insert_line(row, index + 2) # 2 is header and offset
+        except ValueError:
+            pass
+    return data
+
+
+def build_sort_keys(data):
+    """build_sort_keys computes the sort keys (clean_sort and entry_sort)
+    of all headwords in data.
+    """
+    for entry in data.entries:
+        for lang in entry.headwords:
+            for hw in entry.headwords[lang]:
+                clean_sort(hw)
+                entry_sort(entry, hw, lang)
+
+
+def benchmark(filename, repeat):
+    """benchmark times the stages of the pipeline on the spreadsheet
+    filename, running each stage repeat times.  It returns a dictionary
+    with the number of entries and the timings of the stages.
+    """
+    logging.debug("Benchmarking " + filename)
+    stages = {}
+    (stages["read_ods"], spreadsheet) = time_stage(lambda: read_ods(filename, 1), repeat)
+    (stages["read_input"], data) = time_stage(lambda: read_input(filename), repeat)
+    rows = spreadsheet.to_dict("records")
+    (stages["insert_line"], data) = time_stage(lambda: insert_lines(rows), repeat)
+    (stages["sort_keys"], result) = time_stage(lambda: build_sort_keys(data), repeat)
+    for lang in latex_langs:
+        (stages["get_lang_latex." + Entry.lang2text(lang)], result) = time_stage(lambda: data.get_lang_latex(lang), repeat)
+    (stages["get_portal"], result) = time_stage(lambda: data.get_portal(), repeat)
+    return {"entries" : len(data.entries), "stages" : stages}
+
+
+def compare(results, baseline, threshold):
+    """compare prints (to stderr) the minimum times of results next to
+    those of baseline (for the inputs and stages in both) and returns
+    the list of (input, stage) of which the time increased by more
+    than threshold (a fraction).
+    """
+    regressions = []
+    sys.stderr.write("%-28s %-30s %10s %10s %8s\n" % ("input", "stage", "baseline", "time", "change"))
+    for (name, result) in results["inputs"].items():
+        if name not in baseline["inputs"]:
+            continue
+        if result.get("entries") != baseline["inputs"][name].get("entries"):
+            sys.stderr.write("%-28s has %s entries, %s in the baseline, not compared\n" % (name, result.get("entries"), baseline["inputs"][name].get("entries")))
+            continue
+        for (stage, timing) in result["stages"].items():
+            if stage not in baseline["inputs"][name]["stages"]:
+                continue
+            old = baseline["inputs"][name]["stages"][stage]["min"]
+            new = timing["min"]
+            change = (new - old) / old if old > 0 else 0
+            flag = ""
+            if change > threshold:
+                regressions.append((name, stage))
+                flag = " !"
+            sys.stderr.write("%-28s %-30s %9.4fs %9.4fs %+7.1f%%%s\n" % (name, stage, old, new, 100 * change, flag))
+    return regressions
+
+
+def main():
+    """Commandline arguments are parsed and handled.  The start of the
+    programs and the spreadsheets (if any) are benchmarked and the
+    results are written.  If a baseline is given, the results are
+    compared to it and the exit status is 1 if a stage is slower than
+    the threshold allows.
+    """
+
+    parser = argparse.ArgumentParser(description="This program benchmarks the stages of the conversion of N|uu spreadsheets.")
+    parser.add_argument("-i", "--input",
+            help = "name of ods spreadsheet file (can be repeated)",
+            action = "append",
+            default = [],
+            metavar = "FILE")
+    parser.add_argument("-s", "--scale",
+            help = "benchmark a synthetic spreadsheet of size SCALE relative to the real spreadsheet (" + str(scale_entries) + " entries), for instance 0.1, 1 or 10 (can be repeated)",
+            action = "append",
+            type = float,
+            default = [],
+            metavar = "SCALE")
+    parser.add_argument("-r", "--repeat",
+            help = "number of runs of each stage (3 default)",
+            action = "store",
+            type = int,
+            default = 3,
+            metavar = "N")
+    parser.add_argument("-o", "--output",
+            help = "name of JSON results filename (stdout default)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("-b", "--baseline",
+            help = "name of JSON results file to compare to",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("-t", "--threshold",
+            help = "allowed slowdown compared to the baseline in percent (10 default)",
+            action = "store",
+            type = float,
+            default = 10,
+            metavar = "PERCENT")
+    parser.add_argument("-d", "--debug",
+            help = "provide debugging information",
+            action = "store_const",
+            dest = "loglevel",
+            const = logging.DEBUG,
+            default = logging.WARNING,
+            )
+    args = parser.parse_args()
+
+    logging.basicConfig(level = args.loglevel)
+
+    # Perform checks on arguments
+    if args.repeat < 1:
+        parser.error("The number of runs should be at least 1.")
+
+    results = {
+            "version" : results_version,
+            "python" : platform.python_version(),
+            "platform" : platform.platform(),
+            "repeat" : args.repeat,
+            "inputs" : {},
+            }
+    try:
+        results["inputs"]["startup"] = benchmark_startup(args.repeat)
+    except RuntimeError as e:
+        sys.stderr.write(str(e) + "\n")
+        sys.exit(1)
+    for filename in args.input:
+        results["inputs"][os.path.basename(filename)] = benchmark(filename, args.repeat)
+    if args.scale:
+        with tempfile.TemporaryDirectory() as directory:
+            for scale in args.scale:
+                # The number of entries is part of the name, so results
+                # of a different scale_entries are not compared
+                name = "synthetic-" + "%g" % scale + "x-" + str(max(1, int(scale * scale_entries)))
+                filename = os.path.join(directory, name + ".ods")
+                write_synthetic(filename, scale)
+                results["inputs"][name] = benchmark(filename, args.repeat)
+
+    if args.output:
+        output = open(args.output, "w")
+        json.dump(results, output, indent = 1)
+        output.close()
+    else:
+        json.dump(results, sys.stdout, indent = 1)
+        sys.stdout.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold / 100)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""benchmark_audio.py
+
+This program benchmarks prepare_audio.py on a synthetic audio archive.
+The archive is a tree of directories (of configurable depth and
+fan-out) with short .wav files, some of which are called .WAV or have no
+extension, some of which occur more than once (identical or different)
+and some of which are missing.  A matching spreadsheet (see
+synthetic.py) refers to the recordings.  The phases of prepare_audio
+are timed separately: scanning the base directory (scan), looking up
+the unique recordings (lookup), resolving the recordings that occur
+more than once (duplicates), writing the copy script (script) and
+running it (staging).  The results are written as JSON and can be
+compared to a baseline (see benchmark.py).
+"""
+
+import argparse
+from benchmark import compare, time_stage
+import json
+import logging
+import os
+import platform
+import prepare_audio
+import random
+import subprocess
+import sys
+from synthetic import get_rows, write_ods
+import tempfile
+import wave
+
+
+results_version = 1
+
+
+def write_wav(filename, samples):
+    """write_wav writes a mono 16 kHz 16 bit wav file with the samples
+    (bytes) to filename.
+    """
+    output = wave.open(filename, "wb")
+    output.setnchannels(1)
+    output.setsampwidth(2)
+    output.setframerate(16000)
+    output.writeframes(samples)
+    output.close()
+
+
+def create_archive(directory, settings, seed = 1):
+    """create_archive creates a synthetic archive (in directory/base)
+    and spreadsheet (directory/input.ods) using settings (a dictionary
+    with the number of entries, depth, fanout, samples per recording
+    and the fractions of upper case (.WAV), bare (no extension),
+    duplicate, different duplicate and missing recordings).  It
+    returns a dictionary with the number of recordings of each kind.
+    """
+    r = random.Random(seed)
+    base = os.path.join(directory, "base")
+    dirs = [base]
+    for level in range(settings["depth"]):
+        dirs = [os.path.join(d, "session%02d" % i) for d in dirs for i in range(settings["fanout"])]
+    for d in dirs:
+        os.makedirs(d, exist_ok = True)
+    rows = get_rows(settings["entries"], seed)
+    counts = {"recordings" : 0, "upper" : 0, "bare" : 0, "duplicate" : 0, "different" : 0, "missing" : 0}
+    for row in rows:
+        for column in ["Dictionary Recording (target word only)", "Recordings (target word in sentence)"]:
+            if not row[column]:
+                row[column] = "--" # no recording
+                continue
+            for f in prepare_audio.split_recordings(row[column]):
+                counts["recordings"] += 1
+                if r.random() < settings["missing"]:
+                    counts["missing"] += 1
+                    continue
+                extension = ".wav"
+                if r.random() < settings["upper"]:
+                    extension = ".WAV"
+                    counts["upper"] += 1
+                elif r.random() < settings["bare"]:
+                    extension = ""
+                    counts["bare"] += 1
+                samples = r.randbytes(2 * settings["samples"])
+                write_wav(os.path.join(r.choice(dirs), f + extension), samples)
+                if r.random() < settings["duplicate"]:
+                    counts["duplicate"] += 1
+                    if r.random() < settings["different"]:
+                        counts["different"] += 1
+                        samples = r.randbytes(2 * settings["samples"])
+                    write_wav(os.path.join(r.choice(dirs), f + ".wav"), samples)
+    write_ods(os.path.join(directory, "input.ods"), rows)
+    return counts
+
+
+def count_locations(f, index):
+    """count_locations returns the number of audio files of recording f
+    in index (see prepare_audio.resolve_recording).
+    """
+    return sum([len(index.get(name, [])) for name in [f + ".wav", f + ".WAV", f]])
+
+
+def resolve(names, index):
+    """resolve resolves the recordings in names using index (see
+    prepare_audio.scan_base).  It returns resolved (see
+    prepare_audio.resolve_recording).
+    """
+    resolved = {}
+    for f in names:
+        prepare_audio.resolve_recording(f, index, resolved)
+    return resolved
+
+
+def benchmark(directory, repeat):
+    """benchmark times the phases of prepare_audio on the archive and
+    spreadsheet in directory, running each phase repeat times.  It
+    returns a dictionary with the number of recordings and the timings
+    of the phases.
+    """
+    base = os.path.join(directory, "base")
+    data = prepare_audio.read_input(os.path.join(directory, "input.ods"))
+    names = []
+    for i in data:
+        for column in ["tw", "tw in s"]:
+            if i[column]:
+                names += prepare_audio.split_recordings(i[column])
+    names = list(dict.fromkeys(names)) # unique, in order
+    stages = {}
+    (stages["scan"], index) = time_stage(lambda: prepare_audio.scan_base(base), repeat)
+    unique = [f for f in names if count_locations(f, index) <= 1]
+    duplicates = [f for f in names if count_locations(f, index) > 1]
+    (stages["lookup"], resolved) = time_stage(lambda: resolve(unique, index), repeat)
+    (stages["duplicates"], result) = time_stage(lambda: resolve(duplicates, index), repeat)
+    resolved.update(result)
+    script = os.path.join(directory, "audio.sh")
+    target = os.path.join(directory, "audio")
+    (stages["script"], result) = time_stage(lambda: prepare_audio.write_output(script, data, resolved, target, target + "/sentences"), repeat)
+    (stages["staging"], result) = time_stage(lambda: subprocess.run(["sh", script], check = True), repeat)
+    return {"recordings" : len(names), "stages" : stages}
+
+
+def main():
+    """Commandline arguments are parsed and handled.  The archive is
+    created and benchmarked and the results are written.  If a baseline
+    is given, the results are compared to it and the exit status is 1
+    if a phase is slower than the threshold allows.
+    """
+
+    parser = argparse.ArgumentParser(description="This program benchmarks prepare_audio.py on a synthetic audio archive.")
+    parser.add_argument("-n", "--entries",
+            help = "number of entries of the spreadsheet (2500 default)",
+            action = "store",
+            type = int,
+            default = 2500,
+            metavar = "N")
+    parser.add_argument("--depth",
+            help = "depth of the directory tree of the archive (3 default)",
+            action = "store",
+            type = int,
+            default = 3,
+            metavar = "N")
+    parser.add_argument("--fanout",
+            help = "number of subdirectories of each directory (4 default)",
+            action = "store",
+            type = int,
+            default = 4,
+            metavar = "N")
+    parser.add_argument("--samples",
+            help = "number of samples of each recording (800 default)",
+            action = "store",
+            type = int,
+            default = 800,
+            metavar = "N")
+    parser.add_argument("--upper",
+            help = "fraction of recordings called .WAV (0.1 default)",
+            action = "store",
+            type = float,
+            default = 0.1)
+    parser.add_argument("--bare",
+            help = "fraction of recordings without extension (0.05 default)",
+            action = "store",
+            type = float,
+            default = 0.05)
+    parser.add_argument("--duplicate",
+            help = "fraction of recordings that occur twice (0.1 default)",
+            action = "store",
+            type = float,
+            default = 0.1)
+    parser.add_argument("--different",
+            help = "fraction of the duplicates that differ (0.2 default)",
+            action = "store",
+            type = float,
+            default = 0.2)
+    parser.add_argument("--missing",
+            help = "fraction of recordings that are missing (0.05 default)",
+            action = "store",
+            type = float,
+            default = 0.05)
+    parser.add_argument("--seed",
+            help = "random seed (1 default)",
+            action = "store",
+            type = int,
+            default = 1)
+    parser.add_argument("-a", "--archive",
+            help = "create (or reuse) the archive in DIR instead of a temporary directory",
+            action = "store",
+            metavar = "DIR")
+    parser.add_argument("-r", "--repeat",
+            help = "number of runs of each phase (3 default)",
+            action = "store",
+            type = int,
+            default = 3,
+            metavar = "N")
+    parser.add_argument("-o", "--output",
+            help = "name of JSON results filename (stdout default)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("-b", "--baseline",
+            help = "name of JSON results file to compare to",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("-t", "--threshold",
+            help = "allowed slowdown compared to the baseline in percent (10 default)",
+            action = "store",
+            type = float,
+            default = 10,
+            metavar = "PERCENT")
+    parser.add_argument("-d", "--debug",
+            help = "provide debugging information",
+            action = "store_const",
+            dest = "loglevel",
+            const = logging.DEBUG,
+            # The archive is meant to contain problems, so only
+            # critical messages are shown by default
+            default = logging.CRITICAL,
+            )
+    args = parser.parse_args()
+
+    logging.basicConfig(level = args.loglevel)
+
+    # Perform checks on arguments
+    if args.repeat < 1:
+        parser.error("The number of runs should be at least 1.")
+
+    settings = {}
+    for key in ["entries", "depth", "fanout", "samples", "upper", "bare", "duplicate", "different", "missing"]:
+        settings[key] = getattr(args, key)
+    name = "archive-" + str(args.entries)
+    results = {
+            "version" : results_version,
+            "python" : platform.python_version(),
+            "platform" : platform.platform(),
+            "repeat" : args.repeat,
+            "settings" : settings,
+            "inputs" : {},
+            }
+    if args.archive != None:
+        if not os.path.exists(os.path.join(args.archive, "input.ods")):
+            results["counts"] = create_archive(args.archive, settings, args.seed)
+        results["inputs"][name] = benchmark(args.archive, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            results["counts"] = create_archive(directory, settings, args.seed)
+            results["inputs"][name] = benchmark(directory, args.repeat)
+
+    if args.output:
+        output = open(args.output, "w")
+        json.dump(results, output, indent = 1)
+        output.close()
+    else:
+        json.dump(results, sys.stdout, indent = 1)
+        sys.stdout.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold / 100)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
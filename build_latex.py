@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""build_latex.py
+
+This program builds the PDF of the dictionary from the LaTeX output of
+convert.py --split: a master file that includes a file for each section,
+which inputs a file for each block of headwords with the same initial.
+The LaTeX engine is run until the .aux, .toc, .bcf and .bbl files are
+stable, biber is only run if the bibliography or the citations changed
+and the build is skipped if none of the inputs changed.  Using --only,
+only the given sections are typeset (\\includeonly), taking the page
+numbers and references of the other sections from their .aux files,
+which allows a fast rebuild after a change.  Using --proof, the
+selected blocks are compiled in parallel as separate documents for
+proofing.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dictionary import get_latex_preamble
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+
+
+def get_files(filename, command):
+    """get_files returns the list of file names that are included
+    (command is include or input) in the LaTeX file filename.
+    """
+    with open(filename) as f:
+        return re.findall("^\\\\" + command + "{([^}]*)}", f.read(), re.M)
+
+
+def get_blocks(master):
+    """get_blocks returns the list of names of the blocks of all
+    sections of the master file.
+    """
+    directory = os.path.dirname(os.path.abspath(master))
+    result = []
+    for section in get_files(master, "include"):
+        filename = os.path.join(directory, section + ".tex")
+        if section != "intro" and os.path.exists(filename):
+            result += get_files(filename, "input")
+    return result
+
+
+def run(command, directory):
+    """run runs command in directory.  It returns a tuple of whether it
+    succeeded, its output and the time it took.
+    """
+    logging.debug("Running " + " ".join(command))
+    start = time.perf_counter()
+    try:
+        process = subprocess.run(command, cwd = directory, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, stdin = subprocess.DEVNULL)
+    except OSError as e:
+        return (False, str(e), time.perf_counter() - start)
+    return (process.returncode == 0, process.stdout.decode("utf-8", "replace"), time.perf_counter() - start)
+
+
+def get_latex_command(engine, jobname, tex):
+    """get_latex_command returns the command that runs the LaTeX engine
+    (a command line) on tex (a file name or LaTeX code), writing output
+    jobname.
+    """
+    return shlex.split(engine) + ["-interaction=nonstopmode", "-halt-on-error", "-jobname=" + jobname, tex]
+
+
+def hash_files(directory, filenames):
+    """hash_files returns the SHA-256 hash of the names and contents of
+    filenames (in directory).  Files that do not exist are hashed as
+    missing.
+    """
+    result = hashlib.sha256()
+    for filename in filenames:
+        result.update(filename.encode("utf-8") + b"\0")
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                result.update(hashlib.sha256(f.read()).digest())
+        else:
+            result.update(b"missing")
+    return result.hexdigest()
+
+
+def get_inputs(master):
+    """get_inputs returns the sorted list of input files of master (the
+    LaTeX files it includes and inputs, recursively, and the
+    bibliography files).
+    """
+    directory = os.path.dirname(os.path.abspath(master))
+    result = set([os.path.basename(master)])
+    todo = [os.path.basename(master)]
+    while todo:
+        filename = todo.pop()
+        with open(os.path.join(directory, filename)) as f:
+            text = f.read()
+        for name in re.findall("^\\\\(?:include|input){([^}]*)}", text, re.M):
+            if not name.endswith(".tex"):
+                name += ".tex"
+            if name not in result and os.path.exists(os.path.join(directory, name)):
+                result.add(name)
+                todo.append(name)
+        result.update(re.findall("\\\\addbibresource{([^}]*)}", text))
+    return sorted(result)
+
+
+def read_cache(filename):
+    """read_cache returns the build cache (a dictionary) in filename,
+    which is empty if filename does not exist or cannot be read.
+    """
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build(master, engine, biber = "biber", only = None, max_passes = 5, force = False):
+    """build builds the master file using engine.  If only (a list of
+    section names) is given, only these sections are typeset.  The
+    build is skipped if the inputs (see get_inputs) are the same as in
+    the previous build (unless force is true).  Otherwise, the engine
+    is run until the .aux, .toc, .bcf and .bbl files are stable (at
+    most max_passes times).  biber is run after the first pass, unless
+    the bibliography and the citations (.bcf) are the same as in the
+    previous build.  The state is kept in jobname.build.json.  It
+    returns whether the build succeeded.
+    """
+    directory = os.path.dirname(os.path.abspath(master))
+    jobname = os.path.splitext(os.path.basename(master))[0]
+    cache_filename = os.path.join(directory, jobname + ".build.json")
+    cache = read_cache(cache_filename)
+    inputs = get_inputs(master)
+    bibliography = [name for name in inputs if not name.endswith(".tex")]
+    sections = get_files(master, "include")
+    state_files = [name + ".aux" for name in [jobname] + sections] + [jobname + ".toc", jobname + ".bcf", jobname + ".bbl"]
+    inputs_hash = hash_files(directory, inputs)
+    if not force and cache.get("inputs") == inputs_hash and cache.get("only") == only and cache.get("engine") == engine and os.path.exists(os.path.join(directory, jobname + ".pdf")):
+        logging.info(master + " is up to date")
+        return True
+    tex = jobname
+    if only != None:
+        tex = "\\includeonly{" + ",".join(only) + "}\\input{" + jobname + "}"
+    # Remove the cache, so an interrupted build is not up to date
+    if os.path.exists(cache_filename):
+        os.remove(cache_filename)
+    state = hash_files(directory, state_files)
+    timings = []
+    biber_time = None
+    converged = False
+    while len(timings) < max_passes:
+        (success, output, duration) = run(get_latex_command(engine, jobname, tex), directory)
+        timings.append(duration)
+        logging.info("LaTeX pass " + str(len(timings)) + " took " + "%.2f" % duration + "s")
+        if not success:
+            sys.stderr.write(output[-2000:])
+            logging.error("LaTeX failed on " + master)
+            return False
+        if len(timings) == 1:
+            bcf_hash = hash_files(directory, [jobname + ".bcf"])
+            bib_hash = hash_files(directory, bibliography)
+            if cache.get("bcf") != bcf_hash or cache.get("bib") != bib_hash or not os.path.exists(os.path.join(directory, jobname + ".bbl")):
+                (success, output, biber_time) = run(shlex.split(biber) + [jobname], directory)
+                logging.info("biber took " + "%.2f" % biber_time + "s")
+                if not success:
+                    sys.stderr.write(output[-2000:])
+                    logging.error("biber failed on " + master)
+                    return False
+            else:
+                logging.info("Skipping biber (bibliography and citations unchanged)")
+        new_state = hash_files(directory, state_files)
+        if new_state == state:
+            converged = True
+            break
+        state = new_state
+    if not converged:
+        logging.warning(master + " did not converge in " + str(max_passes) + " passes")
+    pdf_size = os.path.getsize(os.path.join(directory, jobname + ".pdf")) if os.path.exists(os.path.join(directory, jobname + ".pdf")) else 0
+    logging.info("Built " + master + " (" + "%.1f" % (pdf_size / 1e6) + " MB) in " + str(len(timings)) + " LaTeX passes (" + ", ".join(["%.2f" % t for t in timings]) + "s)" + (", biber " + "%.2f" % biber_time + "s" if biber_time != None else ", biber skipped"))
+    output = open(cache_filename, "w")
+    json.dump({
+            "inputs" : inputs_hash,
+            "only" : only,
+            "engine" : engine,
+            "bib" : bib_hash,
+            "bcf" : bcf_hash,
+            "passes" : timings,
+            "biber" : biber_time,
+            "size" : pdf_size,
+            }, output, indent = 1)
+    output.close()
+    return True
+
+
+def proof_block(directory, block, engine):
+    """proof_block compiles block (in directory) as a separate document
+    (proof/block.tex) without the introduction.  It returns a tuple of
+    the block and whether it succeeded.
+    """
+    filename = os.path.join(directory, "proof", block + ".tex")
+    output = open(filename, "w")
+    output.write(get_latex_preamble())
+    output.write("\\begin{document}\n")
+    output.write("\\begin{multicols}{2}\n")
+    output.write("\\input{" + block + "}\n")
+    output.write("\\end{multicols}\n")
+    output.write("\\end{document}\n")
+    output.close()
+    command = get_latex_command(engine, block, os.path.join("proof", block + ".tex"))
+    command.insert(-4, "-output-directory=proof")
+    (success, log, duration) = run(command, directory)
+    logging.info(engine + " took " + "%.2f" % duration + "s on block " + block)
+    if not success:
+        logging.error(engine + " failed on block " + block + ":\n" + log[-2000:])
+    return (block, success)
+
+
+def proof(master, patterns, engine, jobs = None):
+    """proof compiles the blocks of master that match any of patterns
+    (shell patterns) in parallel using jobs processes.  The PDFs are
+    written to the proof directory next to master.  It returns whether
+    all blocks succeeded.
+    """
+    directory = os.path.dirname(os.path.abspath(master))
+    blocks = [block for block in get_blocks(master) if any([fnmatch.fnmatch(block, pattern) for pattern in patterns])]
+    if not blocks:
+        logging.warning("No blocks match " + ", ".join(patterns))
+    os.makedirs(os.path.join(directory, "proof"), exist_ok = True)
+    with ThreadPoolExecutor(max_workers = jobs) as executor:
+        results = list(executor.map(lambda block: proof_block(directory, block, engine), blocks))
+    failed = [block for (block, success) in results if not success]
+    logging.info("Proofed " + str(len(blocks) - len(failed)) + " of " + str(len(blocks)) + " blocks")
+    return not failed
+
+
+def main():
+    """Commandline arguments are parsed and handled.  The master file is
+    built completely or partially (--only) or the selected blocks are
+    proofed (--proof).  The exit status is 1 if a build fails.
+    """
+
+    parser = argparse.ArgumentParser(description="This program builds the PDF of the LaTeX output of convert.py --split.")
+    parser.add_argument("-m", "--master",
+            help = "name of the master LaTeX file",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("-e", "--engine",
+            help = "LaTeX engine command (pdflatex default)",
+            action = "store",
+            default = "pdflatex",
+            metavar = "COMMAND")
+    parser.add_argument("-b", "--biber",
+            help = "biber command (biber default)",
+            action = "store",
+            default = "biber",
+            metavar = "COMMAND")
+    parser.add_argument("--only",
+            help = "typeset only SECTION (for instance out-nama, can be repeated)",
+            action = "append",
+            metavar = "SECTION")
+    parser.add_argument("--max-passes",
+            help = "maximum number of LaTeX passes (5 default)",
+            action = "store",
+            type = int,
+            default = 5,
+            metavar = "N")
+    parser.add_argument("-f", "--force",
+            help = "build even if the inputs did not change",
+            action = "store_true")
+    parser.add_argument("--proof",
+            help = "compile the blocks that match PATTERN (for instance 'out-nama-*') separately (can be repeated)",
+            action = "append",
+            metavar = "PATTERN")
+    parser.add_argument("-j", "--jobs",
+            help = "number of blocks that are compiled in parallel",
+            action = "store",
+            type = int,
+            metavar = "N")
+    parser.add_argument("-l", "--log",
+            help = "name of logging filename (stdout default)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("-d", "--debug",
+            help = "provide debugging information",
+            action = "store_const",
+            dest = "loglevel",
+            const = logging.DEBUG,
+            default = logging.INFO,
+            )
+    args = parser.parse_args()
+
+    if args.log:
+        logging.basicConfig(filename = args.log, filemode='w', format = '%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s', datefmt = '%H:%M:%S', level = args.loglevel)
+    else:
+        logging.basicConfig(level = args.loglevel)
+
+    # Perform checks on arguments
+    if args.master == None:
+        parser.error("A master filename is required.")
+    if args.proof != None and args.only != None:
+        parser.error("--proof and --only cannot be combined.")
+    if args.max_passes < 1:
+        parser.error("The maximum number of passes should be at least 1.")
+
+    if args.proof != None:
+        success = proof(args.master, args.proof, args.engine, args.jobs)
+    else:
+        success = build(args.master, args.engine, args.biber, args.only, args.max_passes, args.force)
+    if not success:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
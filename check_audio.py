@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""check_audio.py
+
+This program takes a spreadsheet in .ods format containing linguistic
+information on the N|uu language (collected through field work).  It
+checks whether the recordings that are referenced in the portal output
+(<Sound>) can be found in the (staged) audio directory.  It reports
+missing recordings, orphaned audio files and recording names that are
+tokenised differently by the portal output and prepare_audio.py.
+"""
+
+import argparse
+from convert import read_input
+import logging
+import os
+from prepare_audio import split_recordings
+import sys
+
+
+def read_listing(directory):
+    """read_listing returns the set of names of the recordings (without
+    .wav extension) that are found in directory.  The directory is not
+    searched recursively as this is how the audio is staged.
+    """
+    result = set()
+    with os.scandir(directory) as it:
+        for f in it:
+            if f.is_file() and f.name.endswith(".wav"):
+                result.add(f.name[:-4])
+    return result
+
+
+def check_audio(data, available):
+    """check_audio compares the recordings that are referenced by the
+    entries in data (a Dictionary) with the set of available
+    recordings.  It returns a tuple of the referenced recordings that
+    are missing, the available recordings that are not referenced
+    (orphaned) and a list of (line_nr, column text, portal names,
+    staged names) for entries where the portal names differ from the
+    names used when staging the audio.
+    """
+    referenced = set()
+    mistokenised = []
+    for entry in data.entries:
+        sounds = entry.get_sounds()
+        referenced.update(sounds)
+        if entry.audio_word:
+            staged = split_recordings(entry.audio_word)
+            if sounds != staged:
+                mistokenised.append((entry.line_nr, entry.audio_word, sounds, staged))
+    missing = sorted(referenced - available)
+    orphaned = sorted(available - referenced)
+    return (missing, orphaned, mistokenised)
+
+
+def write_report(output, missing, orphaned, mistokenised):
+    """write_report writes the results of check_audio to output (a file
+    object).
+    """
+    for f in missing:
+        output.write("Missing " + f + "\n")
+    for f in orphaned:
+        output.write("Orphaned " + f + "\n")
+    for (line_nr, text, sounds, staged) in mistokenised:
+        output.write("Mis-tokenised on line " + line_nr + ": \"" + text + "\" portal: " + ", ".join(sounds) + " staged: " + ", ".join(staged) + "\n")
+    output.write(str(len(missing)) + " missing, " + str(len(orphaned)) + " orphaned, " + str(len(mistokenised)) + " mis-tokenised\n")
+
+
+def main():
+    """Commandline arguments are parsed and handled.  Next, the input
+    is read from the input filename and the audio directory is
+    listed.  The referenced and available recordings are compared and
+    a report is written.  The exit status is 1 if recordings are
+    missing or mis-tokenised, so the check can be used before
+    uploading the portal output.
+    """
+
+    parser = argparse.ArgumentParser(description="This program checks whether all recordings referenced in the portal output of the N|uu spreadsheet are present in the audio directory.")
+    parser.add_argument("-i", "--input",
+            help = "name of ods spreadsheet file",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("-a", "--audio",
+            help = "directory that contains the staged audio files",
+            action = "store",
+            metavar = "DIR")
+    parser.add_argument("-o", "--output",
+            help = "name of report filename (stdout default)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("-l", "--log",
+            help = "name of logging filename (stdout default)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("-d", "--debug",
+            help = "provide debugging information",
+            action = "store_const",
+            dest = "loglevel",
+            const = logging.DEBUG,
+            default = logging.WARNING,
+            )
+    args = parser.parse_args()
+
+    if args.log:
+        logging.basicConfig(filename = args.log, filemode='w', format = '%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s', datefmt = '%H:%M:%S', level = args.loglevel)
+    else:
+        logging.basicConfig(level = args.loglevel)
+
+    # Perform checks on arguments
+    if args.input == None:
+        parser.error("An input filename is required.")
+    if args.audio == None:
+        parser.error("An audio directory is required.")
+
+    # Handle the data
+    data = read_input(args.input)
+    available = read_listing(args.audio)
+    (missing, orphaned, mistokenised) = check_audio(data, available)
+    if args.output:
+        output = open(args.output, "w")
+        write_report(output, missing, orphaned, mistokenised)
+        output.close()
+    else:
+        write_report(sys.stdout, missing, orphaned, mistokenised)
+    if missing or mistokenised:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
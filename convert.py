@@ -9,25 +9,40 @@ output (in LaTeX format) for the physical dictionary.
 """
 
 import argparse
+from delta import write_delta
+from diagnostics import diagnostics
 from dictionary import Dictionary
+from entry import Entry
 import logging
-from pandas_ods_reader import read_ods
+from near_duplicates import write_near_duplicates
+from profiling import no_profiler, Profiler
+from render import LatexSink, PortalSink, render, SplitLatexSink
+from search_index import write_search_index
+from shards import write_shards
+from snapshot import is_snapshot, Snapshot
+from sqlite_export import write_sqlite
+from watch import Watcher
 
 
 from itertools import chain
 
-def read_input(filename):
+def read_input(filename, profiler = no_profiler):
     """Read input .ods file found at filename. Internalize in a Dictionary
-    object.
+    object.  If filename contains a snapshot (see snapshot.py), the
+    snapshot is loaded instead.  The stages are recorded by profiler.
     """
-    logging.debug("Reading in file " + filename)
+    if is_snapshot(filename):
+        logging.debug("Loading snapshot %s", filename)
+        with profiler.stage("load snapshot"):
+            return Snapshot(filename)
+    logging.debug("Reading in file %s", filename)
+    # pandas_ods_reader is imported here as importing pandas is slow
+    from pandas_ods_reader import read_ods
     data = Dictionary() 
-    spreadsheet = read_ods(filename , 1)
-    for index, row in spreadsheet.iterrows():
-        try:
-            data.insert_line(row, index + 2) # 2 is header and offset
-        except ValueError:
-            logging.error("Missing N|uu information on line " + str(index + 2))
+    with profiler.stage("read ODS"):
+        spreadsheet = read_ods(filename , 1)
+    with profiler.stage("insert rows"):
+        data.insert_rows(spreadsheet)
     return data
 
 
@@ -35,19 +50,13 @@ def write_latex(filename, data):
     """The data is written to the LaTeX file (filename) in LaTeX
     format.
     """
-    logging.debug("Writing LaTeX output to " + filename)
-    output = open(filename, "w")
-    output.write(data.get_latex())
-    output.close()
+    render(data, [LatexSink(filename)])
 
 def write_portal(filename, data):
     """The data is written to the file (filename) in portal (XML)
     format.
     """
-    logging.debug("Writing app output to " + filename)
-    output = open(filename, "w")
-    output.write(data.get_portal())
-    output.close()
+    render(data, [PortalSink(filename)])
 
 
 def main():
@@ -61,17 +70,114 @@ def main():
 
     parser = argparse.ArgumentParser(description="This program converts the N|uu spreadsheet into a format that can be used as input for the dictionary portal.  It also checks the input on several aspects.  It generates output files (.txt) based on the output argument.")
     parser.add_argument("-i", "--input",
-            help = "name of ods spreadsheet file",
+            help = "name of ods spreadsheet (or snapshot) file",
             action = "store",
             metavar = "FILE")
     parser.add_argument("-t", "--latex",
             help = "name of latex filename",
             action = "store",
             metavar = "FILE")
+    parser.add_argument("--split",
+            help = "write the LaTeX output as a master file with a file per section and per initial (for build_latex.py)",
+            action = "store_true")
+    parser.add_argument("--lang",
+            help = "write only the LaTeX section (and near duplicates) of language LANG (can be repeated)",
+            action = "append",
+            choices = ["nuu", "nama", "afrikaans", "english"])
+    parser.add_argument("--from",
+            help = "write only the LaTeX lemmas that sort (see clean_sort) from WORD",
+            action = "store",
+            dest = "first",
+            metavar = "WORD")
+    parser.add_argument("--to",
+            help = "write only the LaTeX lemmas that sort (see clean_sort) up to and including WORD (as a prefix)",
+            action = "store",
+            dest = "last",
+            metavar = "WORD")
     parser.add_argument("-p", "--portal",
             help = "name of portal filename",
             action = "store",
             metavar = "FILE")
+    parser.add_argument("-s", "--sqlite",
+            help = "name of SQLite database filename (for the app)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("--search-index",
+            help = "name of search index filename (for the app)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("--snapshot",
+            help = "name of snapshot filename (which can be used as input)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("--shards",
+            help = "write the portal output as compressed shards with a manifest to DIR",
+            action = "store",
+            metavar = "DIR")
+    parser.add_argument("--shard-size",
+            help = "maximum (uncompressed) size of a shard in bytes (1000000 default)",
+            action = "store",
+            type = int,
+            default = 1000000,
+            metavar = "BYTES")
+    parser.add_argument("--shard-by",
+            help = "split the shards by N|uu initial or by entry range (initial default)",
+            action = "store",
+            choices = ["initial", "range"],
+            default = "initial")
+    parser.add_argument("--compression",
+            help = "compression of the shards (gzip default, zstd requires zstandard)",
+            action = "store",
+            choices = ["gzip", "zstd"],
+            default = "gzip")
+    parser.add_argument("-j", "--jobs",
+            help = "number of threads used to write the shards",
+            action = "store",
+            type = int,
+            metavar = "N")
+    parser.add_argument("--diff",
+            help = "write only the portal records that changed between the OLD and NEW spreadsheets (instead of --input)",
+            action = "store",
+            nargs = 2,
+            metavar = ("OLD", "NEW"))
+    parser.add_argument("--deleted",
+            help = "name of the file with the (old) portal records of the deleted entries in --diff mode (PORTAL.deleted default)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("--near-duplicates",
+            help = "write the groups of the same and of similar headwords of each language to FILE",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("--max-distance",
+            help = "maximum number of edits between near duplicate headwords (1 default, 0 only finds differences in accents, clicks and spacing)",
+            action = "store",
+            type = int,
+            default = 1,
+            metavar = "N")
+    parser.add_argument("--watch",
+            help = "keep running and update the portal and LaTeX output whenever the input changes",
+            action = "store_true")
+    parser.add_argument("--interval",
+            help = "interval in seconds at which --watch checks the input (0.5 default)",
+            action = "store",
+            type = float,
+            default = 0.5,
+            metavar = "SECONDS")
+    parser.add_argument("--profile",
+            help = "report the time and memory of each stage (on stderr)",
+            action = "store_true")
+    parser.add_argument("--profile-output",
+            help = "write the time and memory of each stage as JSON to FILE (implies --profile)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("--cprofile",
+            help = "profile using cProfile, write the statistics (pstats) to FILE and report the calls of output_helper (implies --profile)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("--report",
+            help = "write the diagnostics (problems found in the data) as JSON to FILE",
+            action = "store",
+            metavar = "FILE")
     parser.add_argument("-l", "--log",
             help = "name of logging filename (stdout default)",
             action = "store",
@@ -90,20 +196,89 @@ def main():
     else:
         logging.basicConfig(level = args.loglevel)
 
+    profiler = no_profiler
+    if args.profile or args.profile_output != None or args.cprofile != None:
+        profiler = Profiler(profile = args.cprofile != None)
+
     # Perform checks on arguments
+    if args.diff != None:
+        if args.portal == None:
+            parser.error("A portal filename is required with --diff.")
+        if args.input != None or args.latex != None or args.split or args.lang != None or args.first != None or args.last != None or args.sqlite != None or args.search_index != None or args.snapshot != None or args.shards != None or args.near_duplicates != None or args.watch:
+            parser.error("--diff only writes portal output, it cannot be combined with --input or other output.")
+        if args.deleted == None:
+            args.deleted = args.portal + ".deleted"
+        old = read_input(args.diff[0], profiler)
+        new = read_input(args.diff[1], profiler)
+        with profiler.stage("write diff"):
+            write_delta(args.portal, args.deleted, old, new)
+        profiler.report(args.profile_output, args.cprofile)
+        diagnostics.report(args.report)
+        return
+    if args.deleted != None:
+        parser.error("--deleted requires --diff.")
     if args.input == None:
         print(parser.print_help())
         parser.error("An input filename is required.")
-    if args.latex == None and args.portal == None:
+    if args.latex == None and args.portal == None and args.shards == None and args.sqlite == None and args.search_index == None and args.snapshot == None and args.near_duplicates == None:
         print(parser.print_help())
-        parser.error("At least a LaTeX or portal filename is required.")
+        parser.error("At least a LaTeX, portal, shards, SQLite, search index, snapshot or near duplicates filename is required.")
+
+    if (args.split or args.first != None or args.last != None) and args.latex == None:
+        parser.error("--split, --from and --to require a LaTeX filename.")
+    if args.lang != None and args.latex == None and args.near_duplicates == None:
+        parser.error("--lang requires a LaTeX or near duplicates filename.")
+    langs = None
+    if args.lang != None:
+        langs = [Entry.Lang_type[lang.upper()] for lang in args.lang]
+
+    if args.watch:
+        if is_snapshot(args.input):
+            parser.error("--watch requires a spreadsheet as input.")
+        if args.shards != None or args.sqlite != None or args.search_index != None or args.snapshot != None:
+            parser.error("--watch only supports LaTeX and portal output.")
+        watcher = Watcher(args.input, args.portal, args.latex, args.split, langs, args.first, args.last)
+        watcher.watch(args.interval)
+        diagnostics.report(args.report)
+        return
+
+    if args.shards != None and args.compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            parser.error("zstd compression requires the zstandard package.")
 
     # Handle the data
-    data = read_input(args.input)
+    data = read_input(args.input, profiler)
+    # The LaTeX and portal output are rendered in one pass
+    sinks = []
     if args.latex != None:
-        write_latex(args.latex, data)
+        if args.split:
+            sinks.append(SplitLatexSink(args.latex, langs, args.first, args.last, profiler))
+        else:
+            sinks.append(LatexSink(args.latex, langs, args.first, args.last, profiler))
     if args.portal != None:
-        write_portal(args.portal, data)
+        sinks.append(PortalSink(args.portal, profiler))
+    if sinks:
+        with profiler.stage("render"):
+            render(data, sinks)
+    if args.shards != None:
+        with profiler.stage("write shards"):
+            write_shards(args.shards, data, args.shard_size, args.shard_by, args.compression, args.jobs)
+    if args.sqlite != None:
+        with profiler.stage("write SQLite"):
+            write_sqlite(args.sqlite, data)
+    if args.search_index != None:
+        with profiler.stage("write search index"):
+            write_search_index(args.search_index, data)
+    if args.snapshot != None:
+        with profiler.stage("write snapshot"):
+            data.save(args.snapshot)
+    if args.near_duplicates != None:
+        with profiler.stage("write near duplicates"):
+            write_near_duplicates(args.near_duplicates, data, langs, args.max_distance)
+    profiler.report(args.profile_output, args.cprofile)
+    diagnostics.report(args.report)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""delta.py
+
+This file contains the functions that compare two revisions of the
+dictionary.  Entries are matched across the revisions using a key (the
+N|uu headwords and the IPA), falling back to the contents and the line
+number if a key occurs more than once.  Matched entries are compared
+field by field.  Matching is done using dictionaries, so the
+comparison takes linear time.
+"""
+
+from entry import Entry
+import logging
+
+
+def get_key(entry):
+    """get_key returns the key of the entry that is used to match
+    entries across revisions: the N|uu headwords and the IPA.
+    """
+    ipa = []
+    if Entry.Lang_type.IPA in entry.headwords:
+        ipa = entry.headwords[Entry.Lang_type.IPA]
+    return "; ".join(map(str, entry.headwords[Entry.Lang_type.NUU])) + " [" + "; ".join(map(str, ipa)) + "]"
+
+
+def get_fields(entry):
+    """get_fields returns a dictionary mapping the names of the fields
+    of the entry to their (textual) values.  Fields that are not
+    present are left out.
+    """
+    result = {}
+    for lang in entry.headwords:
+        result[Entry.lang2text(lang)] = "; ".join(map(str, entry.headwords[lang]))
+    for lang in entry.parentheticals:
+        result[Entry.lang2text(lang) + " parentheticals"] = entry.parentheticals[lang]
+    result["POS"] = entry.pos
+    if entry.audio_word:
+        result["Word recording"] = entry.audio_word
+    if entry.audio_sentence:
+        result["Sentence recording"] = entry.audio_sentence
+    return result
+
+
+def get_contents(entry):
+    """get_contents returns a hashable representation of all fields of
+    the entry.
+    """
+    return tuple(sorted(get_fields(entry).items()))
+
+
+def group_entries(data):
+    """group_entries returns a dictionary mapping the key of each entry
+    in data (a Dictionary) to the list of indices of the entries with
+    that key.
+    """
+    result = {}
+    for (index, entry) in enumerate(data.entries):
+        key = get_key(entry)
+        if key in result:
+            result[key].append(index)
+        else: # Set initial value
+            result[key] = [index]
+    return result
+
+
+def match_entries(old, new):
+    """match_entries matches the entries of the Dictionaries old and new.
+    It returns a list of tuples of the index in old (None if the entry
+    is added) and the index in new (None if the entry is removed).
+    Entries with a unique key in both revisions are matched on the
+    key.  Entries that share a key are matched on their contents
+    (unchanged entries), then on the line number and finally in order
+    of occurrence.
+    """
+    result = []
+    old_groups = group_entries(old)
+    new_groups = group_entries(new)
+    for (key, new_indices) in new_groups.items():
+        old_indices = old_groups.get(key, [])
+        if len(old_indices) == 1 and len(new_indices) == 1:
+            result.append((old_indices[0], new_indices[0]))
+            continue
+        # Match unchanged entries first
+        old_contents = {}
+        for i in old_indices:
+            contents = get_contents(old.entries[i])
+            if contents in old_contents:
+                old_contents[contents].append(i)
+            else: # Set initial value
+                old_contents[contents] = [i]
+        matched = set()
+        unmatched = []
+        for j in new_indices:
+            contents = get_contents(new.entries[j])
+            if old_contents.get(contents):
+                i = old_contents[contents].pop(0)
+                matched.add(i)
+                result.append((i, j))
+            else:
+                unmatched.append(j)
+        # Fall back to the line number
+        old_lines = {}
+        for i in old_indices:
+            if i not in matched:
+                old_lines[old.entries[i].line_nr] = i
+        new_indices = unmatched
+        unmatched = []
+        for j in new_indices:
+            line_nr = new.entries[j].line_nr
+            if line_nr in old_lines:
+                result.append((old_lines.pop(line_nr), j))
+            else:
+                unmatched.append(j)
+        left = set(old_lines.values())
+        remaining = [i for i in old_indices if i in left]
+        for (i, j) in zip(remaining, unmatched):
+            result.append((i, j))
+        for j in unmatched[len(remaining):]:
+            result.append((None, j))
+        for i in remaining[len(unmatched):]:
+            result.append((i, None))
+    for (key, old_indices) in old_groups.items():
+        if key not in new_groups:
+            for i in old_indices:
+                result.append((i, None))
+    return result
+
+
+def compare(old, new):
+    """compare compares the Dictionaries old and new.  It returns a
+    tuple of the list of indices (in new) of the added entries, the
+    list of indices (in old) of the removed entries and a list of
+    tuples of the index in old, the index in new and the names of the
+    changed fields for the modified entries.
+    """
+    added = []
+    removed = []
+    modified = []
+    for (i, j) in match_entries(old, new):
+        if i == None:
+            added.append(j)
+        elif j == None:
+            removed.append(i)
+        else:
+            old_fields = get_fields(old.entries[i])
+            new_fields = get_fields(new.entries[j])
+            changed = sorted([name for name in set(old_fields) | set(new_fields) if old_fields.get(name) != new_fields.get(name)])
+            if changed:
+                modified.append((i, j, changed))
+    added.sort()
+    removed.sort()
+    modified.sort(key = lambda x: x[1])
+    logging.info("Added %s, removed %s, modified %s entries", len(added), len(removed), len(modified))
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        for j in added:
+            logging.info("Added line %s: %s", new.entries[j].line_nr, get_key(new.entries[j]))
+        for i in removed:
+            logging.info("Removed line %s: %s", old.entries[i].line_nr, get_key(old.entries[i]))
+        for (i, j, changed) in modified:
+            logging.info("Modified line %s (was %s): %s changed %s", new.entries[j].line_nr, old.entries[i].line_nr, get_key(new.entries[j]), ", ".join(changed))
+    return (added, removed, modified)
+
+
+def write_delta(portal_filename, deleted_filename, old, new):
+    """write_delta compares the Dictionaries old and new and writes the
+    portal records of the added and modified entries to
+    portal_filename and the portal records of the removed entries (as
+    they were in old) to deleted_filename.  Keys (see get_key) are not
+    unique, so the whole record identifies the record to delete.
+    """
+    (added, removed, modified) = compare(old, new)
+    logging.debug("Writing changed portal records to " + portal_filename)
+    output = open(portal_filename, "w")
+    for j in sorted(added + [j for (i, j, changed) in modified]):
+        output.write(new.entries[j].get_portal())
+    output.close()
+    logging.debug("Writing deletion list to " + deleted_filename)
+    output = open(deleted_filename, "w")
+    for i in removed:
+        output.write(old.entries[i].get_portal())
+    output.close()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""diagnostics.py
+
+This file contains the implementation of the Diagnostics class, which
+collects the problems found in the data (for instance duplicate values,
+missing information or recordings that cannot be found) as structured
+records instead of logging a formatted line for each.  A record consists
+of a level, a category, a message (a % format string) with its
+arguments and the line number (if any).  The message is only formatted
+when it is logged or reported.  Identical records are counted instead of
+repeated, and at the end of a run a summary by category (with the line
+numbers) is written and optionally a JSON report.
+"""
+
+import json
+import logging
+import sys
+
+
+report_version = 1
+
+# Maximum number of line numbers (or examples) listed per category in
+# the summary
+summary_items = 20
+
+
+def format_arg(arg):
+    """format_arg returns the text of a message argument: the elements
+    of a list or tuple are joined by commas.
+    """
+    if isinstance(arg, (list, tuple)):
+        return ", ".join(map(str, arg))
+    return str(arg)
+
+
+class Diagnostics:
+    """The Diagnostics class collects records of level (see logging) or
+    higher.  Records below the level are dropped without any work, so
+    calling the methods in a hot path is cheap.  The first occurrence
+    of each record is logged (if logging is enabled for its level),
+    repetitions are only counted.
+    """
+
+    def __init__(self, level = logging.WARNING):
+        self.level = level
+        self.records = {}
+        # The line number of the records that are added without one
+        # (for instance while an entry is rendered)
+        self.line_nr = None
+
+
+    def clear(self):
+        """clear removes all records.
+        """
+        self.records = {}
+
+
+    def remove_lines(self, line_nrs):
+        """remove_lines removes the records of the lines line_nrs (for
+        instance because these lines changed).
+        """
+        line_nrs = set(map(int, line_nrs))
+        self.records = dict([(key, record) for (key, record) in self.records.items() if record["line"] not in line_nrs])
+
+
+    def add(self, level, category, message, *args, line_nr = None):
+        """add records message (a % format string) with args in category
+        at level.  line_nr is the line number of the spreadsheet the
+        record refers to (self.line_nr if not given, None if unknown).
+        Line numbers are stored as ints.
+        """
+        if level < self.level:
+            return
+        if line_nr == None:
+            line_nr = self.line_nr
+        if line_nr != None:
+            line_nr = int(line_nr)
+        key = (category, line_nr, message, args)
+        record = self.records.get(key)
+        if record != None:
+            record["count"] += 1
+            return
+        self.records[key] = {"level" : level, "category" : category, "line" : line_nr, "message" : message, "args" : args, "count" : 1}
+        if logging.getLogger().isEnabledFor(level):
+            logging.log(level, self.render(self.records[key]))
+
+
+    def warning(self, category, message, *args, line_nr = None):
+        """warning records a warning (see add).
+        """
+        self.add(logging.WARNING, category, message, *args, line_nr = line_nr)
+
+
+    def error(self, category, message, *args, line_nr = None):
+        """error records an error (see add).
+        """
+        self.add(logging.ERROR, category, message, *args, line_nr = line_nr)
+
+
+    def render(self, record):
+        """render returns the formatted message of record.
+        """
+        return record["message"] % tuple(map(format_arg, record["args"]))
+
+
+    def get_categories(self):
+        """get_categories returns a dictionary mapping each category to
+        its (highest) level name, the number of records (including
+        repetitions), the number of distinct records and the sorted line
+        numbers.
+        """
+        result = {}
+        for record in self.records.values():
+            if record["category"] not in result: # Set initial value
+                result[record["category"]] = {"level" : record["level"], "count" : 0, "distinct" : 0, "lines" : set()}
+            category = result[record["category"]]
+            category["level"] = max(category["level"], record["level"])
+            category["count"] += record["count"]
+            category["distinct"] += 1
+            if record["line"] != None:
+                category["lines"].add(record["line"])
+        for category in result.values():
+            category["level"] = logging.getLevelName(category["level"])
+            category["lines"] = sorted(category["lines"])
+        return result
+
+
+    def write_summary(self, output = sys.stderr):
+        """write_summary writes the number of records of each category
+        to output, with (at most summary_items of) the line numbers or,
+        if the records have no line numbers, examples.
+        """
+        if not self.records:
+            return
+        output.write("%-8s %-32s %8s %8s\n" % ("level", "category", "count", "distinct"))
+        for (name, category) in sorted(self.get_categories().items()):
+            output.write("%-8s %-32s %8d %8d\n" % (category["level"], name, category["count"], category["distinct"]))
+            if category["lines"]:
+                items = category["lines"]
+                output.write("    lines: ")
+            else:
+                items = [self.render(record) for record in self.records.values() if record["category"] == name]
+                output.write("    e.g.: ")
+            output.write(", ".join(map(str, items[:summary_items])) + (", ..." if len(items) > summary_items else "") + "\n")
+
+
+    def write_json(self, filename):
+        """write_json writes the categories (see get_categories) and all
+        records (with their formatted messages) as JSON to filename.
+        """
+        logging.debug("Writing diagnostics report to %s", filename)
+        output = open(filename, "w")
+        json.dump({
+                "version" : report_version,
+                "categories" : self.get_categories(),
+                "records" : [{
+                        "level" : logging.getLevelName(record["level"]),
+                        "category" : record["category"],
+                        "line" : record["line"],
+                        "message" : self.render(record),
+                        "count" : record["count"],
+                        } for record in self.records.values()],
+                }, output, indent = 1, ensure_ascii = False)
+        output.close()
+
+
+    def report(self, json_filename = None):
+        """report writes the summary to stderr and the JSON report to
+        json_filename (if given).
+        """
+        self.write_summary()
+        if json_filename != None:
+            self.write_json(json_filename)
+
+
+# The diagnostics of the current run
+diagnostics = Diagnostics()
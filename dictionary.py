@@ -1,14 +1,21 @@
 #!/usr/bin/env python3
 """dictionary.py
 
-This file contains the implementation of the Dictionary class.
+This file contains the implementation of the Dictionary class.  The
+Dictionary can also be used as a library, streaming the output to any
+file-like object (anything with a write method), for instance:
+
+    data = Dictionary.from_ods("master.ods")
+    render_portal(data.iter_entries(), sys.stdout)
+    data.render_latex(Entry.Lang_type.NAMA, output)
 """
 
+from diagnostics import diagnostics
 from entry import Entry
 from headword import Headword
 from output_helper import is_above
-import logging
 import re
+from typing import Iterable, Iterator, Mapping, Optional, TextIO, Tuple
 
 
 
@@ -54,9 +61,9 @@ def parse(text):
     return result
 
 
-def get_latex_header():
-    """get_latex_header returns a string with a LaTeX header for the
-    dictionary.
+def get_latex_preamble():
+    """get_latex_preamble returns a string with the LaTeX preamble (the
+    part of the header before the document starts) for the dictionary.
     """
     return """\\documentclass[10pt]{extarticle}
 \\usepackage{array}
@@ -100,7 +107,14 @@ def get_latex_header():
 \\urlstyle{rm}
 \\newcommand{\\nocontentsline}[3]{}
 \\newcommand{\\tocless}[2]{\\bgroup\\let\\addcontentsline=\\nocontentsline#1{#2}\\egroup}
-\\begin{document}
+"""
+
+
+def get_latex_header():
+    """get_latex_header returns a string with a LaTeX header for the
+    dictionary.
+    """
+    return get_latex_preamble() + """\\begin{document}
 \\include{intro}
 \\begin{multicols}{2}
 """
@@ -115,6 +129,43 @@ def get_latex_footer():
 """
 
 
+# The languages (sections) of the LaTeX output in order.
+latex_langs = [Entry.Lang_type.NUU, Entry.Lang_type.NAMA, Entry.Lang_type.AFRIKAANS, Entry.Lang_type.ENGLISH]
+
+
+def get_lang_latex_header(lang):
+    """get_lang_latex_header returns a string with the LaTeX heading of
+    the section of language lang.
+    """
+    result = "{\\hfill\\\\\\Large\\textbf{" + Entry.lang2latex_long(lang) + "}}\\\\\n"
+    result += "\\phantomsection%\n"
+    result += "\\addcontentsline{toc}{section}{" + Entry.lang2latex_long(lang) + "}%\n"
+    result += "\\renewcommand*\\nowtitle{" + Entry.lang2latex_long(lang) + " }%\n"
+    return result
+
+
+def get_lang_latex_footer(lang):
+    """get_lang_latex_footer returns a string with the LaTeX code that
+    ends the section of language lang.
+    """
+    return "\\newpage\n"
+
+
+def iter_portal(entries: Iterable[Entry]) -> Iterator[str]:
+    """iter_portal yields the portal records of entries.
+    """
+    for entry in entries:
+        yield entry.get_portal()
+
+
+def render_portal(entries: Iterable[Entry], sink: TextIO) -> None:
+    """render_portal writes the portal records of entries (for instance
+    Dictionary.iter_entries) to sink, one at a time.
+    """
+    for record in iter_portal(entries):
+        sink.write(record)
+
+
 def skip_sort_words(word, i):
 	l = len(word)
 	if i + 7 < l and word[i:i + 7] == "iemand ": #
@@ -155,6 +206,8 @@ sort_out = "aaeeeiioouu"
 sort_out += chr(ord("z")+1) + chr(ord("z")+2) + chr(ord("z")+3)
 sort_out += chr(ord("z")+4) + chr(ord("z")+4)
 sort_out += chr(ord("z")+5)
+# The translation table of sort_in to sort_out (see clean_sort)
+sort_table = str.maketrans(sort_in, sort_out)
 
 
 def clean_sort(element):
@@ -171,8 +224,7 @@ def clean_sort(element):
         (i_word, skipped) = skip_sort_words(clean_element, i_word)
     clean_element = clean_element[i_word:]
     # clean letters
-    trans_map = clean_element.maketrans(sort_in, sort_out)
-    clean_element = clean_element.translate(trans_map)
+    clean_element = clean_element.translate(sort_table)
     result = ""
     for i in clean_element:
         if not is_above(ord(i)):
@@ -205,6 +257,29 @@ def entry_sort(entry, element, lang):
 
 
 
+class EntryLines:
+    """The EntryLines class is a diagnostics argument that is formatted
+    as the line numbers of the entries (indices) of entries.  The line
+    numbers are only looked up when the record is formatted.
+    """
+
+    def __init__(self, entries, indices):
+        self.entries = entries
+        self.indices = tuple(indices)
+
+
+    def __eq__(self, other):
+        return isinstance(other, EntryLines) and self.indices == other.indices
+
+
+    def __hash__(self):
+        return hash(self.indices)
+
+
+    def __str__(self):
+        return ", ".join([str(self.entries[index].line_nr) for index in self.indices])
+
+
 class Dictionary:
     """The Dictionary class stores all information for the dictionary.  It
     checks whether all the required information is present.
@@ -236,10 +311,7 @@ class Dictionary:
         if element != None:
             # Add entry to lang_map
             if element in self.lang_map[lang]:
-                lines = []
-                for el in self.lang_map[lang][element]:
-                    lines.append(self.entries[el].line_nr)
-                logging.warning("Duplicate value on line " + str(line_nr) + " " + Entry.lang2text(lang) + ": " + str(element) + " also found on line(s) " + ", ".join(lines))
+                diagnostics.warning("duplicate value", "Duplicate value on line %s %s: %s also found on line(s) %s", line_nr, Entry.lang2text(lang), element, EntryLines(self.entries, self.lang_map[lang][element]), line_nr = line_nr)
                 self.lang_map[lang][element].append(index)
             else: # Set initial value
                 self.lang_map[lang][element] = [index]
@@ -251,10 +323,11 @@ class Dictionary:
                 self.sort_map[lang][sort_element] = [(index, element)]
 
 
-    def insert(self, n_uu, pos, ipa, nama, afrikaans, afr_loc, english, par_nama, par_afrikaans, par_english, audio_word, audio_sentence, line_nr):
+    def insert(self, n_uu, pos, ipa, nama, afrikaans, afr_loc, english, par_nama, par_afrikaans, par_english, audio_word, audio_sentence, line_nr, index = None):
         """Create and add the entry to the entries list. Len(self.entries)
         provides the index of the new entry.  Parse the language
-        and IPA fields.
+        and IPA fields.  If index is given, the entry replaces the
+        entry at index instead (see replace_line).
         """
         # Create headwords
         hws = {}
@@ -279,10 +352,15 @@ class Dictionary:
 
         if not pos:  
             pos = ""
-            logging.warning("Missing POS on line " + str(line_nr))
+            diagnostics.warning("missing POS", "Missing POS on line %s", line_nr, line_nr = line_nr)
         # Add information to entries
-        self.entries.append(Entry(hws, pos, parentheticals, audio_word, audio_sentence, line_nr))
-        new_index = len(self.entries) - 1 # Get index which is length - 1
+        entry = Entry(hws, pos, parentheticals, audio_word, audio_sentence, line_nr)
+        if index == None:
+            self.entries.append(entry)
+            new_index = len(self.entries) - 1 # Get index which is length - 1
+        else:
+            self.entries[index] = entry
+            new_index = index
 
         # Insert information in self.lang_map
         for lang in hws:
@@ -290,10 +368,11 @@ class Dictionary:
                 self.check_add_map(hw, lang, new_index, line_nr)
 
 
-    def insert_line(self, line, line_nr):
+    def insert_line(self, line, line_nr, index = None):
         """Insert_line adds a line from the spreadsheet into the dictionary
         (self). It parses the Orthography 1 and IPA fields as there may be
-        eastern or western variants in there.
+        eastern or western variants in there.  If index is given, the
+        entry at index is replaced (see replace_line).
         """
         # Convert to string (if needed) and remove any whitespace at beginning
         # or end.
@@ -310,7 +389,68 @@ class Dictionary:
         audio_word = convert_to_string(line["Dictionary Recording (target word only)"])
         audio_sentence = convert_to_string(line["Recordings (target word in sentence)"])
 
-        self.insert(n_uu, pos, ipa, nama, afrikaans, afr_loc, english, par_nama, par_afrikaans, par_english, audio_word, audio_sentence, line_nr)
+        self.insert(n_uu, pos, ipa, nama, afrikaans, afr_loc, english, par_nama, par_afrikaans, par_english, audio_word, audio_sentence, line_nr, index)
+
+
+    def insert_rows(self, spreadsheet):
+        """insert_rows adds the lines of spreadsheet (a pandas DataFrame
+        as read by read_ods) to the dictionary (see insert_line).  Lines
+        without N|uu information are skipped.
+        """
+        for index, row in spreadsheet.iterrows():
+            try:
+                self.insert_line(row, index + 2) # 2 is header and offset
+            except ValueError:
+                diagnostics.error("missing N|uu", "Missing N|uu information on line %s", index + 2, line_nr = index + 2)
+
+
+    @classmethod
+    def from_ods(cls, filename: str, columns: Optional[Mapping[str, str]] = None) -> "Dictionary":
+        """from_ods returns a Dictionary with the lines of the ods
+        spreadsheet filename.  columns maps the names of the columns
+        that are used (see insert_line) to their names in the
+        spreadsheet, if these differ.  Note that the spreadsheet is
+        read as a whole.
+        """
+        # pandas_ods_reader is imported here as importing pandas is slow
+        from pandas_ods_reader import read_ods
+        spreadsheet = read_ods(filename, 1)
+        if columns:
+            spreadsheet = spreadsheet.rename(columns = dict([(name, column) for (column, name) in columns.items()]))
+        data = cls()
+        data.insert_rows(spreadsheet)
+        return data
+
+
+    def remove_maps(self, index):
+        """remove_maps removes the headwords of the entry at index from
+        the lang_map and sort_map.
+        """
+        entry = self.entries[index]
+        for lang in entry.headwords:
+            for hw in entry.headwords[lang]:
+                if hw in self.lang_map[lang]:
+                    indices = [i for i in self.lang_map[lang][hw] if i != index]
+                    if indices:
+                        self.lang_map[lang][hw] = indices
+                    else:
+                        del self.lang_map[lang][hw]
+                sort_element = clean_sort(hw)
+                if sort_element in self.sort_map[lang]:
+                    values = [value for value in self.sort_map[lang][sort_element] if value[0] != index]
+                    if values:
+                        self.sort_map[lang][sort_element] = values
+                    else:
+                        del self.sort_map[lang][sort_element]
+
+
+    def replace_line(self, index, line, line_nr):
+        """replace_line replaces the entry at index by a line from the
+        spreadsheet (see insert_line), updating the mappings in place.
+        The other entries keep their index.
+        """
+        self.remove_maps(index)
+        self.insert_line(line, line_nr, index)
 
 
     def __str__(self):
@@ -323,46 +463,99 @@ class Dictionary:
         return result
 
 
+    def save(self, filename):
+        """save writes a binary snapshot of the dictionary to filename,
+        which can be loaded quickly using snapshot.Snapshot.
+        """
+        # snapshot is imported here as it builds on this module
+        from snapshot import write_snapshot
+        write_snapshot(filename, self)
+
+
     def get_portal(self):
         """get_portal returns a string of the dictionary information
         in the format that can be used for the dictionary portal.
         """
-        result = ""
-        for i in self.entries:
-            result += i.get_portal()
-        return result
+        return "".join(iter_portal(self.entries))
 
 
-    def get_lang_latex(self, lang):
-        """get_lang_latex returns a string with the LaTeX lemmas
-        sorted according to mapping.
+    def iter_entries(self) -> Iterator[Entry]:
+        """iter_entries iterates over the entries in the order of the
+        spreadsheet.
+        """
+        yield from self.entries
+
+
+    def iter_sorted(self, lang: Entry.Lang_type) -> Iterator[Tuple[int, Headword]]:
+        """iter_sorted iterates over the headwords of language lang in
+        dictionary order.  It yields tuples of the index of the entry
+        (in entries) and the headword.
         """
-        result = "{\\hfill\\\\\\Large\\textbf{" + Entry.lang2latex_long(lang) + "}}\\\\\n"
-        result += "\\phantomsection%\n"
-        result += "\\addcontentsline{toc}{section}{" + Entry.lang2latex_long(lang) + "}%\n"
-        result += "\\renewcommand*\\nowtitle{" + Entry.lang2latex_long(lang) + " }%\n"
         for element in sorted(self.sort_map[lang]):
             for values in sorted(self.sort_map[lang][element], key = lambda x: entry_sort(self.entries[x[0]], x[1], lang)):
-                index = values[0] # index in entries
-                word = values[1] # actual, original word
-                result += self.entries[index].get_latex(word, lang)
-        result += "\\newpage\n"
-        return result
+                yield values # index in entries, actual (original) word
+
+
+    def iter_range(self, lang, first = None, last = None):
+        """iter_range iterates over the headwords of language lang in
+        dictionary order (see iter_sorted) of which the sort key (see
+        clean_sort) is not before that of first and not after that of
+        last.  last is used as a prefix, so a last of "a" includes
+        "az".  If first or last is None, the range is open on that
+        side.
+        """
+        if first == None and last == None:
+            yield from self.iter_sorted(lang)
+            return
+        first_key = None if first == None else clean_sort(first)
+        last_key = None if last == None else clean_sort(last)
+        for (index, word) in self.iter_sorted(lang):
+            key = clean_sort(word)
+            if first_key != None and key < first_key:
+                continue
+            if last_key != None and key[:len(last_key)] > last_key:
+                break
+            yield (index, word)
+
+
+    def get_lang_latex(self, lang, first = None, last = None):
+        """get_lang_latex returns a string with the LaTeX lemmas
+        sorted according to mapping.  Only the headwords in the range
+        from first to last are included (see iter_range).
+        """
+        return "".join(self.iter_lang_latex(lang, first, last))
+
+
+    def iter_lang_latex(self, lang: Entry.Lang_type, first: Optional[str] = None, last: Optional[str] = None) -> Iterator[str]:
+        """iter_lang_latex yields the LaTeX of the section of language
+        lang: the header, the lemmas in dictionary order (only the
+        headwords in the range from first to last, see iter_range) and
+        the footer.
+        """
+        yield get_lang_latex_header(lang)
+        for (index, word) in self.iter_range(lang, first, last):
+            yield self.entries[index].get_latex(word, lang)
+        yield get_lang_latex_footer(lang)
+
+
+    def render_latex(self, lang: Entry.Lang_type, sink: TextIO, first: Optional[str] = None, last: Optional[str] = None) -> None:
+        """render_latex writes the LaTeX of the section of language lang
+        (see iter_lang_latex) to sink, one lemma at a time.
+        """
+        for text in self.iter_lang_latex(lang, first, last):
+            sink.write(text)
 
 
-    def get_latex(self):
+    def get_latex(self, langs = None, first = None, last = None):
         """get_latex returns a string containing the dictionary
-        information.
+        information.  If langs is given, only the sections of the
+        languages in langs are included and only the headwords in the
+        range from first to last (see iter_range).
         """
         result = get_latex_header()
-        ### N|uu
-        result += self.get_lang_latex(Entry.Lang_type.NUU)
-        ### Nama
-        result += self.get_lang_latex(Entry.Lang_type.NAMA)
-        ### Afrikaans
-        result += self.get_lang_latex(Entry.Lang_type.AFRIKAANS)
-        ### English
-        result += self.get_lang_latex(Entry.Lang_type.ENGLISH)
+        for lang in latex_langs:
+            if langs == None or lang in langs:
+                result += self.get_lang_latex(lang, first, last)
         result += get_latex_footer()
         return result
 
@@ -5,10 +5,11 @@ This file contains the implementation of the Entry class, which
 represents an entry in the dictionary (spreadsheet).
 """
 
+from diagnostics import diagnostics
 from enum import Enum
 from headword import Headword
-import logging
-from output_helper import clean_portal, clean_portal_text, clean_latex_text, clean_latex_ipa, latex_cut
+from output_helper import clean_portal, clean_latex_text, clean_latex_ipa, latex_cut
+from portal_template import Field, PortalTemplate
 import re
 
 
@@ -165,110 +166,32 @@ class Entry:
         return result
 
 
-    def get_portal(self):
-        """get_portal returns a string of the entry to fp so the
-        information can be incorporated in the dictionary portal.
+    def get_sounds(self):
+        """get_sounds returns the list of names of the word recordings
+        (without extension) as they are referenced in the portal
+        output.
         """
-        result = "**\n"
-        result += "<Project>N|uu dictionary\n"
-        # Fields should be ordered as follows:
-        #<N|uu>						N|uu
-        #<Synonym>					N|uu synonyms
-        #<IPA>						IPA
-        #<IPA>						IPA synonyms (field is also IPA)
-        #<Part of speech>				Part of speech
-        #<Afr loc>					Afr loc
-        #<Afr loc>					Afr loc synonyms (field is also Afr loc)
-        #<Additional Nama information>			Additional Nama information
-        #<Additional Afrikaans information>		Additional Afrikaans information
-        #<Additional English information>		Additional English information
-        #<Sound>					Sound
-        #<Nama>					Nama
-        #<Synonym> 					Nama synonyms 
-        #<Afrikaans>					Afrikaans
-        #<Synonym> 					Afrikaans synonyms 
-        #<English>					English
-        #<Synonym> 					English synonyms 
-        #<Hidden>					Hidden field
-        #<Synonym>					Hidden extra field, if more than one hidden field is required
-
-        # N|uu
-        result += "<N|uu>"
-        result += "\n<Synonym>".join(map(clean_portal_text, self.headwords[Entry.Lang_type.NUU]))
-        result += "\n"
-        # IPA
-        result += "<IPA>"
-        result += "\n<IPA>".join(map(clean_portal, self.headwords[Entry.Lang_type.IPA]))
-        result += "\n"
-        # POS
-        result += "<Part of speech>" + Entry.pos2text(self.pos) + "\n"
-        # AFR LOC
-        if Entry.Lang_type.AFR_LOC in self.headwords:
-            result += "<Afr loc>"
-            result += "\n<Afr loc>".join(map(clean_portal_text, self.headwords[Entry.Lang_type.AFR_LOC]))
-            result += "\n"
-        # Nama parentheticals
-        if Entry.Lang_type.NAMA in self.parentheticals:
-            result += "<Additional Nama information>"
-            result += clean_portal_text(self.parentheticals[Entry.Lang_type.NAMA])
-            result += "\n"
-        # Afrikaans parentheticals
-        if Entry.Lang_type.AFRIKAANS in self.parentheticals:
-            result += "<Additional Afrikaans information>"
-            result += clean_portal_text(self.parentheticals[Entry.Lang_type.AFRIKAANS])
-            result += "\n"
-        # English parentheticals
-        if Entry.Lang_type.ENGLISH in self.parentheticals:
-            result += "<Additional English information>"
-            result += clean_portal_text(self.parentheticals[Entry.Lang_type.ENGLISH])
-            result += "\n"
-        # Sound
+        result = []
         if self.audio_word:
             for f in re.split(" *[,;] *", self.audio_word):
                 if f != "--" and f != "":
-                    result += "<Sound>" + f + ".wav\n"
-        # Nama
-        result += "<Nama>"
-        result += "\n<Synonym>".join(map(clean_portal_text, self.headwords[Entry.Lang_type.NAMA]))
-        result += "\n"
-        # Afrikaans
-        result += "<Afrikaans>"
-        result += "\n<Synonym>".join(map(clean_portal_text, self.headwords[Entry.Lang_type.AFRIKAANS]))
-        result += "\n"
-        # English
-        result += "<English>"
-        result += "\n<Synonym>".join(map(clean_portal_text, self.headwords[Entry.Lang_type.ENGLISH]))
-        result += "\n"
-        # HIDDEN
-        hidden_words = Entry.get_hidden(self, Entry.Lang_type.NUU)
-        if len(hidden_words) != 0:
-            result += "<Hidden N|uu>"
-            result += "\n<Synonym>".join(map(clean_portal_text, hidden_words))
-            result += "\n"
-        hidden_words = Entry.get_hidden(self, Entry.Lang_type.NAMA)
-        if len(hidden_words) != 0:
-            result += "<Hidden Nama>"
-            result += "\n<Synonym>".join(map(clean_portal_text, hidden_words))
-            result += "\n"
-        hidden_words = Entry.get_hidden(self, Entry.Lang_type.AFRIKAANS)
-        if len(hidden_words) != 0:
-            result += "<Hidden Afrikaans>"
-            result += "\n<Synonym>".join(map(clean_portal_text, hidden_words))
-            result += "\n"
-        hidden_words = Entry.get_hidden(self, Entry.Lang_type.AFR_LOC)
-        if len(hidden_words) != 0:
-            result += "<Hidden Afr loc>"
-            result += "\n<Synonym>".join(map(clean_portal_text, hidden_words))
-            result += "\n"
-        hidden_words = Entry.get_hidden(self, Entry.Lang_type.ENGLISH)
-        if len(hidden_words) != 0:
-            result += "<Hidden English>"
-            result += "\n<Synonym>".join(map(clean_portal_text, hidden_words))
-            result += "\n"
-        result += "**\n"
+                    result.append(f)
         return result
 
 
+    def get_portal(self):
+        """get_portal returns a string of the entry to fp so the
+        information can be incorporated in the dictionary portal.  The
+        layout of the record is given by portal_layout.  The
+        diagnostics of the cleaners refer to the line of the entry.
+        """
+        diagnostics.line_nr = self.line_nr
+        try:
+            return entry_portal_template.render(self)
+        finally:
+            diagnostics.line_nr = None
+
+
     def get_latex(self, headword, lang):
         """get_latex returns a string of the information of the entry 
         in LaTeX format.  The lemma will be based on the headword
@@ -311,7 +234,7 @@ class Entry:
                 try:
                     ipa_ordered.insert(0, ipa_ordered.pop(index))
                 except IndexError:
-                    logging.error("Different number of N|uu and IPA entries on line " + str(self.line_nr))
+                    diagnostics.error("IPA mismatch", "Different number of N|uu and IPA entries on line %s", self.line_nr, line_nr = self.line_nr)
                 result += "[\\textipa{"
                 result += ", ".join(map(clean_latex_ipa, map(str, ipa_ordered)))
                 result += "}]"
@@ -337,3 +260,26 @@ class Entry:
         result += "}"
         result += "\n\n"
         return result
+
+
+# The fields of the portal record in the order of the portal.  Note that
+# the IPA and Afr loc synonyms use the same tag as the first value.
+portal_layout = [
+        Field("N|uu", "headwords", Entry.Lang_type.NUU, repeat = "Synonym"),
+        Field("IPA", "headwords", Entry.Lang_type.IPA, cleaner = clean_portal),
+        Field("Part of speech", "pos", cleaner = Entry.pos2text),
+        Field("Afr loc", "headwords", Entry.Lang_type.AFR_LOC, optional = True),
+        Field("Additional Nama information", "parentheticals", Entry.Lang_type.NAMA, optional = True),
+        Field("Additional Afrikaans information", "parentheticals", Entry.Lang_type.AFRIKAANS, optional = True),
+        Field("Additional English information", "parentheticals", Entry.Lang_type.ENGLISH, optional = True),
+        Field("Sound", "sounds", cleaner = lambda f: f + ".wav"),
+        Field("Nama", "headwords", Entry.Lang_type.NAMA, repeat = "Synonym"),
+        Field("Afrikaans", "headwords", Entry.Lang_type.AFRIKAANS, repeat = "Synonym"),
+        Field("English", "headwords", Entry.Lang_type.ENGLISH, repeat = "Synonym"),
+        Field("Hidden N|uu", "hidden", Entry.Lang_type.NUU, repeat = "Synonym"),
+        Field("Hidden Nama", "hidden", Entry.Lang_type.NAMA, repeat = "Synonym"),
+        Field("Hidden Afrikaans", "hidden", Entry.Lang_type.AFRIKAANS, repeat = "Synonym"),
+        Field("Hidden Afr loc", "hidden", Entry.Lang_type.AFR_LOC, repeat = "Synonym"),
+        Field("Hidden English", "hidden", Entry.Lang_type.ENGLISH, repeat = "Synonym"),
+        ]
+entry_portal_template = PortalTemplate(portal_layout, "N|uu dictionary")
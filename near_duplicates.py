@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""near_duplicates.py
+
+This file contains the functions that find headwords that are (nearly)
+the same, for instance because they only differ in accents, the
+variant of a click symbol (! versus ǃ), spacing or a typing error.  The
+headwords are normalised using clean_sort (without spaces).  Headwords
+with the same normalised text are grouped.  Headwords with normalised
+texts that differ by at most max_distance edits (Levenshtein distance)
+are reported as a representative with the headwords similar to it, as
+chaining similar headwords would join unrelated words.  Short words
+often differ by a single letter, so edits are only allowed for
+headwords of at least min_length characters (not counting qualifiers
+in parentheses, such as "(Eastern)").  Comparing all pairs would take
+quadratic time, so the candidate pairs are found using an index of the
+variants of each text with up to max_distance characters deleted:
+texts within max_distance edits have a variant in common (deleting the
+characters that were inserted in the one text and in the other).  The
+candidates are checked using the (bounded) edit distance.
+"""
+
+from diagnostics import diagnostics
+from dictionary import clean_sort, latex_langs
+from entry import Entry
+import logging
+import re
+
+
+# Maximum number of similar headwords listed per group
+max_group = 20
+
+
+def normalise(word):
+    """normalise returns the normalised text of word: the sort key (see
+    clean_sort) without spaces.
+    """
+    return "".join(clean_sort(word).split())
+
+
+def get_length(key):
+    """get_length returns the length of key (see normalise) without the
+    qualifiers in parentheses.
+    """
+    return len(re.sub("\\([^)]*\\)", "", key))
+
+
+def get_deletions(text, count):
+    """get_deletions returns the set of texts that result from deleting
+    at most count characters of text (including text itself).
+    """
+    result = set([text])
+    current = result
+    for i in range(count):
+        current = set([t[:j] + t[j + 1:] for t in current for j in range(len(t))])
+        result |= current
+    return result
+
+
+def get_distance(a, b, bound):
+    """get_distance returns the edit (Levenshtein) distance between a and
+    b if it is at most bound, and bound + 1 otherwise.
+    """
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+        if min(current) > bound:
+            return bound + 1
+        previous = current
+    return min(previous[-1], bound + 1)
+
+
+def get_texts(data, lang):
+    """get_texts returns a dictionary mapping each normalised text (see
+    normalise) of the headwords of language lang in data (a Dictionary)
+    to a dictionary mapping the different headwords (texts) to the list
+    of line numbers they occur on.
+    """
+    result = {}
+    for entry in data.entries:
+        for word in entry.headwords.get(lang, []):
+            key = normalise(word)
+            if not key:
+                continue
+            if key not in result: # Set initial value
+                result[key] = {}
+            if str(word) in result[key]:
+                result[key][str(word)].append(entry.line_nr)
+            else: # Set initial value
+                result[key][str(word)] = [entry.line_nr]
+    return result
+
+
+def find_pairs(keys, max_distance, min_length):
+    """find_pairs returns a dictionary mapping the index of each text of
+    keys (normalised texts) to the set of indices of the other texts
+    within max_distance edits.  Only texts of at least min_length
+    characters (see get_length) are compared.
+    """
+    result = {}
+    index = {}
+    comparisons = 0
+    for (i, key) in enumerate(keys):
+        if get_length(key) < min_length:
+            continue
+        deletions = get_deletions(key, max_distance)
+        candidates = set()
+        for deletion in deletions:
+            candidates.update(index.get(deletion, []))
+        for j in candidates:
+            comparisons += 1
+            if get_distance(key, keys[j], max_distance) <= max_distance:
+                result.setdefault(i, set()).add(j)
+                result.setdefault(j, set()).add(i)
+        for deletion in deletions:
+            if deletion in index:
+                index[deletion].append(i)
+            else: # Set initial value
+                index[deletion] = [i]
+    logging.debug("Compared %d pairs of %d texts", comparisons, len(keys))
+    return result
+
+
+def find_near_duplicates(data, lang, max_distance = 1, min_length = 5):
+    """find_near_duplicates returns a tuple of the groups of headwords of
+    language lang in data (a Dictionary) with the same normalised text
+    (see normalise) and the groups of similar headwords: headwords of
+    at least min_length characters (see get_length) whose normalised
+    texts differ by at most max_distance edits.  Similarity is not
+    transitive, so similar headwords are not chained: each group of
+    similar headwords is a representative (the text with the most
+    similar texts that is not yet covered) and all texts within
+    max_distance edits of it.  A headword is a list of tuples of its
+    texts and the line numbers they occur on.  The groups of the same
+    headwords are lists of tuples of a text and its line numbers (with
+    at least two different texts), the groups of similar headwords are
+    tuples of the representative and the list of the other headwords.
+    """
+    texts = get_texts(data, lang)
+    keys = sorted(texts)
+    same = sorted([sorted(texts[key].items()) for key in keys if len(texts[key]) > 1])
+    similar = []
+    if max_distance > 0:
+        pairs = find_pairs(keys, max_distance, min_length)
+        covered = set()
+        for i in sorted(pairs, key = lambda i: (-len(pairs[i]), keys[i])):
+            if i in covered and pairs[i] <= covered:
+                continue
+            covered.add(i)
+            covered.update(pairs[i])
+            similar.append((sorted(texts[keys[i]].items()), [sorted(texts[keys[j]].items()) for j in sorted(pairs[i], key = lambda j: keys[j])]))
+        similar.sort()
+    return (same, similar)
+
+
+def format_words(words):
+    """format_words returns the text of words (a list of tuples of a
+    headword and its line numbers).
+    """
+    return "; ".join([word + " (line " + ", ".join(lines) + ")" for (word, lines) in words])
+
+
+def write_near_duplicates(filename, data, langs = None, max_distance = 1, min_length = 5, max_group = max_group):
+    """write_near_duplicates writes the groups of the same and of similar
+    headwords (see find_near_duplicates) of each language of langs (all
+    LaTeX languages if None) in data to filename.  Each group is written
+    on a line, listing the headwords and their line numbers.  Groups
+    of more than max_group similar headwords are cut short (with a
+    warning), they mostly consist of short words that happen to be
+    similar.
+    """
+    logging.debug("Writing near duplicates to %s", filename)
+    output = open(filename, "w")
+    for lang in latex_langs:
+        if langs != None and lang not in langs:
+            continue
+        (same, similar) = find_near_duplicates(data, lang, max_distance, min_length)
+        logging.info("Found %d groups of the same and %d groups of similar %s headwords", len(same), len(similar), Entry.lang2text(lang))
+        output.write(Entry.lang2text(lang) + ", the same (" + str(len(same)) + " groups)\n")
+        for group in same:
+            output.write("  " + format_words(group) + "\n")
+        output.write(Entry.lang2text(lang) + ", similar (" + str(len(similar)) + " groups)\n")
+        for (representative, others) in similar:
+            if len(others) > max_group:
+                diagnostics.warning("near duplicates", "%s %s headwords are similar to %s, only %s are listed", len(others), Entry.lang2text(lang), representative[0][0], max_group)
+                output.write("  " + format_words(representative) + ": " + "; ".join([format_words(other) for other in others[:max_group]]) + "; ... (" + str(len(others) - max_group) + " more)\n")
+            else:
+                output.write("  " + format_words(representative) + ": " + "; ".join([format_words(other) for other in others]) + "\n")
+        output.write("\n")
+    output.close()
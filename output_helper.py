@@ -5,7 +5,7 @@ This file contains helper functions to convert dictionary information to
 output. Currently, LaTeX and dicionary app output is provided.
 """
 
-import logging
+from diagnostics import diagnostics
 
 
 ipa_latex_mapping = {
@@ -507,7 +507,7 @@ def clean_portal_text(text):
             elif output[i] == "n":
                 new_output += chr(505)
             else:
-                logging.warning("Found ` combining character which is not handled properly.")
+                diagnostics.warning("combining character", "Found ` combining character which is not handled properly (on %s).", output[i])
             i += 1
         elif i + 1 < len(output) and ord(output[i + 1]) == 770: # ^
             if output[i] == "a":
@@ -523,20 +523,19 @@ def clean_portal_text(text):
             elif output[i] == "u":
                 new_output += chr(251)
             else:
-                print(output[i])
-                logging.warning("Found ^ combining character which is not handled properly.")
+                diagnostics.warning("combining character", "Found ^ combining character which is not handled properly (on %s).", output[i])
             i += 1
         elif i + 1 < len(output) and ord(output[i + 1]) == 771: # ^
             if output[i] == "o":
                 new_output += chr(245)
             else:
-                logging.warning("Found ~ combining character which is not handled properly.")
+                diagnostics.warning("combining character", "Found ~ combining character which is not handled properly (on %s).", output[i])
             i += 1
         elif i + 1 < len(output) and ord(output[i + 1]) == 783: # ȅ
             if output[i] == "e":
                 new_output += chr(517)
             else:
-                logging.warning("Found ◌̏  combining character which is not handled properly.")
+                diagnostics.warning("combining character", "Found ◌̏  combining character which is not handled properly (on %s).", output[i])
             i += 1
         else:
             new_output += output[i]
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""portal_template.py
+
+This file contains the implementation of portal record templates.  The
+layout of a portal record is described as a list of Fields (in output
+order), each naming its tag, the source of its values, the language,
+the cleaner that is applied to each value and the tag that is repeated
+before every further value.  A PortalTemplate compiles the layout once
+into a list of steps, so rendering a record only collects the parts and
+joins them at the end.  Other portal projects can reuse it with a
+different layout.
+"""
+
+from output_helper import clean_portal_text
+
+
+class Field:
+    """The Field class describes one field of a portal record.  tag is
+    printed before the first value and repeat (tag if not given) before
+    every further value, each value is cleaned using cleaner.  source
+    indicates where the values of the field come from:
+
+        headwords       the headwords of language lang
+        parentheticals  the parenthetical of language lang
+        pos             the part of speech (a single value)
+        sounds          the names of the word recordings
+        hidden          the hidden words of language lang
+
+    A field of headwords or parentheticals is left out if the entry
+    has no such language and optional is true (a KeyError is raised if
+    optional is false).  Sounds and hidden fields are left out if there
+    are no values.
+    """
+
+    sources = ["headwords", "parentheticals", "pos", "sounds", "hidden"]
+
+    def __init__(self, tag, source, lang = None, cleaner = clean_portal_text, repeat = None, optional = False):
+        if source not in Field.sources:
+            raise ValueError("Unknown source of portal field " + tag + ": " + source)
+        self.tag = tag
+        self.source = source
+        self.lang = lang
+        self.cleaner = cleaner
+        self.repeat = tag if repeat == None else repeat
+        self.optional = optional
+
+
+    def get_values(self):
+        """get_values returns a function that returns the values of the
+        field of an entry (None if the field is left out).
+        """
+        lang = self.lang
+        if self.source == "headwords":
+            if self.optional:
+                return lambda entry: entry.headwords.get(lang)
+            return lambda entry: entry.headwords[lang]
+        elif self.source == "parentheticals":
+            if self.optional:
+                return lambda entry: [entry.parentheticals[lang]] if lang in entry.parentheticals else None
+            return lambda entry: [entry.parentheticals[lang]]
+        elif self.source == "pos":
+            return lambda entry: [entry.pos]
+        elif self.source == "sounds":
+            return lambda entry: entry.get_sounds() or None
+        elif self.source == "hidden":
+            return lambda entry: entry.get_hidden(lang) or None
+
+
+class PortalTemplate:
+    """The PortalTemplate class renders entries as portal records using
+    a layout (a list of Fields).  A record starts with ** and the
+    project line and ends with **.
+    """
+
+    def __init__(self, fields, project):
+        """The layout fields is compiled into a list of tuples of the
+        function that returns the values, the first tag, the separator
+        between the values and the cleaner.
+        """
+        self.start = "**\n<Project>" + project + "\n"
+        self.end = "**\n"
+        self.steps = []
+        for field in fields:
+            self.steps.append((field.get_values(), "<" + field.tag + ">", "\n<" + field.repeat + ">", field.cleaner))
+
+
+    def render(self, entry):
+        """render returns the portal record of entry.
+        """
+        parts = [self.start]
+        for (get_values, tag, separator, cleaner) in self.steps:
+            values = get_values(entry)
+            if values != None:
+                parts.append(tag + separator.join(map(cleaner, values)) + "\n")
+        parts.append(self.end)
+        return "".join(parts)
@@ -8,18 +8,23 @@ them to a specified audio directory.
 """
 
 import argparse
+from audio_manifest import build_manifest, read_manifest, write_manifest
+from audio_pack import write_pack
+from diagnostics import diagnostics
 import filecmp
-import glob
 import logging
+import os
 import re
-from pandas_ods_reader import read_ods
+from profiling import no_profiler, Profiler
 
 def read_input(filename):
     """Read input .ods file found at filename.  Return a list of
     entries that contain the information on the word and the
     recordings.
     """
-    logging.debug("Reading in file " + filename)
+    logging.debug("Reading in file %s", filename)
+    # pandas_ods_reader is imported here as importing pandas is slow
+    from pandas_ods_reader import read_ods
     spreadsheet = read_ods(filename , 1)
     data = []
     for index, row in spreadsheet.iterrows():
@@ -31,62 +36,163 @@ def read_input(filename):
     return data
 
 
-def write_output(file, data, base, target):
+def split_recordings(text):
+    """split_recordings splits the text of an audio column into the
+    names of the recordings.  Everything following -- (or an empty
+    name) is skipped.
+    """
+    result = []
+    for f in re.split("[ ;,]+", text):
+        if f == "--" or f == "":  # We can skip the -- or empty strings
+            break
+        result.append(f)
+    return result
+
+
+def scan_base(base):
+    """scan_base walks the base directory (recursively) once and returns
+    a dictionary that maps each filename to the list of paths where
+    that file is found.  Hidden files and directories are skipped.
+    """
+    logging.debug("Scanning %s", base)
+    result = {}
+    for (dirpath, dirnames, filenames) in os.walk(base):
+        dirnames[:] = sorted([d for d in dirnames if not d.startswith(".")])
+        for f in sorted(filenames):
+            if f.startswith("."):
+                continue
+            if f in result:
+                result[f].append(os.path.join(dirpath, f))
+            else: # Set initial value
+                result[f] = [os.path.join(dirpath, f)]
+    return result
+
+
+def resolve_recording(f, index, resolved, profiler = no_profiler):
+    """resolve_recording finds the audio file of recording f in the
+    index (see scan_base).  The file may be called f.wav, f.WAV or f.
+    It returns a tuple of the location (None if no unique file is
+    found) and a message describing the problem (None if there is no
+    problem).  The results are stored in resolved, so each recording
+    is only checked once, even if it is used in several entries or
+    columns.  The comparison of duplicates is recorded by profiler.
+    """
+    if f in resolved:
+        return resolved[f]
+    locations = []
+    for name in [f + ".wav", f + ".WAV", f]:
+        if name in index:
+            locations += index[name]
+    if len(locations) == 1:
+        result = (locations[0], None)
+    elif len(locations) == 0:
+        diagnostics.warning("missing recording", "Did not find %s", f)
+        result = (None, "Did not find " + f)
+    else:
+        diagnostics.warning("multiple recordings", "Found multiple %s", f)
+        # Check for duplicates (comparing with the first is enough)
+        token = profiler.start()
+        same = True
+        for location in locations[1:]:
+            if not filecmp.cmp(locations[0], location):
+                same = False
+                break
+        profiler.stop("duplicate checks", token)
+        if same:
+            result = (locations[0], None)
+        else:
+            diagnostics.error("different recordings", "Found multiple different %s", f)
+            result = (None, "Found multiple different " + f)
+    resolved[f] = result
+    return result
+
+
+def resolve_all(data, base, profiler = no_profiler):
+    """resolve_all scans the base directory once and resolves all
+    recordings of both audio columns ("tw" and "tw in s") in data.
+    It returns resolved (see resolve_recording).  The stages are
+    recorded by profiler.
+    """
+    with profiler.stage("scan base"):
+        index = scan_base(base)
+    resolved = {}
+    with profiler.stage("audio lookup"):
+        for i in data:
+            for column in ["tw", "tw in s"]:
+                if i[column]:
+                    for f in split_recordings(i[column]):
+                        logging.debug("Handling %s", f)
+                        if "." in f:
+                            diagnostics.error("period in recording", "Found period in %s", f)
+                        resolve_recording(f, index, resolved, profiler)
+    return resolved
+
+
+def write_recordings(output, text, resolved, target, manifest):
+    """write_recordings writes the bash copy commands for the
+    recordings in text (the contents of an audio column) to output.
+    The audio files are found in resolved (see resolve_recording) and
+    are copied to the target directory.  If a manifest is given,
+    recordings that are flagged as invalid in it are not copied and
+    trimmed copies are used where available.
+    """
+    for f in split_recordings(text):
+        (location, message) = resolved[f]
+        if location and manifest and manifest[f]["invalid"]:
+            output.write("# Invalid " + f + ": " + manifest[f]["problem"] + "\n")
+        elif location and manifest and manifest[f].get("trimmed"):
+            output.write("cp \"" + manifest[f]["trimmed"] + "\" " + target + "/" + f + ".wav\n")
+        elif location:
+            output.write("cp \"" + location + "\" " + target + "/" + f + ".wav\n")
+        else:
+            output.write("# " + message + "\n")
+
+
+def get_recordings(resolved, manifest = None):
+    """get_recordings returns a dictionary mapping the name of each
+    resolved recording to the location of its audio file.  If a
+    manifest is given, invalid recordings are left out and trimmed
+    copies are used where available.
+    """
+    result = {}
+    for f in resolved:
+        location = resolved[f][0]
+        if not location:
+            continue
+        if manifest and manifest[f]["invalid"]:
+            continue
+        if manifest and manifest[f].get("trimmed"):
+            location = manifest[f]["trimmed"]
+        result[f] = location
+    return result
+
+
+def write_output(file, data, resolved, target, sentence_target, manifest = None):
     """For each word in the column "word" in data, this function
-    searches the names of the audio files (in "tw") and globs 
-    this filename in the base directory (recursively).  It then writes
-    a bash copy function to the output.  The target is the target
-    directory where the audio files should go.
+    looks up the audio files (in "tw" and "tw in s") in resolved (see
+    resolve_all).  It then writes a bash copy function to the output.
+    The target is the target directory where the audio files of the
+    target words should go, sentence_target is the target directory
+    for the audio files of the sentences.  Recordings that are
+    flagged as invalid in the manifest (if given) are skipped.
     """
-    logging.debug("Writing app output to " + file)
+    logging.debug("Writing app output to %s", file)
     output = open(file, "w")
     output.write("mkdir -p " + target + "\n")
+    output.write("mkdir -p " + sentence_target + "\n")
     for i in data:
+        # handle target word (tw) audio
         if not i["tw"]:
             output.write("# " + i["word"] + " does not have dictionary recording\n")
         else:
-            # handle target word (tw) audio
             output.write("# " + i["word"] + "\n")
-            files = re.split("[ ;,]+", i["tw"])
-            for f in files:
-                if f == "--" or f == "":  # We can skip the -- or empty strings
-                    break
-                logging.debug("Handling " + f)
-                if "." in f:
-                    logging.error("Found period in " + f)
-                locations_lc = glob.glob(base + "/**/" + f + ".wav", recursive = True)
-                locations_uc = glob.glob(base + "/**/" + f + ".WAV", recursive = True)
-                locations_nc = glob.glob(base + "/**/" + f, recursive = True)
-                nr_files_lc = len(locations_lc)
-                nr_files_uc = len(locations_uc)
-                nr_files_nc = len(locations_nc)
-                if nr_files_lc + nr_files_uc + nr_files_nc == 1:
-                    output.write("cp \"")
-                    if nr_files_lc == 1:
-                        output.write(locations_lc[0])
-                    elif nr_files_uc == 1:
-                        output.write(locations_uc[0])
-                    else:
-                        output.write(locations_nc[0])
-                    output.write("\" " + target + "/" + f + ".wav\n")
-                elif nr_files_lc + nr_files_uc + nr_files_nc == 0:
-                    logging.warning("Did not find " + f)
-                    output.write("# Did not find " + f + "\n")
-                else:
-                    logging.warning("Found multiple " + f)
-                    # Check for duplicates
-                    locations = locations_lc + locations_uc + locations_nc
-                    same = True
-                    for i in range(len(locations)):
-                        for j in range(i + 1, len(locations)):
-                            same &= filecmp.cmp(locations[i], locations[j])
-                    if same:
-                        output.write("cp \"")
-                        output.write(locations[0] + "\" ")
-                        output.write(target + "/" + f + ".wav\n")
-                    else:
-                        logging.error("Found multiple different " + f)
-                        output.write("# Found multiple different " + f + "\n")
+            write_recordings(output, i["tw"], resolved, target, manifest)
+        # handle target word in sentence (tw in s) audio
+        if not i["tw in s"]:
+            output.write("# " + i["word"] + " does not have sentence recording\n")
+        else:
+            output.write("# " + i["word"] + " (sentence)\n")
+            write_recordings(output, i["tw in s"], resolved, sentence_target, manifest)
     output.close()
 
 
@@ -112,10 +218,66 @@ def main():
             help = "target directory",
             action = "store",
             metavar = "DIR")
+    parser.add_argument("-s", "--sentence-target",
+            help = "target directory for sentence recordings (TARGET/sentences default)",
+            action = "store",
+            metavar = "DIR")
     parser.add_argument("-b", "--base",
             help = "name of directory that contains all audio files",
             action = "store",
             metavar = "FILE")
+    parser.add_argument("-m", "--manifest",
+            help = "name of audio manifest filename (.json or .csv)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("--trim",
+            help = "write trimmed and normalised copies of the recordings to DIR (requires numpy)",
+            action = "store",
+            metavar = "DIR")
+    parser.add_argument("--threshold",
+            help = "level (dBFS) above which a frame counts as speech when trimming (-40 default)",
+            action = "store",
+            type = float,
+            metavar = "DB")
+    parser.add_argument("--peak",
+            help = "peak level (dBFS) after normalisation when trimming (-1 default)",
+            action = "store",
+            type = float,
+            metavar = "DB")
+    parser.add_argument("--frame",
+            help = "frame length (ms) used to find speech when trimming (10 default)",
+            action = "store",
+            type = float,
+            metavar = "MS")
+    parser.add_argument("--padding",
+            help = "silence (ms) kept before and after the speech when trimming (100 default)",
+            action = "store",
+            type = float,
+            metavar = "MS")
+    parser.add_argument("-p", "--pack",
+            help = "name of audio pack filename for the dictionary app",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("-j", "--jobs",
+            help = "number of threads (or processes when trimming) used to handle the audio",
+            action = "store",
+            type = int,
+            metavar = "N")
+    parser.add_argument("--profile",
+            help = "report the time and memory of each stage (on stderr)",
+            action = "store_true")
+    parser.add_argument("--profile-output",
+            help = "write the time and memory of each stage as JSON to FILE (implies --profile)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("--cprofile",
+            help = "profile using cProfile and write the statistics (pstats) to FILE (implies --profile)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("--report",
+            help = "write the diagnostics (problems found in the data) as JSON to FILE",
+            action = "store",
+            metavar = "FILE")
     parser.add_argument("-l", "--log",
             help = "name of logging filename",
             action = "store",
@@ -143,10 +305,48 @@ def main():
         parser.error("An output filename is required.")
     if args.target == None:
         parser.error("A target directory is required.")
+    if args.sentence_target == None:
+        args.sentence_target = args.target + "/sentences"
+    if args.trim != None:
+        try:
+            import numpy
+        except ImportError:
+            parser.error("--trim requires the numpy package.")
+
+    profiler = no_profiler
+    if args.profile or args.profile_output != None or args.cprofile != None:
+        profiler = Profiler(profile = args.cprofile != None)
 
     # Handle the data
-    data = read_input(args.input)
-    write_output(args.output, data, args.base, args.target)
+    with profiler.stage("read ODS"):
+        data = read_input(args.input)
+    resolved = resolve_all(data, args.base, profiler)
+    manifest = None
+    if args.manifest != None or args.trim != None:
+        with profiler.stage("build manifest"):
+            manifest = build_manifest(resolved, args.jobs)
+    if args.trim != None:
+        # numpy is only needed when trimming
+        from audio_trim import default_trim_settings, trim_recordings
+        previous = {}
+        if args.manifest != None and os.path.exists(args.manifest):
+            previous = read_manifest(args.manifest)
+        settings = dict(default_trim_settings)
+        for key in settings:
+            if getattr(args, key) != None:
+                settings[key] = getattr(args, key)
+        with profiler.stage("trim"):
+            trim_recordings(manifest, previous, args.trim, settings, args.jobs)
+    if args.manifest != None:
+        with profiler.stage("write manifest"):
+            write_manifest(args.manifest, manifest)
+    with profiler.stage("write script"):
+        write_output(args.output, data, resolved, args.target, args.sentence_target, manifest)
+    if args.pack != None:
+        with profiler.stage("write pack"):
+            write_pack(args.pack, get_recordings(resolved, manifest))
+    profiler.report(args.profile_output, args.cprofile)
+    diagnostics.report(args.report)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""prepare_images.py
+
+This program prepares the images of the introduction (intro.tex) for
+printing.  The photos in images/ are much larger than their size on
+paper, so every LaTeX pass decodes and embeds the full images and the
+PDF gets much larger than needed.  For each image that is included
+(\\includegraphics with a width or height), the size on paper is
+determined and the image is resampled to that size at the given
+resolution and recompressed.  The results are written to a cache
+directory (images-cache), which intro.tex searches before images/, so
+images that are not resampled are taken from images/.  The resolution
+stored in a resampled image is adjusted, so its natural size (and so
+the layout) stays the same.  The cache is kept up to date using the
+hash of each source image and the settings, so only new or changed
+images are resampled.  Requires Pillow.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import os
+import re
+
+
+# Width of the text in cm (a4paper minus the left and right margins, see
+# get_latex_preamble)
+text_width = 17.7
+
+# Lengths in cm
+units = {"cm" : 1, "mm" : 0.1, "in" : 2.54, "pt" : 2.54 / 72.27, "bp" : 2.54 / 72}
+
+# Images that are only resampled when they get at least this much
+# smaller (as a fraction of the width)
+min_reduction = 0.9
+
+raster_extensions = [".jpg", ".jpeg", ".png"]
+
+
+def strip_comments(text):
+    """strip_comments removes the LaTeX comments from text.
+    """
+    return re.sub("(?<!\\\\)%.*", "", text)
+
+
+def get_length(text, text_width):
+    """get_length returns the length text (for instance 4cm or
+    .2\\textwidth) in cm, or None if it is not understood.
+    """
+    match = re.fullmatch("\\s*(\\d*\\.?\\d+)\\s*(cm|mm|in|pt|bp)\\s*", text)
+    if match:
+        return float(match[1]) * units[match[2]]
+    match = re.fullmatch("\\s*(\\d*\\.?\\d*)\\s*\\\\(textwidth|linewidth|columnwidth)\\s*", text)
+    if match:
+        return float(match[1] or 1) * text_width
+    return None
+
+
+def get_uses(filename, text_width = text_width):
+    """get_uses returns a dictionary mapping the name of each raster
+    image that is included in the LaTeX file filename to the list of
+    its sizes on paper: tuples of the width and height in cm (None if
+    not given).  A size of None means that the size cannot be
+    determined (for instance if the image is trimmed or scaled), in
+    which case the image should not be resampled.
+    """
+    with open(filename) as f:
+        text = strip_comments(f.read())
+    result = {}
+    for (options, name) in re.findall("\\\\includegraphics\\s*(?:\\[([^\\]]*)\\])?\\s*{([^}]*)}", text):
+        name = name.strip()
+        if os.path.splitext(name)[1].lower() not in raster_extensions:
+            continue
+        size = None
+        settings = {}
+        for option in options.split(","):
+            if "=" in option:
+                (key, value) = option.split("=", 1)
+                settings[key.strip()] = value.strip()
+            elif option.strip():
+                settings[option.strip()] = None
+        if set(settings) <= set(["width", "height", "keepaspectratio"]):
+            width = get_length(settings["width"], text_width) if "width" in settings else None
+            height = get_length(settings["height"], text_width) if "height" in settings else None
+            if (width != None or "width" not in settings) and (height != None or "height" not in settings) and (width != None or height != None):
+                size = (width, height)
+        if name in result:
+            result[name].append(size)
+        else: # Set initial value
+            result[name] = [size]
+    return result
+
+
+def get_hash(filename):
+    """get_hash returns the SHA-256 hash of the contents of filename.
+    """
+    result = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            result.update(block)
+    return result.hexdigest()
+
+
+def get_scale(image, sizes, dpi):
+    """get_scale returns the factor by which image (a Pillow image) can
+    be scaled down to print it at all sizes (see get_uses) at dpi, or
+    None if it should not be resampled.
+    """
+    if None in sizes:
+        return None
+    (width, height) = image.size
+    pixels = 0
+    for (w, h) in sizes:
+        if w != None:
+            pixels = max(pixels, w / 2.54 * dpi)
+        if h != None:
+            pixels = max(pixels, h / 2.54 * dpi * width / height)
+    scale = pixels / width
+    if scale > min_reduction:
+        return None
+    return scale
+
+
+def prepare_image(source, target, sizes, dpi, quality):
+    """prepare_image resamples the image source to target for printing at
+    sizes (see get_uses) at dpi, using JPEG quality quality.  It
+    returns whether the image was resampled.
+    """
+    # Pillow is imported here as it is only needed for this program
+    from PIL import Image
+    image = Image.open(source)
+    scale = get_scale(image, sizes, dpi)
+    if scale == None:
+        return False
+    # Keep the natural size (the size LaTeX uses for trimming and
+    # scaling) by adjusting the resolution
+    resolution = image.info.get("dpi", (72, 72))
+    resolution = tuple([r * scale if r and r > 1 else 72 * scale for r in resolution])
+    size = (max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale)))
+    if image.mode == "P":
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    elif image.mode not in ["1", "L", "LA", "RGB", "RGBA", "CMYK"]:
+        image = image.convert("RGB")
+    image = image.resize(size, Image.LANCZOS)
+    if os.path.splitext(source)[1].lower() == ".png":
+        image.save(target, "PNG", dpi = resolution, optimize = True)
+    else:
+        if image.mode in ["LA", "RGBA"]:
+            image = image.convert("RGB")
+        image.save(target, "JPEG", dpi = resolution, quality = quality, optimize = True, progressive = True)
+    return True
+
+
+def read_cache(filename):
+    """read_cache returns the cache manifest (a dictionary) in filename,
+    which is empty if filename does not exist or cannot be read.
+    """
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def prepare_images(latex, source_dir, cache_dir, dpi = 300, quality = 85, jobs = None, text_width = text_width):
+    """prepare_images resamples the images of source_dir that are
+    included in latex to cache_dir (see prepare_image), using jobs
+    threads.  Images of which the source and settings did not change
+    since the previous run (according to cache_dir/cache.json) are
+    skipped, and images that are no longer resampled are removed from
+    cache_dir.  It returns a tuple of the total size of the included
+    source images and the total size of the images used (from
+    cache_dir or source_dir).
+    """
+    uses = get_uses(latex, text_width)
+    os.makedirs(cache_dir, exist_ok = True)
+    manifest_filename = os.path.join(cache_dir, "cache.json")
+    manifest = read_cache(manifest_filename)
+    new_manifest = {}
+    todo = []
+    for (name, sizes) in sorted(uses.items()):
+        source = os.path.join(source_dir, name)
+        if not os.path.exists(source):
+            logging.warning("Did not find image %s", source)
+            continue
+        key = "%s %d %d %s" % (get_hash(source), dpi, quality, json.dumps(sizes))
+        target = os.path.join(cache_dir, name)
+        entry = manifest.get(name)
+        if entry != None and entry["key"] == key and (not entry["resampled"] or os.path.exists(target)):
+            new_manifest[name] = entry
+        else:
+            todo.append((name, source, target, sizes, key))
+    def prepare(item):
+        (name, source, target, sizes, key) = item
+        logging.debug("Preparing %s", source)
+        os.makedirs(os.path.dirname(target), exist_ok = True)
+        return (name, {"key" : key, "resampled" : prepare_image(source, target, sizes, dpi, quality)})
+    with ThreadPoolExecutor(max_workers = jobs) as executor:
+        for (name, entry) in executor.map(prepare, todo):
+            new_manifest[name] = entry
+    for name in manifest:
+        if name not in new_manifest and os.path.exists(os.path.join(cache_dir, name)):
+            os.remove(os.path.join(cache_dir, name))
+    source_size = 0
+    used_size = 0
+    for (name, entry) in sorted(new_manifest.items()):
+        source = os.path.join(source_dir, name)
+        target = os.path.join(cache_dir, name)
+        if not entry["resampled"] and os.path.exists(target):
+            os.remove(target)
+        source_size += os.path.getsize(source)
+        used_size += os.path.getsize(target if entry["resampled"] else source)
+    logging.info("Resampled %d of %d images (%d up to date), %.1f MB instead of %.1f MB", len([e for e in new_manifest.values() if e["resampled"]]), len(new_manifest), len(new_manifest) - len(todo), used_size / 1e6, source_size / 1e6)
+    output = open(manifest_filename, "w")
+    json.dump(new_manifest, output, indent = 1)
+    output.close()
+    return (source_size, used_size)
+
+
+def main():
+    """Commandline arguments are parsed and handled.  The images
+    included in the LaTeX file are prepared.
+    """
+
+    parser = argparse.ArgumentParser(description="This program resamples the images of the introduction to their size on paper.")
+    parser.add_argument("-i", "--input",
+            help = "name of the LaTeX file that includes the images (intro.tex default)",
+            action = "store",
+            default = "intro.tex",
+            metavar = "FILE")
+    parser.add_argument("-s", "--source",
+            help = "directory of the images (images default)",
+            action = "store",
+            default = "images",
+            metavar = "DIR")
+    parser.add_argument("-o", "--output",
+            help = "directory of the resampled images (images-cache default, should be in \\graphicspath before the source directory)",
+            action = "store",
+            default = "images-cache",
+            metavar = "DIR")
+    parser.add_argument("--dpi",
+            help = "resolution on paper (300 default)",
+            action = "store",
+            type = int,
+            default = 300)
+    parser.add_argument("-q", "--quality",
+            help = "JPEG quality (85 default)",
+            action = "store",
+            type = int,
+            default = 85)
+    parser.add_argument("--text-width",
+            help = "width of the text in cm, for sizes relative to \\textwidth (" + str(text_width) + " default)",
+            action = "store",
+            type = float,
+            default = text_width,
+            metavar = "CM")
+    parser.add_argument("-j", "--jobs",
+            help = "number of images that are resampled in parallel",
+            action = "store",
+            type = int,
+            metavar = "N")
+    parser.add_argument("-d", "--debug",
+            help = "provide debugging information",
+            action = "store_const",
+            dest = "loglevel",
+            const = logging.DEBUG,
+            default = logging.INFO,
+            )
+    args = parser.parse_args()
+
+    logging.basicConfig(level = args.loglevel)
+
+    # Perform checks on arguments
+    try:
+        import PIL
+    except ImportError:
+        parser.error("prepare_images.py requires the Pillow package.")
+    if args.dpi < 1:
+        parser.error("The resolution should be at least 1.")
+
+    prepare_images(args.input, args.source, args.output, args.dpi, args.quality, args.jobs, args.text_width)
+
+
+if __name__ == '__main__':
+    main()
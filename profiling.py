@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""profiling.py
+
+This file contains the implementation of the Profiler class, which
+measures the stages of a run (for instance reading the spreadsheet,
+sorting and rendering) for the --profile options of convert.py and
+prepare_audio.py.  For each stage, the number of calls, the wall time,
+the CPU time and the peak memory (traced using tracemalloc) are
+recorded.  Optionally, the run is profiled using cProfile, the
+statistics are written to a pstats file and the number of calls of the
+functions in output_helper is reported.  The results are written as a
+table or as JSON.
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+
+results_version = 1
+
+
+class Profiler:
+    """The Profiler class records the stages of a run.  A stage is
+    either measured as a whole (using stage, which also records the
+    peak memory) or accumulated over many small intervals (using start
+    and stop, for instance the rendering of each entry), in which case
+    the CPU time is that of the thread the interval ran in.  If the
+    Profiler is not enabled, nothing is measured and the methods are
+    cheap to call.  Note that tracing the memory slows the run down.
+    """
+
+    def __init__(self, enabled = True, profile = False):
+        """If profile is true, the run is also profiled using cProfile
+        (only the thread that creates the Profiler).
+        """
+        self.enabled = enabled
+        self.stages = {}
+        self.stack = []
+        self.lock = threading.Lock()
+        self.cprofile = None
+        self.counters = {}
+        if enabled:
+            tracemalloc.start()
+        if enabled and profile:
+            # cProfile and pstats are imported when needed, so the
+            # programs start fast
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+
+    def record(self, name, wall, cpu, peak = None):
+        """record adds a call of wall and cpu seconds (and peak bytes of
+        memory, if measured) to stage name.
+        """
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = {"calls" : 0, "wall" : 0.0, "cpu" : 0.0, "peak" : None}
+            stage = self.stages[name]
+            stage["calls"] += 1
+            stage["wall"] += wall
+            stage["cpu"] += cpu
+            if peak != None:
+                stage["peak"] = max(peak, stage["peak"] or 0)
+
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """stage measures the code in its with block as stage name.
+        Stages can be nested.
+        """
+        if not self.enabled:
+            yield
+            return
+        # The peak of the enclosing stage so far is kept before the
+        # peak is reset for this stage
+        if self.stack:
+            self.stack[-1] = max(self.stack[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        self.stack.append(0)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            peak = max(self.stack.pop(), tracemalloc.get_traced_memory()[1])
+            if self.stack:
+                self.stack[-1] = max(self.stack[-1], peak)
+            self.record(name, wall, cpu, peak)
+
+
+    def start(self):
+        """start starts an interval of an accumulated stage.  It returns
+        a token that is passed to stop (None if not enabled).
+        """
+        if not self.enabled:
+            return None
+        return (time.perf_counter(), time.thread_time())
+
+
+    def stop(self, name, token):
+        """stop ends the interval (token, see start) and adds it to stage
+        name.
+        """
+        if token == None:
+            return
+        self.record(name, time.perf_counter() - token[0], time.thread_time() - token[1])
+
+
+    def finish(self):
+        """finish stops the profiling and memory tracing.  The number of
+        calls and the time of the functions in output_helper are
+        collected from the cProfile statistics.
+        """
+        if not self.enabled:
+            return
+        if self.cprofile != None:
+            self.cprofile.disable()
+            import pstats
+            stats = pstats.Stats(self.cprofile)
+            for ((filename, line, function), (primitive, calls, total, cumulative, callers)) in stats.stats.items():
+                if os.path.basename(filename) == "output_helper.py":
+                    self.counters[function] = {"calls" : calls, "time" : total, "cumulative" : cumulative}
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+    def dump_stats(self, filename):
+        """dump_stats writes the cProfile statistics (if any) to filename
+        (a pstats file).
+        """
+        if self.cprofile != None:
+            self.cprofile.dump_stats(filename)
+
+
+    def write_table(self, output = sys.stderr):
+        """write_table writes the stages (and the counters, if any) as a
+        table to output.
+        """
+        output.write("%-32s %8s %10s %10s %10s\n" % ("stage", "calls", "wall (s)", "cpu (s)", "peak (MB)"))
+        for (name, stage) in self.stages.items():
+            peak = "-" if stage["peak"] == None else "%.1f" % (stage["peak"] / 1e6)
+            output.write("%-32s %8d %10.3f %10.3f %10s\n" % (name, stage["calls"], stage["wall"], stage["cpu"], peak))
+        if self.counters:
+            output.write("\n%-32s %8s %10s %10s\n" % ("output_helper function", "calls", "time (s)", "cum. (s)"))
+            for (function, counter) in sorted(self.counters.items(), key = lambda x: -x[1]["calls"]):
+                output.write("%-32s %8d %10.3f %10.3f\n" % (function, counter["calls"], counter["time"], counter["cumulative"]))
+
+
+    def write_json(self, filename):
+        """write_json writes the stages and counters as JSON to filename.
+        """
+        output = open(filename, "w")
+        json.dump({
+                "version" : results_version,
+                "stages" : [dict(name = name, **stage) for (name, stage) in self.stages.items()],
+                "counters" : self.counters,
+                }, output, indent = 1)
+        output.close()
+
+
+    def report(self, json_filename = None, stats_filename = None):
+        """report finishes the run (see finish) and writes the table to
+        stderr, the JSON to json_filename and the cProfile statistics to
+        stats_filename (if given).
+        """
+        if not self.enabled:
+            return
+        self.finish()
+        self.write_table()
+        if json_filename != None:
+            self.write_json(json_filename)
+        if stats_filename != None:
+            self.dump_stats(stats_filename)
+
+
+# A Profiler that does not measure anything
+no_profiler = Profiler(enabled = False)
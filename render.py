@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""render.py
+
+This file contains the render pipeline, which walks the entries of a
+Dictionary once and feeds them to a number of sinks (for instance the
+portal and LaTeX output).  Each sink formats the entries and hands the
+text to its own Writer, a background thread with a bounded queue that
+encodes and writes the text to disk, so formatting and writing overlap.
+"""
+
+from dictionary import clean_sort, get_latex_preamble, get_latex_header, get_latex_footer, get_lang_latex_header, get_lang_latex_footer, latex_langs
+from entry import Entry
+import logging
+import os
+from profiling import no_profiler
+import queue
+import threading
+
+
+# Starts a section on an odd page.  The marks and title are cleared, so a
+# blank page that is inserted only shows the page number.
+latex_sectionstart = """\\newcommand{\\sectionstart}{%
+\\markboth{}{}%
+\\renewcommand*\\nowtitle{}%
+\\cleardoublepage}
+"""
+
+
+class Writer(threading.Thread):
+    """The Writer class writes text to a file in a background thread.
+    Text is collected in a buffer of buffer_size characters, which is
+    put on a queue of at most queue_size buffers, so the thread that
+    produces the text blocks if the disk cannot keep up.  An error in
+    the writer thread is raised again by write or close.  The writes
+    are recorded as stage "write output" of profiler (if given).
+    """
+
+    def __init__(self, filename, queue_size = 16, buffer_size = 65536, profiler = None):
+        threading.Thread.__init__(self, daemon = True)
+        self.filename = filename
+        self.profiler = profiler or no_profiler
+        self.queue = queue.Queue(queue_size)
+        self.buffer = []
+        self.buffered = 0
+        self.buffer_size = buffer_size
+        self.error = None
+        self.start()
+
+
+    def run(self):
+        try:
+            output = open(self.filename, "w")
+        except Exception as e:
+            self.error = e
+            output = None
+        while True:
+            text = self.queue.get()
+            if text == None:
+                break
+            if output != None and self.error == None:
+                token = self.profiler.start()
+                try:
+                    output.write(text)
+                except Exception as e:
+                    self.error = e
+                self.profiler.stop("write output", token)
+        if output != None:
+            try:
+                output.close()
+            except Exception as e:
+                if self.error == None:
+                    self.error = e
+
+
+    def check(self):
+        """check raises the error of the writer thread (if any).
+        """
+        if self.error != None:
+            raise self.error
+
+
+    def flush_buffer(self):
+        """flush_buffer puts the buffered text on the queue.
+        """
+        if self.buffer:
+            self.queue.put("".join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+
+
+    def write(self, text):
+        """write writes text to the file (eventually).
+        """
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.buffer_size:
+            self.check()
+            self.flush_buffer()
+
+
+    def close(self):
+        """close writes the remaining text, waits until the writer
+        thread is done and raises its error (if any).
+        """
+        self.flush_buffer()
+        self.queue.put(None)
+        self.join()
+        self.check()
+
+
+class Sink:
+    """The Sink class is the base class of the sinks of the render
+    pipeline.  A sink writes its output to filename using a Writer
+    (see new_writer).  begin is called before the first entry, add for
+    each entry (in entry order) and end after the last entry.  The
+    stages are recorded by profiler (if given).
+    """
+
+    def __init__(self, filename, profiler = None):
+        self.profiler = profiler or no_profiler
+        self.writer = self.new_writer(filename)
+
+
+    def new_writer(self, filename):
+        """new_writer returns the writer (an object with a write and a
+        close method) of the file filename.
+        """
+        return Writer(filename, profiler = self.profiler)
+
+
+    def begin(self, data):
+        pass
+
+
+    def add(self, index, entry):
+        pass
+
+
+    def end(self, data):
+        pass
+
+
+    def close(self):
+        self.writer.close()
+
+
+class PortalSink(Sink):
+    """The PortalSink class writes the portal output.  As the portal
+    output is in entry order, every record is written immediately.
+    """
+
+    def __init__(self, filename, profiler = None):
+        logging.debug("Writing app output to " + filename)
+        Sink.__init__(self, filename, profiler)
+
+
+    def add(self, index, entry):
+        token = self.profiler.start()
+        record = entry.get_portal()
+        self.profiler.stop("render portal", token)
+        self.writer.write(record)
+
+
+class LatexSink(Sink):
+    """The LatexSink class writes the LaTeX output.  The sections are in
+    dictionary order, so the positions of the headwords of each entry
+    are computed in advance (in begin) and the LaTeX of an entry is
+    stored in its slots.  The slots of the current section are written
+    as soon as all slots before them are filled.  If langs is given,
+    only the sections of these languages are written and only the
+    headwords in the range from first to last (see
+    Dictionary.iter_range).  The output is written using begin_output,
+    begin_section, write_slot, end_section and end_output, which can be
+    overridden to lay out the output differently.
+    """
+
+    def __init__(self, filename, langs = None, first = None, last = None, profiler = None):
+        logging.debug("Writing LaTeX output to " + filename)
+        Sink.__init__(self, filename, profiler)
+        self.langs = [lang for lang in latex_langs if langs == None or lang in langs]
+        self.first = first
+        self.last = last
+
+
+    def begin(self, data):
+        self.slots = {}
+        self.words = {}
+        self.positions = {}
+        for lang in self.langs:
+            words = []
+            positions = {}
+            with self.profiler.stage("sort " + Entry.lang2text(lang)):
+                for (index, word) in data.iter_range(lang, self.first, self.last):
+                    if index in positions:
+                        positions[index].append((len(words), word))
+                    else: # Set initial value
+                        positions[index] = [(len(words), word)]
+                    words.append(word)
+            self.slots[lang] = [None] * len(words)
+            self.words[lang] = words
+            self.positions[lang] = positions
+        self.section = 0
+        self.next = 0
+        self.begin_output()
+        if self.langs:
+            self.begin_section(self.langs[0])
+
+
+    def begin_output(self):
+        self.writer.write(get_latex_header())
+
+
+    def begin_section(self, lang):
+        self.writer.write(get_lang_latex_header(lang))
+
+
+    def write_slot(self, lang, slot, text):
+        self.writer.write(text)
+
+
+    def end_section(self, lang):
+        self.writer.write(get_lang_latex_footer(lang))
+
+
+    def end_output(self):
+        self.writer.write(get_latex_footer())
+
+
+    def flush(self):
+        """flush writes the filled slots of the current section (and of
+        the next sections if the current section is complete).
+        """
+        while self.section < len(self.langs):
+            lang = self.langs[self.section]
+            slots = self.slots[lang]
+            while self.next < len(slots) and slots[self.next] != None:
+                self.write_slot(lang, self.next, slots[self.next])
+                slots[self.next] = "" # release the text
+                self.next += 1
+            if self.next < len(slots):
+                return
+            self.end_section(lang)
+            self.section += 1
+            self.next = 0
+            if self.section < len(self.langs):
+                self.begin_section(self.langs[self.section])
+
+
+    def add(self, index, entry):
+        for lang in self.langs:
+            for (slot, word) in self.positions[lang].get(index, []):
+                token = self.profiler.start()
+                self.slots[lang][slot] = entry.get_latex(word, lang)
+                self.profiler.stop("render LaTeX " + Entry.lang2text(lang), token)
+        self.flush()
+
+
+    def end(self, data):
+        self.flush()
+        self.end_output()
+
+
+class SplitLatexSink(LatexSink):
+    """The SplitLatexSink class writes the LaTeX output as a master file
+    (filename) that includes a file for each section, which in turn
+    inputs a file for each block of headwords with the same initial
+    (according to clean_sort).  The files are named after the master
+    file, the language and the code of the initial, for instance
+    out-nama-01c2.tex.  The sections are included using \\include, so
+    they can be selected with \\includeonly, and each section starts
+    on an odd page (\\sectionstart).
+    """
+
+    def __init__(self, filename, langs = None, first = None, last = None, profiler = None):
+        LatexSink.__init__(self, filename, langs, first, last, profiler)
+        (self.base, extension) = os.path.splitext(filename)
+        self.section_writer = None
+        self.block_writer = None
+        self.block = None
+
+
+    def get_name(self, *parts):
+        """get_name returns the name (without directory and extension, as
+        used by \\include and \\input) of the file of parts.
+        """
+        return "-".join([os.path.basename(self.base)] + list(parts))
+
+
+    def open_writer(self, name):
+        """open_writer returns a Writer for the file name.
+        """
+        return self.new_writer(os.path.join(os.path.dirname(self.base), name + ".tex"))
+
+
+    def begin_output(self):
+        self.writer.write(get_latex_preamble())
+        self.writer.write(latex_sectionstart)
+        self.writer.write("\\begin{document}\n")
+        self.writer.write("\\include{intro}\n")
+
+
+    def begin_section(self, lang):
+        name = self.get_name(lang.name.lower())
+        self.writer.write("\\sectionstart\n")
+        self.writer.write("\\include{" + name + "}\n")
+        self.section_writer = self.open_writer(name)
+        self.section_writer.write("\\begin{multicols}{2}\n")
+        self.section_writer.write(get_lang_latex_header(lang))
+        self.block = None
+
+
+    def write_slot(self, lang, slot, text):
+        initial = clean_sort(self.words[lang][slot])[:1]
+        block = "%04x" % ord(initial) if initial else "0000"
+        if block != self.block:
+            self.close_block()
+            name = self.get_name(lang.name.lower(), block)
+            self.section_writer.write("\\input{" + name + "}\n")
+            self.block_writer = self.open_writer(name)
+            self.block = block
+        self.block_writer.write(text)
+
+
+    def close_block(self):
+        """close_block closes the file of the current block (if any).
+        """
+        if self.block_writer != None:
+            writer = self.block_writer
+            self.block_writer = None
+            writer.close()
+
+
+    def end_section(self, lang):
+        self.close_block()
+        self.section_writer.write(get_lang_latex_footer(lang))
+        self.section_writer.write("\\end{multicols}\n")
+        writer = self.section_writer
+        self.section_writer = None
+        writer.close()
+
+
+    def end_output(self):
+        self.writer.write("\\end{document}\n")
+
+
+    def close(self):
+        try:
+            self.close_block()
+            if self.section_writer != None:
+                self.section_writer.close()
+        finally:
+            LatexSink.close(self)
+
+
+def render(data, sinks):
+    """render walks the entries of the Dictionary data once and feeds
+    them to the sinks.  The sinks are closed afterwards, also if an
+    error occurs.
+    """
+    try:
+        for sink in sinks:
+            sink.begin(data)
+        for (index, entry) in enumerate(data.entries):
+            for sink in sinks:
+                sink.add(index, entry)
+        for sink in sinks:
+            sink.end(data)
+    finally:
+        errors = []
+        for sink in sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""search_index.py
+
+This file contains the implementation of the search index, a compact
+binary file that the dictionary app can use to find entries.  For each
+language, the (cleaned and accent-folded) headwords and hidden words are
+stored as a sorted list of terms (for prefix queries) together with a
+trigram index over the terms (for substring queries).  The postings are
+lists of entry indices (or term numbers for the trigrams), which are
+delta encoded as varints.  The file is laid out as follows:
+
+    header    magic (8 bytes), version (uint32), number of languages
+              (uint32), followed by the Lang_type value (uint32) and
+              the offset of the section (uint64) of each language
+    section   number of terms (uint32), number of trigrams (uint32),
+              the offsets (uint64) of the term offsets, terms, postings
+              offsets, postings, trigram offsets, trigrams, trigram
+              postings offsets and trigram postings
+    offsets   number of items + 1 offsets (uint32) into the data
+    data      the terms and trigrams (UTF-8) or postings (varints)
+
+All numbers are little endian.  As the offsets have a fixed size, the
+reader mmaps the file and uses binary search, so queries do not require
+the file (or the dictionary) to be loaded.
+"""
+
+from entry import Entry
+import logging
+import mmap
+import os
+from output_helper import clean_portal, clean_portal_text
+import struct
+import unicodedata
+
+
+index_magic = b"NUUINDEX"
+index_version = 1
+header_format = "<8sII"
+header_size = struct.calcsize(header_format)
+language_format = "<IQ"
+language_size = struct.calcsize(language_format)
+section_format = "<IIQQQQQQQQ"
+section_size = struct.calcsize(section_format)
+
+
+def fold(text, lang):
+    """fold returns the cleaned (see clean_portal_text, or clean_portal
+    for IPA as in the portal output), lowercased and accent-folded
+    version of text in language lang, which is used as a term.  The
+    retroflex click (U+01C3) is folded to an exclamation mark.
+    """
+    if lang == Entry.Lang_type.IPA:
+        text = clean_portal(text)
+    else:
+        text = clean_portal_text(text)
+    text = unicodedata.normalize("NFD", text.lower())
+    text = "".join([c for c in text if not unicodedata.combining(c)])
+    return unicodedata.normalize("NFC", text).replace(chr(451), "!")
+
+
+def get_trigrams(term):
+    """get_trigrams returns the set of trigrams of term.
+    """
+    return set([term[i:i + 3] for i in range(len(term) - 2)])
+
+
+def encode_postings(numbers):
+    """encode_postings encodes the sorted list of numbers as delta
+    encoded varints.
+    """
+    result = bytearray()
+    previous = 0
+    for number in numbers:
+        delta = number - previous
+        previous = number
+        while delta >= 0x80:
+            result.append((delta & 0x7f) | 0x80)
+            delta >>= 7
+        result.append(delta)
+    return bytes(result)
+
+
+def decode_postings(data, start, end):
+    """decode_postings decodes the delta encoded varints in data[start:end]
+    into a list of numbers.
+    """
+    result = []
+    previous = 0
+    number = 0
+    shift = 0
+    for byte in data[start:end]:
+        number |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            previous += number
+            result.append(previous)
+            number = 0
+            shift = 0
+    return result
+
+
+def get_terms(data, lang):
+    """get_terms returns a dictionary mapping each term of language lang
+    (headwords and hidden words) to the sorted list of indices of the
+    entries in data (a Dictionary) it occurs in.
+    """
+    terms = {}
+    for (index, entry) in enumerate(data.entries):
+        words = []
+        if lang in entry.headwords:
+            words += [hw.get_word() for hw in entry.headwords[lang]]
+        if lang != Entry.Lang_type.IPA:
+            words += entry.get_hidden(lang)
+        for word in words:
+            term = fold(word, lang)
+            if term == "":
+                continue
+            if term in terms:
+                if terms[term][-1] != index:
+                    terms[term].append(index)
+            else: # Set initial value
+                terms[term] = [index]
+    return terms
+
+
+def pack_items(items):
+    """pack_items returns the offsets (packed) and the concatenated
+    items (a list of bytes).
+    """
+    offsets = [0]
+    for item in items:
+        offsets.append(offsets[-1] + len(item))
+    return (struct.pack("<" + str(len(offsets)) + "I", *offsets), b"".join(items))
+
+
+def get_section(terms, start):
+    """get_section returns the binary representation of the section of
+    one language with terms (see get_terms).  start is the offset of
+    the section in the file.
+    """
+    sorted_terms = sorted(terms)
+    trigrams = {}
+    for (number, term) in enumerate(sorted_terms):
+        for trigram in get_trigrams(term):
+            if trigram in trigrams:
+                trigrams[trigram].append(number)
+            else: # Set initial value
+                trigrams[trigram] = [number]
+    sorted_trigrams = sorted(trigrams)
+    parts = []
+    parts += pack_items([term.encode("utf-8") for term in sorted_terms])
+    parts += pack_items([encode_postings(terms[term]) for term in sorted_terms])
+    parts += pack_items([trigram.encode("utf-8") for trigram in sorted_trigrams])
+    parts += pack_items([encode_postings(trigrams[trigram]) for trigram in sorted_trigrams])
+    offsets = []
+    offset = start + section_size
+    for part in parts:
+        offsets.append(offset)
+        offset += len(part)
+    return struct.pack(section_format, len(sorted_terms), len(sorted_trigrams), *offsets) + b"".join(parts)
+
+
+def write_search_index(filename, data):
+    """write_search_index writes the search index of the Dictionary
+    data to filename.
+    """
+    logging.debug("Writing search index to " + filename)
+    langs = list(Entry.Lang_type)
+    offset = header_size + len(langs) * language_size
+    table = b""
+    sections = []
+    for lang in langs:
+        section = get_section(get_terms(data, lang), offset)
+        table += struct.pack(language_format, lang.value, offset)
+        sections.append(section)
+        offset += len(section)
+    output = open(filename, "wb")
+    output.write(struct.pack(header_format, index_magic, index_version, len(langs)))
+    output.write(table)
+    for section in sections:
+        output.write(section)
+    output.close()
+
+
+class SearchIndex:
+    """The SearchIndex class answers prefix and substring queries using
+    a search index file (see write_search_index).  The file is memory
+    mapped, so only the pages that are needed for a query are read.
+    Queries return sorted lists of entry indices.
+    """
+
+    def __init__(self, filename):
+        """The SearchIndex is opened from filename.  A ValueError is
+        raised if filename is not a search index.
+        """
+        self.file = open(filename, "rb")
+        self.data = None
+        try:
+            if os.fstat(self.file.fileno()).st_size < header_size:
+                raise ValueError(filename + " is not a search index")
+            self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+            (magic, version, nr_langs) = struct.unpack_from(header_format, self.data, 0)
+            if magic != index_magic or version != index_version:
+                raise ValueError(filename + " is not a search index (version " + str(index_version) + ")")
+            # The sections are small tuples, so they are read in advance.
+            self.sections = {}
+            for i in range(nr_langs):
+                (lang, offset) = struct.unpack_from(language_format, self.data, header_size + i * language_size)
+                self.sections[Entry.Lang_type(lang)] = struct.unpack_from(section_format, self.data, offset)
+        except Exception:
+            self.close()
+            raise
+
+
+    def close(self):
+        """close closes the search index.
+        """
+        if self.data != None:
+            self.data.close()
+        self.file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def get_item(self, offsets, items, i):
+        """get_item returns item i (as bytes) using the offsets and items
+        positions of a section.
+        """
+        (start, end) = struct.unpack_from("<II", self.data, offsets + 4 * i)
+        return self.data[items + start:items + end]
+
+
+    def get_postings(self, offsets, postings, i):
+        """get_postings returns the decoded postings i using the offsets
+        and postings positions of a section.
+        """
+        (start, end) = struct.unpack_from("<II", self.data, offsets + 4 * i)
+        return decode_postings(self.data, postings + start, postings + end)
+
+
+    def find(self, offsets, items, count, key):
+        """find returns the first position in the sorted items (using
+        the offsets and items positions of a section) that is not
+        smaller than key (bytes).
+        """
+        low = 0
+        high = count
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_item(offsets, items, middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+    def get_term(self, lang, i):
+        """get_term returns term i of language lang.
+        """
+        section = self.sections[lang]
+        return self.get_item(section[2], section[3], i).decode("utf-8")
+
+
+    def get_entries(self, lang, numbers):
+        """get_entries returns the sorted list of entry indices of the
+        terms (numbers) of language lang.
+        """
+        section = self.sections[lang]
+        result = set()
+        for i in numbers:
+            result.update(self.get_postings(section[4], section[5], i))
+        return sorted(result)
+
+
+    def prefix(self, lang, text):
+        """prefix returns the sorted list of indices of the entries with
+        a term in language lang that starts with text.
+        """
+        section = self.sections[lang]
+        key = fold(text, lang).encode("utf-8")
+        i = self.find(section[2], section[3], section[0], key)
+        numbers = []
+        while i < section[0] and self.get_item(section[2], section[3], i).startswith(key):
+            numbers.append(i)
+            i += 1
+        return self.get_entries(lang, numbers)
+
+
+    def substring(self, lang, text):
+        """substring returns the sorted list of indices of the entries
+        with a term in language lang that contains text.  Texts of
+        three or more characters are found using the trigram index,
+        shorter texts require a scan of the terms.
+        """
+        section = self.sections[lang]
+        query = fold(text, lang)
+        if len(query) < 3:
+            candidates = range(section[0])
+        else:
+            candidates = None
+            for trigram in sorted(get_trigrams(query)):
+                key = trigram.encode("utf-8")
+                i = self.find(section[6], section[7], section[1], key)
+                if i == section[1] or self.get_item(section[6], section[7], i) != key:
+                    return []
+                numbers = set(self.get_postings(section[8], section[9], i))
+                if candidates == None:
+                    candidates = numbers
+                else:
+                    candidates &= numbers
+                if not candidates:
+                    return []
+        key = query.encode("utf-8")
+        numbers = [i for i in candidates if key in self.get_item(section[2], section[3], i)]
+        return self.get_entries(lang, numbers)
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""serve.py
+
+This program runs a local HTTP service for looking up entries of the
+dictionary and previewing their output, without running convert.py on
+the whole spreadsheet.  The dictionary is loaded once (from a
+spreadsheet or a snapshot, see snapshot.py) and reloaded in the
+background when the input changes.  Requests are handled in parallel
+and the responses are cached until the next reload.  The service
+provides:
+
+    /entry/INDEX          the fields of entry INDEX (JSON)
+    /entry/INDEX/portal   the portal record of entry INDEX
+    /entry/INDEX/latex    the LaTeX lemmas of entry INDEX (?lang=LANG
+                          for one language only)
+    /lookup?lang=LANG&word=WORD
+                          the entries with headword WORD in language
+                          LANG (JSON), matching the sort key (see
+                          clean_sort) if there is no exact match
+    /browse?lang=LANG&from=WORD&to=WORD&limit=N
+                          the headwords of language LANG in dictionary
+                          order (JSON), see Dictionary.iter_range
+
+LANG is the name of a language in lower case (for instance nuu, ipa,
+nama, afrikaans, afr_loc or english).
+"""
+
+import argparse
+import bisect
+from collections import OrderedDict
+from convert import read_input
+from delta import get_fields, get_key
+from dictionary import clean_sort, latex_langs
+from entry import Entry
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+from watch import get_state
+
+
+# Maximum number of cached responses
+cache_size = 4096
+
+# Default and maximum number of headwords returned by /browse
+browse_limit = 100
+browse_max = 1000
+
+
+class RequestError(Exception):
+    """The RequestError exception is raised when a request cannot be
+    handled.  status is the HTTP status of the response.
+    """
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class Index:
+    """The Index class holds a loaded dictionary (data) with, for each
+    language, the headwords in dictionary order, their sort keys (see
+    clean_sort) and a mapping from the text of a headword to the
+    entries.  The language tables are built when a language is used
+    for the first time.  users is the number of requests that use the
+    index (see DictionaryServer.acquire) and retired is set when the
+    dictionary is reloaded.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.orders = {}
+        self.keys = {}
+        self.words = {}
+        self.lock = threading.Lock()
+        self.users = 0
+        self.retired = False
+
+
+    def close(self):
+        """close closes the dictionary if it is a Snapshot (which holds
+        an mmap and a file).
+        """
+        if hasattr(self.data, "close"):
+            self.data.close()
+
+
+    def get_lang(self, lang):
+        """get_lang returns a tuple of the headwords (tuples of entry
+        index and headword) of lang in dictionary order, their sort keys
+        and the mapping of their texts to the entry indices.
+        """
+        with self.lock:
+            if lang not in self.orders:
+                order = list(self.data.iter_sorted(lang))
+                words = {}
+                for (index, word) in order:
+                    if str(word) in words:
+                        words[str(word)].append(index)
+                    else: # Set initial value
+                        words[str(word)] = [index]
+                self.keys[lang] = [clean_sort(word) for (index, word) in order]
+                self.words[lang] = words
+                self.orders[lang] = order
+            return (self.orders[lang], self.keys[lang], self.words[lang])
+
+
+class DictionaryServer(ThreadingHTTPServer):
+    """The DictionaryServer class serves the dictionary in filename.  The
+    input is checked every interval seconds and reloaded when it
+    changed.
+    """
+
+    daemon_threads = True
+    # Many editors may connect at the same time
+    request_queue_size = 128
+
+    def __init__(self, address, filename, interval = 2):
+        self.filename = filename
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.index = None
+        self.load()
+        ThreadingHTTPServer.__init__(self, address, RequestHandler)
+        threading.Thread(target = self.watch, daemon = True).start()
+
+
+    def load(self):
+        """load (re)loads the dictionary and clears the cache.
+        """
+        state = get_state(self.filename)
+        start = time.perf_counter()
+        index = Index(read_input(self.filename))
+        with self.lock:
+            old = self.index
+            self.index = index
+            self.state = state
+            self.cache.clear()
+        if old != None:
+            self.retire(old)
+        logging.info("Loaded %s (%d entries) in %.2fs", self.filename, len(index.data.entries), time.perf_counter() - start)
+
+
+    def watch(self):
+        """watch reloads the dictionary when the input changed (and its
+        modification time and size are stable for an interval).
+        """
+        while True:
+            time.sleep(self.interval)
+            state = get_state(self.filename)
+            if state == self.state or state == None:
+                continue
+            time.sleep(self.interval)
+            if get_state(self.filename) != state:
+                continue
+            try:
+                self.load()
+            except Exception as e:
+                logging.warning("Cannot reload %s: %s", self.filename, e)
+                with self.lock:
+                    self.state = state
+
+
+    def acquire(self):
+        """acquire returns the current Index, which is used by a request
+        until it is released (see release).
+        """
+        with self.lock:
+            index = self.index
+            index.users += 1
+            return index
+
+
+    def release(self, index):
+        """release ends the use of index by a request.  A retired index is
+        closed when the last request that uses it is done.
+        """
+        with self.lock:
+            index.users -= 1
+            done = index.retired and index.users == 0
+        if done:
+            index.close()
+
+
+    def retire(self, index):
+        """retire marks index as replaced (by a reload), so it is closed
+        as soon as no request uses it.
+        """
+        with self.lock:
+            index.retired = True
+            done = index.users == 0
+        if done:
+            index.close()
+
+
+    def get_cached(self, path):
+        """get_cached returns the cached response of path (None if it is
+        not cached).
+        """
+        with self.lock:
+            response = self.cache.get(path)
+            if response != None:
+                self.cache.move_to_end(path)
+            return response
+
+
+    def set_cached(self, path, response, index):
+        """set_cached caches the response of path, unless the dictionary
+        was reloaded after index (the Index used) was taken.
+        """
+        with self.lock:
+            if index is not self.index:
+                return
+            self.cache[path] = response
+            if len(self.cache) > cache_size:
+                self.cache.popitem(last = False)
+
+
+def get_lang(query, required = True):
+    """get_lang returns the language of the lang parameter of query
+    (None if it is not given and not required).
+    """
+    if "lang" not in query:
+        if required:
+            raise RequestError(400, "lang is required")
+        return None
+    try:
+        return Entry.Lang_type[query["lang"][0].upper()]
+    except KeyError:
+        raise RequestError(400, "unknown language " + query["lang"][0])
+
+
+def get_entry(index, text):
+    """get_entry returns a tuple of the number and the entry of text
+    (the index of the entry, a string) in index.data.
+    """
+    try:
+        number = int(text)
+        if number < 0:
+            raise ValueError
+        return (number, index.data.entries[number])
+    except (ValueError, IndexError):
+        raise RequestError(404, "no entry " + text)
+
+
+def get_summary(number, entry):
+    """get_summary returns a dictionary with the index, line number and
+    key (see delta.get_key) of entry number.
+    """
+    return {"index" : number, "line" : entry.line_nr, "key" : get_key(entry)}
+
+
+def handle(index, path, query):
+    """handle returns a tuple of the content type and text of the
+    response to path with query (see parse_qs) using index.  A
+    RequestError is raised if the request cannot be handled.
+    """
+    parts = [part for part in path.split("/") if part]
+    if len(parts) == 2 and parts[0] == "entry":
+        (number, entry) = get_entry(index, parts[1])
+        result = get_summary(number, entry)
+        result["fields"] = get_fields(entry)
+        return ("application/json", json.dumps(result, ensure_ascii = False))
+    if len(parts) == 3 and parts[0] == "entry" and parts[2] == "portal":
+        (number, entry) = get_entry(index, parts[1])
+        return ("text/plain", entry.get_portal())
+    if len(parts) == 3 and parts[0] == "entry" and parts[2] == "latex":
+        (number, entry) = get_entry(index, parts[1])
+        lang = get_lang(query, False)
+        result = ""
+        for l in latex_langs:
+            if (lang == None or l == lang) and l in entry.headwords:
+                for word in entry.headwords[l]:
+                    result += entry.get_latex(word, l)
+        return ("text/plain", result)
+    if parts == ["lookup"]:
+        lang = get_lang(query)
+        if "word" not in query:
+            raise RequestError(400, "word is required")
+        word = query["word"][0]
+        (order, keys, words) = index.get_lang(lang)
+        numbers = words.get(word)
+        if numbers == None:
+            key = clean_sort(word)
+            start = bisect.bisect_left(keys, key)
+            end = bisect.bisect_right(keys, key)
+            numbers = [order[i][0] for i in range(start, end)]
+        numbers = list(dict.fromkeys(numbers)) # unique, in order
+        return ("application/json", json.dumps([get_summary(number, index.data.entries[number]) for number in numbers], ensure_ascii = False))
+    if parts == ["browse"]:
+        lang = get_lang(query)
+        try:
+            limit = min(int(query.get("limit", [browse_limit])[0]), browse_max)
+        except ValueError:
+            raise RequestError(400, "limit should be a number")
+        (order, keys, words) = index.get_lang(lang)
+        start = 0
+        if "from" in query:
+            start = bisect.bisect_left(keys, clean_sort(query["from"][0]))
+        last_key = None
+        if "to" in query:
+            last_key = clean_sort(query["to"][0])
+        result = []
+        end = start
+        while end < len(order) and len(result) < limit:
+            if last_key != None and keys[end][:len(last_key)] > last_key:
+                break
+            (number, word) = order[end]
+            result.append({"index" : number, "line" : index.data.entries[number].line_nr, "word" : str(word), "sort" : keys[end]})
+            end += 1
+        following = None
+        if end < len(order) and len(result) == limit and (last_key == None or keys[end][:len(last_key)] <= last_key):
+            following = str(order[end][1])
+        return ("application/json", json.dumps({"lang" : lang.name.lower(), "words" : result, "next" : following}, ensure_ascii = False))
+    raise RequestError(404, "unknown path " + path)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """The RequestHandler class handles the GET requests of a
+    DictionaryServer (see handle).
+    """
+
+    def do_GET(self):
+        response = self.server.get_cached(self.path)
+        if response == None:
+            index = self.server.acquire()
+            try:
+                url = urlsplit(self.path)
+                try:
+                    (content_type, text) = handle(index, url.path, parse_qs(url.query))
+                    response = (200, content_type, text.encode("utf-8"))
+                except RequestError as e:
+                    response = (e.status, "application/json", json.dumps({"error" : str(e)}, ensure_ascii = False).encode("utf-8"))
+                self.server.set_cached(self.path, response, index)
+            finally:
+                self.server.release(index)
+        (status, content_type, body) = response
+        self.send_response(status)
+        self.send_header("Content-Type", content_type + "; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+
+def main():
+    """Commandline arguments are parsed and handled.  The dictionary is
+    loaded and served until the program is interrupted.
+    """
+
+    parser = argparse.ArgumentParser(description="This program serves lookups and previews of the entries of the N|uu spreadsheet over HTTP.")
+    parser.add_argument("-i", "--input",
+            help = "name of ods spreadsheet (or snapshot) file",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("--host",
+            help = "address to listen on (127.0.0.1 default)",
+            action = "store",
+            default = "127.0.0.1")
+    parser.add_argument("--port",
+            help = "port to listen on (8000 default)",
+            action = "store",
+            type = int,
+            default = 8000)
+    parser.add_argument("--interval",
+            help = "interval in seconds at which the input is checked for changes (2 default)",
+            action = "store",
+            type = float,
+            default = 2,
+            metavar = "SECONDS")
+    parser.add_argument("-l", "--log",
+            help = "name of logging filename (stdout default)",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("-d", "--debug",
+            help = "provide debugging information",
+            action = "store_const",
+            dest = "loglevel",
+            const = logging.DEBUG,
+            default = logging.INFO,
+            )
+    args = parser.parse_args()
+
+    if args.log:
+        logging.basicConfig(filename = args.log, filemode='w', format = '%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s', datefmt = '%H:%M:%S', level = args.loglevel)
+    else:
+        logging.basicConfig(level = args.loglevel)
+
+    # Perform checks on arguments
+    if args.input == None:
+        parser.error("An input filename is required.")
+
+    server = DictionaryServer((args.host, args.port), args.input, args.interval)
+    logging.info("Serving on http://%s:%d/", args.host, server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""shards.py
+
+This file contains the functions that write the portal output as a set
+of compressed shards.  The portal records are grouped by the initial
+of the (first) N|uu headword or by entry range and each group is split
+into shards of bounded (uncompressed) size.  The shards are compressed
+(gzip or zstd) and written in parallel.  A manifest (manifest.json)
+lists the shards with their number of entries and checksums, so the
+portal only needs to fetch and verify the shards that have changed.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dictionary import clean_sort
+from entry import Entry
+import gzip
+import hashlib
+import json
+import logging
+import os
+
+
+manifest_version = 1
+
+
+def get_initial(entry):
+    """get_initial returns the initial (according to clean_sort) of the
+    first N|uu headword of entry, or "_" if it has none.
+    """
+    if entry.headwords[Entry.Lang_type.NUU] == []:
+        return "_"
+    key = clean_sort(entry.headwords[Entry.Lang_type.NUU][0])
+    if key == "":
+        return "_"
+    return key[0]
+
+
+def get_groups(data, by):
+    """get_groups groups the portal records of the entries in data (a
+    Dictionary).  If by is "initial", the records are grouped by the
+    initial of the N|uu headword, if by is "range", all records are in
+    one group (in entry order).  It returns a list of tuples of the
+    name of the group and a list of tuples of the index of the entry
+    and its record.
+    """
+    groups = {}
+    for (index, entry) in enumerate(data.entries):
+        if by == "initial":
+            name = "initial-" + "%04x" % ord(get_initial(entry))
+        else:
+            name = "range"
+        record = entry.get_portal()
+        if name in groups:
+            groups[name].append((index, record))
+        else: # Set initial value
+            groups[name] = [(index, record)]
+    return sorted(groups.items())
+
+
+def get_shards(data, max_size, by):
+    """get_shards splits the portal records of data into shards of at
+    most max_size bytes (uncompressed, unless a single record is
+    larger).  It returns a list of tuples of the name of the shard and
+    the list of (index, record) tuples in the shard.
+    """
+    shards = []
+    for (name, records) in get_groups(data, by):
+        parts = []
+        current = []
+        size = 0
+        for (index, record) in records:
+            length = len(record.encode("utf-8"))
+            if current and size + length > max_size:
+                parts.append(current)
+                current = []
+                size = 0
+            current.append((index, record))
+            size += length
+        if current:
+            parts.append(current)
+        for (part, part_records) in enumerate(parts):
+            shards.append((name + "-" + "%03d" % part, part_records))
+    return shards
+
+
+def compress(text, compression):
+    """compress compresses text (bytes) using compression (gzip or
+    zstd).  The gzip output does not contain a timestamp, so the same
+    records always give the same checksum.
+    """
+    if compression == "zstd":
+        # zstandard is only needed for zstd compression
+        import zstandard
+        return zstandard.ZstdCompressor(level = 19).compress(text)
+    return gzip.compress(text, compresslevel = 9, mtime = 0)
+
+
+def write_shard(directory, name, records, compression):
+    """write_shard writes the records (a list of (index, record) tuples)
+    to the compressed shard name in directory.  It returns the
+    manifest information of the shard.
+    """
+    text = "".join([record for (index, record) in records]).encode("utf-8")
+    compressed = compress(text, compression)
+    filename = name + ".txt." + ("zst" if compression == "zstd" else "gz")
+    output = open(os.path.join(directory, filename), "wb")
+    output.write(compressed)
+    output.close()
+    return {
+            "name" : name,
+            "file" : filename,
+            "entries" : len(records),
+            "first" : records[0][0],
+            "last" : records[-1][0],
+            "size" : len(text),
+            "compressed_size" : len(compressed),
+            "sha256" : hashlib.sha256(compressed).hexdigest(),
+            "content_sha256" : hashlib.sha256(text).hexdigest(),
+            }
+
+
+def write_shards(directory, data, max_size, by = "initial", compression = "gzip", jobs = None):
+    """write_shards writes the portal output of the Dictionary data to
+    compressed shards of at most max_size bytes in directory, using a
+    pool of jobs threads.  The shards are listed in manifest.json.  The
+    shards of the previous manifest (if any) that are not in the new
+    manifest are removed after the new manifest is written.
+    """
+    logging.debug("Writing portal shards to " + directory)
+    os.makedirs(directory, exist_ok = True)
+    manifest_filename = os.path.join(directory, "manifest.json")
+    previous = []
+    try:
+        with open(manifest_filename) as f:
+            previous = [shard["file"] for shard in json.load(f)["shards"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    shards = get_shards(data, max_size, by)
+    with ThreadPoolExecutor(max_workers = jobs) as executor:
+        information = list(executor.map(lambda shard: write_shard(directory, shard[0], shard[1], compression), shards))
+    manifest = {
+            "version" : manifest_version,
+            "by" : by,
+            "compression" : compression,
+            "entries" : len(data.entries),
+            "shards" : information,
+            }
+    output = open(manifest_filename + ".tmp", "w")
+    json.dump(manifest, output, indent = 1)
+    output.close()
+    os.replace(manifest_filename + ".tmp", manifest_filename)
+    files = set([shard["file"] for shard in information])
+    for filename in previous:
+        if filename not in files and os.path.basename(filename) == filename and os.path.exists(os.path.join(directory, filename)):
+            logging.debug("Removing shard " + filename)
+            os.remove(os.path.join(directory, filename))
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""snapshot.py
+
+This file contains the implementation of the binary snapshot of a
+Dictionary.  A snapshot contains a string table, the entry records and
+the order of the headwords of each language, so the dictionary does
+not have to be rebuilt from the spreadsheet.  The snapshot is laid out
+as follows:
+
+    header    magic (8 bytes), version (uint32), number of strings
+              (uint32), number of entries (uint32), number of languages
+              (uint32), followed by the offsets (uint64) of the string
+              offsets, strings, entry offsets, entries and orders
+    strings   number of strings + 1 offsets (uint32) followed by the
+              strings (UTF-8)
+    entries   number of entries + 1 offsets (uint32) followed by the
+              records, each a list of uint32: line_nr, pos, audio_word
+              and audio_sentence (strings), the number of headword
+              languages followed by (language, number of headwords,
+              (word, marker) for each headword) for each language, and
+              the number of parentheticals followed by (language, text)
+              for each parenthetical
+    orders    for each language: language (uint32), number of
+              headwords (uint32) and (entry index, headword position)
+              (uint32) in dictionary order
+
+Strings are referred to by their number (none_string if absent).  All
+numbers are little endian.  A snapshot is loaded with mmap and the
+entries are only decoded when they are used, so loading is fast and
+processes that load the same snapshot share the pages.  Run as a
+program, it writes the snapshot of a spreadsheet and checks that the
+portal and LaTeX output of the snapshot match those of the
+spreadsheet.
+"""
+
+import argparse
+from dictionary import clean_sort, Dictionary
+from entry import Entry
+from headword import Headword
+import logging
+import mmap
+import os
+import struct
+import sys
+
+
+snapshot_magic = b"NUUSNAPS"
+snapshot_version = 1
+header_format = "<8sIIIIQQQQQ"
+header_size = struct.calcsize(header_format)
+none_string = 0xffffffff
+
+
+def is_snapshot(filename):
+    """is_snapshot returns true if filename contains a snapshot.
+    """
+    with open(filename, "rb") as f:
+        return f.read(len(snapshot_magic)) == snapshot_magic
+
+
+def write_snapshot(filename, data):
+    """write_snapshot writes the snapshot of the Dictionary data to
+    filename.  The snapshot is written to a temporary file that then
+    replaces filename, as processes that have the previous snapshot
+    mapped (see Snapshot) crash if it is changed in place.
+    """
+    logging.debug("Writing snapshot to " + filename)
+    strings = {}
+    def add_string(text):
+        if text == None:
+            return none_string
+        if text not in strings:
+            strings[text] = len(strings)
+        return strings[text]
+    # Encode the entries
+    records = []
+    for entry in data.entries:
+        record = [add_string(entry.line_nr), add_string(entry.pos), add_string(entry.audio_word), add_string(entry.audio_sentence)]
+        record.append(len(entry.headwords))
+        for lang in entry.headwords:
+            record += [lang.value, len(entry.headwords[lang])]
+            for hw in entry.headwords[lang]:
+                record += [add_string(hw.get_word()), hw.get_marker().value]
+        record.append(len(entry.parentheticals))
+        for lang in entry.parentheticals:
+            record += [lang.value, add_string(entry.parentheticals[lang])]
+        records.append(struct.pack("<" + str(len(record)) + "I", *record))
+    # Encode the orders
+    orders = []
+    for lang in Entry.Lang_type:
+        order = []
+        for (index, hw) in data.iter_sorted(lang):
+            order += [index, data.entries[index].headwords[lang].index(hw)]
+        orders.append(struct.pack("<II", lang.value, len(order) // 2) + struct.pack("<" + str(len(order)) + "I", *order))
+    # Compute the layout
+    encoded = [text.encode("utf-8") for text in strings] # in order of insertion
+    string_offsets = [0]
+    for text in encoded:
+        string_offsets.append(string_offsets[-1] + len(text))
+    entry_offsets = [0]
+    for record in records:
+        entry_offsets.append(entry_offsets[-1] + len(record))
+    string_offsets_pos = header_size
+    strings_pos = string_offsets_pos + 4 * len(string_offsets)
+    entry_offsets_pos = strings_pos + string_offsets[-1]
+    entry_offsets_pos += (-entry_offsets_pos) % 4 # align
+    entries_pos = entry_offsets_pos + 4 * len(entry_offsets)
+    orders_pos = entries_pos + entry_offsets[-1]
+    # Write the snapshot
+    temporary = filename + "." + str(os.getpid()) + ".tmp"
+    output = open(temporary, "wb")
+    output.write(struct.pack(header_format, snapshot_magic, snapshot_version, len(strings), len(records), len(orders), string_offsets_pos, strings_pos, entry_offsets_pos, entries_pos, orders_pos))
+    output.write(struct.pack("<" + str(len(string_offsets)) + "I", *string_offsets))
+    output.write(b"".join(encoded))
+    output.write(b"\0" * (entry_offsets_pos - strings_pos - string_offsets[-1]))
+    output.write(struct.pack("<" + str(len(entry_offsets)) + "I", *entry_offsets))
+    output.write(b"".join(records))
+    output.write(b"".join(orders))
+    output.close()
+    os.replace(temporary, filename)
+
+
+class Entries:
+    """The Entries class is a lazy sequence of the entries in a
+    snapshot.  An Entry is decoded when it is accessed for the first
+    time.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.cache = {}
+
+
+    def __len__(self):
+        return self.snapshot.nr_entries
+
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("entry index out of range")
+        if index not in self.cache:
+            self.cache[index] = self.snapshot.decode_entry(index)
+        return self.cache[index]
+
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+class Snapshot(Dictionary):
+    """The Snapshot class provides a Dictionary that is loaded from a
+    snapshot (see write_snapshot).  The entries are decoded lazily and
+    the dictionary order of each language is taken from the snapshot.
+    The lang_map and sort_map are only filled when they are used (which
+    decodes all entries).  Output is generated in the same way as for a
+    Dictionary.  A Snapshot cannot be changed: insert and remove_maps
+    (and so insert_line and replace_line) raise a TypeError.
+    """
+
+    def __init__(self, filename):
+        """The Snapshot is loaded from filename.  A ValueError is raised
+        if filename is not a snapshot.
+        """
+        # Dictionary.__init__ is not called, the entries and the maps
+        # are provided by the snapshot
+        self.maps = None
+        self.file = open(filename, "rb")
+        self.data = None
+        try:
+            if os.fstat(self.file.fileno()).st_size < header_size:
+                raise ValueError(filename + " is not a snapshot")
+            self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+            (magic, version, self.nr_strings, self.nr_entries, nr_orders, self.string_offsets_pos, self.strings_pos, self.entry_offsets_pos, self.entries_pos, orders_pos) = struct.unpack_from(header_format, self.data, 0)
+            if magic != snapshot_magic or version != snapshot_version:
+                raise ValueError(filename + " is not a snapshot (version " + str(snapshot_version) + ")")
+        except Exception:
+            self.close()
+            raise
+        self.orders = {}
+        offset = orders_pos
+        for i in range(nr_orders):
+            (lang, count) = struct.unpack_from("<II", self.data, offset)
+            self.orders[Entry.Lang_type(lang)] = (offset + 8, count)
+            offset += 8 + 8 * count
+        self.entries = Entries(self)
+
+
+    @property
+    def lang_map(self):
+        return self.get_maps()[0]
+
+
+    @property
+    def sort_map(self):
+        return self.get_maps()[1]
+
+
+    def get_maps(self):
+        """get_maps returns a tuple of the lang_map and sort_map (see
+        Dictionary), which are filled from the entries the first time
+        they are used.
+        """
+        if self.maps == None:
+            lang_map = {}
+            sort_map = {}
+            for lang in Entry.Lang_type:
+                lang_map[lang] = {}
+                sort_map[lang] = {}
+            for (index, entry) in enumerate(self.entries):
+                for lang in entry.headwords:
+                    for hw in entry.headwords[lang]:
+                        if hw in lang_map[lang]:
+                            lang_map[lang][hw].append(index)
+                        else: # Set initial value
+                            lang_map[lang][hw] = [index]
+                        sort_element = clean_sort(hw)
+                        if sort_element in sort_map[lang]:
+                            sort_map[lang][sort_element].append((index, hw))
+                        else: # Set initial value
+                            sort_map[lang][sort_element] = [(index, hw)]
+            self.maps = (lang_map, sort_map)
+        return self.maps
+
+
+    def insert(self, *args, **kwargs):
+        raise TypeError("A Snapshot cannot be changed")
+
+
+    def remove_maps(self, index):
+        raise TypeError("A Snapshot cannot be changed")
+
+
+    def close(self):
+        """close closes the snapshot.
+        """
+        if self.data != None:
+            self.data.close()
+        self.file.close()
+
+
+    def get_string(self, number):
+        """get_string returns string number from the string table (None
+        for none_string).
+        """
+        if number == none_string:
+            return None
+        (start, end) = struct.unpack_from("<II", self.data, self.string_offsets_pos + 4 * number)
+        return self.data[self.strings_pos + start:self.strings_pos + end].decode("utf-8")
+
+
+    def decode_entry(self, index):
+        """decode_entry decodes the record of entry index into an Entry.
+        """
+        (start, end) = struct.unpack_from("<II", self.data, self.entry_offsets_pos + 4 * index)
+        record = struct.unpack_from("<" + str((end - start) // 4) + "I", self.data, self.entries_pos + start)
+        (line_nr, pos, audio_word, audio_sentence, nr_langs) = record[:5]
+        i = 5
+        headwords = {}
+        for l in range(nr_langs):
+            (lang, count) = record[i:i + 2]
+            i += 2
+            hws = []
+            for h in range(count):
+                hws.append(Headword(self.get_string(record[i]), Headword.Marker_type(record[i + 1])))
+                i += 2
+            headwords[Entry.Lang_type(lang)] = hws
+        parentheticals = {}
+        nr_parentheticals = record[i]
+        i += 1
+        for p in range(nr_parentheticals):
+            parentheticals[Entry.Lang_type(record[i])] = self.get_string(record[i + 1])
+            i += 2
+        return Entry(headwords, self.get_string(pos), parentheticals, self.get_string(audio_word), self.get_string(audio_sentence), self.get_string(line_nr))
+
+
+    def iter_sorted(self, lang):
+        """iter_sorted iterates over the headwords of language lang in
+        dictionary order (as stored in the snapshot).  It yields tuples
+        of the index of the entry (in entries) and the headword.
+        """
+        (offset, count) = self.orders[lang]
+        for i in range(count):
+            (index, position) = struct.unpack_from("<II", self.data, offset + 8 * i)
+            yield (index, self.entries[index].headwords[lang][position])
+
+
+def main():
+    """Commandline arguments are parsed and handled.  The spreadsheet
+    is read and its snapshot is written.  Next, the snapshot is loaded
+    and its portal and LaTeX output are compared to those of the
+    spreadsheet.  The exit status is 1 if they differ.
+    """
+
+    parser = argparse.ArgumentParser(description="This program writes a snapshot of the N|uu spreadsheet and checks that the output of the snapshot matches the output of the spreadsheet.")
+    parser.add_argument("-i", "--input",
+            help = "name of ods spreadsheet file",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("-s", "--snapshot",
+            help = "name of snapshot filename",
+            action = "store",
+            metavar = "FILE")
+    args = parser.parse_args()
+
+    # Perform checks on arguments
+    if args.input == None:
+        parser.error("An input filename is required.")
+    if args.snapshot == None:
+        parser.error("A snapshot filename is required.")
+
+    # read_input is imported here to avoid a circular import
+    from convert import read_input
+    data = read_input(args.input)
+    data.save(args.snapshot)
+    snapshot = Snapshot(args.snapshot)
+    same = True
+    if snapshot.get_portal() != data.get_portal():
+        sys.stderr.write("Portal output of snapshot differs\n")
+        same = False
+    if snapshot.get_latex() != data.get_latex():
+        sys.stderr.write("LaTeX output of snapshot differs\n")
+        same = False
+    snapshot.close()
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
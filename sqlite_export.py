@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""sqlite_export.py
+
+This file contains the functions that export the dictionary to an SQLite
+database for the dictionary app and portal.  The entries, headwords (per
+language), dialect markers, POS codes, parentheticals, hidden words and
+sound references are stored in normalised tables.  The headwords and
+hidden words are also stored in FTS5 tables and the headwords carry
+precomputed collation keys, so prefix and full-text lookups as well as
+sorted browsing can be done without further processing.
+"""
+
+from dictionary import clean_sort, entry_sort
+from entry import Entry
+from headword import Headword
+import logging
+import os
+from output_helper import clean_portal, clean_portal_text
+import sqlite3
+import time
+
+
+schema = """
+CREATE TABLE languages (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE markers (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE pos (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    code TEXT NOT NULL
+);
+CREATE TABLE entries (
+    id INTEGER PRIMARY KEY,
+    line_nr INTEGER NOT NULL,
+    pos_id INTEGER NOT NULL REFERENCES pos(id)
+);
+CREATE TABLE headwords (
+    id INTEGER PRIMARY KEY,
+    entry_id INTEGER NOT NULL REFERENCES entries(id),
+    language_id INTEGER NOT NULL REFERENCES languages(id),
+    position INTEGER NOT NULL,
+    word TEXT NOT NULL,
+    marker_id INTEGER NOT NULL REFERENCES markers(id),
+    portal TEXT NOT NULL,
+    sort_key TEXT NOT NULL,
+    entry_sort_key TEXT NOT NULL,
+    sort_rank INTEGER
+);
+CREATE TABLE parentheticals (
+    entry_id INTEGER NOT NULL REFERENCES entries(id),
+    language_id INTEGER NOT NULL REFERENCES languages(id),
+    text TEXT NOT NULL,
+    portal TEXT NOT NULL
+);
+CREATE TABLE hidden (
+    id INTEGER PRIMARY KEY,
+    entry_id INTEGER NOT NULL REFERENCES entries(id),
+    language_id INTEGER NOT NULL REFERENCES languages(id),
+    word TEXT NOT NULL
+);
+CREATE TABLE sounds (
+    entry_id INTEGER NOT NULL REFERENCES entries(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE headwords_fts USING fts5(
+    portal,
+    content = 'headwords',
+    content_rowid = 'id',
+    prefix = '1 2 3',
+    tokenize = "unicode61 remove_diacritics 2 tokenchars '!'''"
+);
+CREATE VIRTUAL TABLE hidden_fts USING fts5(
+    word,
+    content = 'hidden',
+    content_rowid = 'id',
+    prefix = '1 2 3',
+    tokenize = "unicode61 remove_diacritics 2 tokenchars '!'''"
+);
+"""
+
+indices = """
+CREATE INDEX headwords_entry ON headwords(entry_id);
+CREATE INDEX headwords_sort ON headwords(language_id, sort_key, entry_sort_key);
+CREATE INDEX headwords_rank ON headwords(language_id, sort_rank);
+CREATE INDEX parentheticals_entry ON parentheticals(entry_id);
+CREATE INDEX hidden_entry ON hidden(entry_id);
+CREATE INDEX sounds_entry ON sounds(entry_id);
+CREATE INDEX sounds_name ON sounds(name);
+"""
+
+
+def get_rows(data):
+    """get_rows converts the Dictionary data into rows for the tables.
+    It returns a dictionary mapping the table names to lists of rows.
+    """
+    rows = {
+            "languages" : [(lang.value, Entry.lang2text(lang)) for lang in Entry.Lang_type],
+            "markers" : [(marker.value, marker.name) for marker in Headword.Marker_type],
+            "pos" : [],
+            "entries" : [],
+            "headwords" : [],
+            "parentheticals" : [],
+            "hidden" : [],
+            "sounds" : [],
+            }
+    pos_ids = {}
+    for (pos, code) in Entry.pos2text_map.items():
+        pos_ids[pos] = len(pos_ids) + 1
+        rows["pos"].append((pos_ids[pos], pos, code))
+    headword_ids = {} # maps (entry index, language, headword position) to id
+    for (index, entry) in enumerate(data.entries):
+        entry_id = index + 1
+        rows["entries"].append((entry_id, int(entry.line_nr), pos_ids[entry.pos]))
+        for lang in entry.headwords:
+            for (position, hw) in enumerate(entry.headwords[lang]):
+                headword_id = len(headword_ids) + 1
+                headword_ids[(index, lang, position)] = headword_id
+                if lang == Entry.Lang_type.IPA:
+                    portal = clean_portal(hw)
+                else:
+                    portal = clean_portal_text(hw)
+                rows["headwords"].append([headword_id, entry_id, lang.value, position, str(hw.get_word()), hw.get_marker().value, portal, clean_sort(hw), entry_sort(entry, hw, lang), None])
+        for lang in entry.parentheticals:
+            rows["parentheticals"].append((entry_id, lang.value, entry.parentheticals[lang], clean_portal_text(entry.parentheticals[lang])))
+        for lang in Entry.Lang_type:
+            if lang != Entry.Lang_type.IPA:
+                for word in entry.get_hidden(lang):
+                    rows["hidden"].append((len(rows["hidden"]) + 1, entry_id, lang.value, clean_portal_text(word)))
+        for (position, name) in enumerate(entry.get_sounds()):
+            rows["sounds"].append((entry_id, position, name))
+    # Add the rank in dictionary order
+    for lang in Entry.Lang_type:
+        for (rank, (index, hw)) in enumerate(data.iter_sorted(lang)):
+            position = data.entries[index].headwords[lang].index(hw)
+            rows["headwords"][headword_ids[(index, lang, position)] - 1][-1] = rank
+    return rows
+
+
+def write_sqlite(filename, data):
+    """write_sqlite writes the Dictionary data to the SQLite database
+    filename (which is replaced if it exists).  All rows are inserted in
+    one transaction.
+    """
+    logging.debug("Writing SQLite output to " + filename)
+    start = time.perf_counter()
+    if os.path.exists(filename):
+        os.remove(filename)
+    rows = get_rows(data)
+    connection = sqlite3.connect(filename, isolation_level = None)
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute("BEGIN")
+    for statement in schema.split(";"):
+        connection.execute(statement)
+    for table in ["languages", "markers", "pos", "entries", "headwords", "parentheticals", "hidden", "sounds"]:
+        if rows[table]:
+            placeholders = ", ".join(["?"] * len(rows[table][0]))
+            connection.executemany("INSERT INTO " + table + " VALUES (" + placeholders + ")", rows[table])
+    connection.execute("INSERT INTO headwords_fts(headwords_fts) VALUES ('rebuild')")
+    connection.execute("INSERT INTO hidden_fts(hidden_fts) VALUES ('rebuild')")
+    for statement in indices.split(";"):
+        connection.execute(statement)
+    connection.execute("COMMIT")
+    connection.execute("ANALYZE")
+    connection.close()
+    logging.info("Wrote " + str(len(rows["entries"])) + " entries to " + filename + " in " + "%.2f" % (time.perf_counter() - start) + "s (" + str(os.path.getsize(filename)) + " bytes)")
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""synthetic.py
+
+This program writes synthetic N|uu spreadsheets (in .ods format) that
+can be used for benchmarking and testing, as the real spreadsheet
+cannot be shared.  The spreadsheets have the column headers of the real
+spreadsheet and their contents are random, but have the properties of
+the real data: clicks, combining characters, Eastern and Western
+variants, cells with more than one headword (separated by ;), words
+that are skipped when sorting, parentheticals and recordings.  The
+size is given as a scale relative to the size of the real spreadsheet
+(scale_entries entries).
+"""
+
+import argparse
+from entry import Entry
+import logging
+import random
+from xml.sax.saxutils import escape
+import zipfile
+
+
+# Number of entries at scale 1 (about the size of the real spreadsheet,
+# which has over 20000 rows)
+scale_entries = 20000
+
+columns = [
+        "Orthography 1",
+        "IPA",
+        "Part of Speech, English",
+        "Nama Feedback",
+        "Nama Parentheticals",
+        "Afrikaans community feedback HEADWORD",
+        "Afrikaans community feedback Local Variety ",
+        "Afrik Parentheticals",
+        "English",
+        "Parentheticals, English",
+        "Dictionary Recording (target word only)",
+        "Recordings (target word in sentence)",
+        ]
+
+# Syllable onsets and nuclei of the N|uu words: clicks (with
+# accompaniments) and plain consonants, vowels with combining
+# characters (768 grave, 778 ring above) and precomposed vowels.  Only
+# characters that output_helper can convert to LaTeX are used.
+nuu_onsets = ["ǀ", "ǁ", "ǃ", "ǂ", "ʘ", "!", "ǀx", "ǁh", "ǃq", "ǂk", "ʘq", "k", "s", "t", "n", "x", "h", "c", ""]
+nuu_nuclei = ["a", "e", "i", "o", "u", "aa", "ai", "oe", "uu", "a" + chr(768), "u" + chr(778), "ā", "â", "ē", "ō", "û"]
+ipa_map = {"a" : "ɑ", "e" : "ɛ", "o" : "ɔ", "!" : "ǃ", "x" : "χ", "h" : "ʰ", chr(778) : chr(805)}
+nama_onsets = ["ǀ", "ǁ", "ǃ", "ǂ", "ǀg", "ǁkh", "ǃn", "ǂh", "k", "g", "s", "t", "d", "m", "h", ""]
+nama_nuclei = ["a", "e", "i", "o", "u", "â", "ô", "ū", "ā", "ai", "ao"]
+afrikaans_words = ["woord", "ding", "klip", "water", "boom", "loop", "sien", "groot", "klein", "vinnig", "dorp", "haas", "vuur", "wind", "reën", "sing", "eet", "drink", "slaap", "maak"]
+afrikaans_prefixes = ["", "", "", "die ", "'n ", "iemand ", "iets ", "om te ", "(wees) "]
+english_words = ["word", "thing", "stone", "water", "tree", "walk", "see", "big", "small", "quick", "village", "hare", "fire", "wind", "rain", "sing", "eat", "drink", "sleep", "make"]
+english_prefixes = ["", "", "", "the ", "a ", "be ", "(be) ", "to "]
+parentheticals = {
+        "nama" : ["lit. `{}'", "cf. {}", "{} (pl.)"],
+        "afrikaans" : ["let. `{}'", "vgl. {}", "NKK: {}"],
+        "english" : ["lit. `{}'", "cf. `{}'", "{} (pl.)"],
+        }
+
+
+def get_word(r, onsets, nuclei, syllables):
+    """get_word returns a random word of at most syllables syllables
+    using onsets and nuclei.
+    """
+    return "".join([r.choice(onsets) + r.choice(nuclei) for i in range(r.randint(1, syllables))])
+
+
+def get_cell(r, make, probability):
+    """get_cell returns one or more (with probability) words made by
+    make, separated by ;.
+    """
+    words = [make()]
+    while r.random() < probability and len(words) < 3:
+        words.append(make())
+    return "; ".join(words)
+
+
+def get_row(r, line_nr):
+    """get_row returns a dictionary mapping the columns to the (random)
+    contents of the row of line line_nr.  Empty cells are None.
+    """
+    nuu = get_word(r, nuu_onsets, nuu_nuclei, 3)
+    ipa = "".join([ipa_map.get(c, c) for c in nuu])
+    if r.random() < 0.15:
+        # Eastern and Western variants
+        variant = nuu + r.choice(nuu_nuclei)
+        nuu = nuu + " (Eastern); " + variant + " (Western)"
+        ipa = ipa + "; " + "".join([ipa_map.get(c, c) for c in variant])
+    elif r.random() < 0.1:
+        synonym = get_word(r, nuu_onsets, nuu_nuclei, 2)
+        nuu = nuu + "; " + synonym
+        ipa = ipa + "; " + "".join([ipa_map.get(c, c) for c in synonym])
+    if r.random() < 0.01:
+        nuu = chr(9790) + nuu # half moon
+    afrikaans = lambda: r.choice(afrikaans_prefixes) + r.choice(afrikaans_words) + r.choice(["", "", "e", "s", "tjie"])
+    english = lambda: r.choice(english_prefixes) + r.choice(english_words) + r.choice(["", "", "s", "ing", "y"])
+    row = {
+            "Orthography 1" : nuu,
+            "IPA" : ipa,
+            "Part of Speech, English" : r.choice([pos for pos in Entry.pos2text_map if pos != ""]),
+            "Nama Feedback" : get_cell(r, lambda: get_word(r, nama_onsets, nama_nuclei, 3), 0.2),
+            "Nama Parentheticals" : None,
+            "Afrikaans community feedback HEADWORD" : get_cell(r, afrikaans, 0.3),
+            "Afrikaans community feedback Local Variety " : None,
+            "Afrik Parentheticals" : None,
+            "English" : get_cell(r, english, 0.3),
+            "Parentheticals, English" : None,
+            "Dictionary Recording (target word only)" : None,
+            "Recordings (target word in sentence)" : None,
+            }
+    if r.random() < 0.15:
+        row["Nama Parentheticals"] = r.choice(parentheticals["nama"]).format(get_word(r, nama_onsets, nama_nuclei, 2))
+    if r.random() < 0.1:
+        row["Afrikaans community feedback Local Variety "] = get_cell(r, afrikaans, 0.2)
+    if r.random() < 0.2:
+        row["Afrik Parentheticals"] = r.choice(parentheticals["afrikaans"]).format(afrikaans())
+    if r.random() < 0.25:
+        row["Parentheticals, English"] = r.choice(parentheticals["english"]).format(english())
+    if r.random() < 0.9:
+        names = ["W%06d" % line_nr]
+        if r.random() < 0.1:
+            names.append("W%06db" % line_nr)
+        row["Dictionary Recording (target word only)"] = r.choice([", ", "; "]).join(names)
+    if r.random() < 0.7:
+        row["Recordings (target word in sentence)"] = "S%06d" % line_nr
+    return row
+
+
+def get_rows(entries, seed = 1):
+    """get_rows returns a list of entries random rows (see get_row)
+    using random seed seed.
+    """
+    r = random.Random(seed)
+    return [get_row(r, index + 2) for index in range(entries)] # 2 is header and offset
+
+
+def get_cell_xml(value):
+    """get_cell_xml returns the content.xml representation of a cell
+    with value (None for an empty cell).
+    """
+    if value == None:
+        return "<table:table-cell/>"
+    return "<table:table-cell office:value-type=\"string\"><text:p>" + escape(value) + "</text:p></table:table-cell>"
+
+
+def write_ods(filename, rows):
+    """write_ods writes the rows (dictionaries mapping columns to
+    values) to the spreadsheet filename (in .ods format, with the
+    column headers in the first row).
+    """
+    logging.debug("Writing synthetic spreadsheet to " + filename)
+    content = ["<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n"]
+    content.append("<office:document-content xmlns:office=\"urn:oasis:names:tc:opendocument:xmlns:office:1.0\" xmlns:table=\"urn:oasis:names:tc:opendocument:xmlns:table:1.0\" xmlns:text=\"urn:oasis:names:tc:opendocument:xmlns:text:1.0\" office:version=\"1.2\">")
+    content.append("<office:body><office:spreadsheet><table:table table:name=\"Sheet1\">")
+    content.append("<table:table-row>" + "".join([get_cell_xml(column) for column in columns]) + "</table:table-row>")
+    for row in rows:
+        content.append("<table:table-row>" + "".join([get_cell_xml(row[column]) for column in columns]) + "</table:table-row>")
+    content.append("</table:table></office:spreadsheet></office:body></office:document-content>")
+    manifest = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n"
+    manifest += "<manifest:manifest xmlns:manifest=\"urn:oasis:names:tc:opendocument:xmlns:manifest:1.0\" manifest:version=\"1.2\">"
+    manifest += "<manifest:file-entry manifest:full-path=\"/\" manifest:media-type=\"application/vnd.oasis.opendocument.spreadsheet\"/>"
+    manifest += "<manifest:file-entry manifest:full-path=\"content.xml\" manifest:media-type=\"text/xml\"/>"
+    manifest += "</manifest:manifest>"
+    output = zipfile.ZipFile(filename, "w")
+    # The mimetype has to be the first file and cannot be compressed
+    output.writestr(zipfile.ZipInfo("mimetype"), "application/vnd.oasis.opendocument.spreadsheet")
+    output.writestr("META-INF/manifest.xml", manifest, zipfile.ZIP_DEFLATED)
+    output.writestr("content.xml", "".join(content), zipfile.ZIP_DEFLATED)
+    output.close()
+
+
+def write_synthetic(filename, scale = 1, seed = 1):
+    """write_synthetic writes a synthetic spreadsheet of scale times
+    scale_entries entries to filename.  It returns the number of
+    entries.
+    """
+    entries = max(1, int(scale * scale_entries))
+    write_ods(filename, get_rows(entries, seed))
+    return entries
+
+
+def main():
+    """Commandline arguments are parsed and handled.  A synthetic
+    spreadsheet is written.
+    """
+
+    parser = argparse.ArgumentParser(description="This program writes a synthetic N|uu spreadsheet for benchmarking.")
+    parser.add_argument("-o", "--output",
+            help = "name of ods spreadsheet file",
+            action = "store",
+            metavar = "FILE")
+    parser.add_argument("-s", "--scale",
+            help = "size relative to the real spreadsheet (" + str(scale_entries) + " entries), for instance 0.1, 1 or 10 (1 default)",
+            action = "store",
+            type = float,
+            default = 1)
+    parser.add_argument("--seed",
+            help = "random seed (1 default)",
+            action = "store",
+            type = int,
+            default = 1)
+    parser.add_argument("-d", "--debug",
+            help = "provide debugging information",
+            action = "store_const",
+            dest = "loglevel",
+            const = logging.DEBUG,
+            default = logging.WARNING,
+            )
+    args = parser.parse_args()
+
+    logging.basicConfig(level = args.loglevel)
+
+    # Perform checks on arguments
+    if args.output == None:
+        parser.error("An output filename is required.")
+
+    write_synthetic(args.output, args.scale, args.seed)
+
+
+if __name__ == '__main__':
+    main()
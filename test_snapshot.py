@@ -0,0 +1,57 @@
+"""test_snapshot.py
+
+Tests of snapshot.py: the output of a snapshot must match the output of
+the spreadsheet it was written from.  The spreadsheets are synthetic
+(see synthetic.py).  Run with pytest.
+"""
+
+from convert import read_input
+from dictionary import clean_sort
+import pytest
+from snapshot import Snapshot, write_snapshot
+from synthetic import get_rows, write_ods
+
+
+@pytest.fixture
+def spreadsheet(tmp_path):
+    filename = str(tmp_path / "synthetic.ods")
+    write_ods(filename, get_rows(300))
+    return filename
+
+
+def test_output(spreadsheet, tmp_path):
+    data = read_input(spreadsheet)
+    data.save(str(tmp_path / "synthetic.snap"))
+    snapshot = read_input(str(tmp_path / "synthetic.snap"))
+    assert isinstance(snapshot, Snapshot)
+    assert snapshot.get_portal() == data.get_portal()
+    assert snapshot.get_latex() == data.get_latex()
+    snapshot.close()
+
+
+def test_maps(spreadsheet, tmp_path):
+    data = read_input(spreadsheet)
+    data.save(str(tmp_path / "synthetic.snap"))
+    snapshot = Snapshot(str(tmp_path / "synthetic.snap"))
+    for lang in data.sort_map:
+        assert sorted([(key, sorted([index for (index, word) in values])) for (key, values) in snapshot.sort_map[lang].items()]) == sorted([(key, sorted([index for (index, word) in values])) for (key, values) in data.sort_map[lang].items()])
+        assert sorted([(clean_sort(word), indices) for (word, indices) in snapshot.lang_map[lang].items()]) == sorted([(clean_sort(word), indices) for (word, indices) in data.lang_map[lang].items()])
+    with pytest.raises(TypeError):
+        snapshot.replace_line(0, None, 2)
+    snapshot.close()
+
+
+def test_replace(spreadsheet, tmp_path):
+    filename = str(tmp_path / "synthetic.snap")
+    data = read_input(spreadsheet)
+    data.save(filename)
+    snapshot = Snapshot(filename)
+    # Writing a smaller snapshot must not change the mapped one
+    write_ods(str(tmp_path / "smaller.ods"), get_rows(50))
+    write_snapshot(filename, read_input(str(tmp_path / "smaller.ods")))
+    smaller = Snapshot(filename)
+    assert len(smaller.entries) == 50
+    smaller.close()
+    last = snapshot.entries[-1]
+    assert last.get_portal() == data.entries[-1].get_portal()
+    snapshot.close()
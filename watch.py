@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""watch.py
+
+This file contains the implementation of the watch mode of convert.py
+(--watch).  The Dictionary is kept in memory and the spreadsheet is
+polled for changes.  The rows are compared to the previous revision
+using a hash of each row, so only the changed rows are inserted again
+(in place, see Dictionary.replace_line) and only their portal records
+and LaTeX lemmas are rendered again.  The output files are only
+rewritten if their contents changed, which for the split LaTeX output
+(see render.SplitLatexSink) means only the blocks with changed lemmas,
+and files that are no longer written (blocks of initials that
+disappeared) are removed.  If rows are added or removed, the Dictionary
+is rebuilt, as the line numbers of the following rows change.  The
+diagnostics are kept up to date: the records of changed rows are
+removed before the rows are inserted again, and all records are
+removed when the Dictionary is rebuilt.
+"""
+
+from delta import compare, get_fields, get_key
+from diagnostics import diagnostics
+from dictionary import Dictionary
+import logging
+import os
+from render import LatexSink, PortalSink, render, SplitLatexSink
+import sys
+import time
+
+
+def read_rows(filename):
+    """read_rows returns the list of rows (pandas Series) of the
+    spreadsheet filename.
+    """
+    logging.debug("Reading in file %s", filename)
+    # pandas_ods_reader is imported here as importing pandas is slow
+    from pandas_ods_reader import read_ods
+    spreadsheet = read_ods(filename, 1)
+    return [row for (index, row) in spreadsheet.iterrows()]
+
+
+def get_row_hash(row):
+    """get_row_hash returns the hash of the values of row.
+    """
+    return hash(tuple(map(str, row.values)))
+
+
+def get_state(filename):
+    """get_state returns the modification time and size of filename
+    (None if it cannot be read), which change when the file is saved.
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ChangedWriter:
+    """The ChangedWriter class collects the text of a file in memory and
+    only writes the file (on close) if its contents changed.  The names
+    of the written files are added to changed and the names of all
+    files (written or not) to files.
+    """
+
+    def __init__(self, filename, changed, files):
+        self.filename = filename
+        self.changed = changed
+        self.files = files
+        self.buffer = []
+
+
+    def write(self, text):
+        self.buffer.append(text)
+
+
+    def close(self):
+        text = "".join(self.buffer)
+        self.buffer = []
+        self.files.append(self.filename)
+        try:
+            with open(self.filename) as f:
+                if f.read() == text:
+                    return
+        except (OSError, UnicodeDecodeError):
+            pass
+        output = open(self.filename, "w")
+        output.write(text)
+        output.close()
+        self.changed.append(self.filename)
+
+
+class ChangedPortalSink(PortalSink):
+    """The ChangedPortalSink class is a PortalSink that uses a
+    ChangedWriter (see changed and files).
+    """
+
+    def __init__(self, filename, changed, files):
+        self.changed = changed
+        self.files = files
+        PortalSink.__init__(self, filename)
+
+
+    def new_writer(self, filename):
+        return ChangedWriter(filename, self.changed, self.files)
+
+
+class ChangedLatexSink(LatexSink):
+    """The ChangedLatexSink class is a LatexSink that uses a
+    ChangedWriter (see changed and files).
+    """
+
+    def __init__(self, filename, changed, files, langs = None, first = None, last = None):
+        self.changed = changed
+        self.files = files
+        LatexSink.__init__(self, filename, langs, first, last)
+
+
+    def new_writer(self, filename):
+        return ChangedWriter(filename, self.changed, self.files)
+
+
+class ChangedSplitLatexSink(SplitLatexSink):
+    """The ChangedSplitLatexSink class is a SplitLatexSink that uses
+    ChangedWriters (see changed and files), so only the sections and
+    blocks that changed are rewritten.
+    """
+
+    def __init__(self, filename, changed, files, langs = None, first = None, last = None):
+        self.changed = changed
+        self.files = files
+        SplitLatexSink.__init__(self, filename, langs, first, last)
+
+
+    def new_writer(self, filename):
+        return ChangedWriter(filename, self.changed, self.files)
+
+
+class CachedEntry:
+    """The CachedEntry class wraps an Entry and keeps its portal record
+    and LaTeX lemmas, so unchanged entries are not rendered again.
+    """
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.portal = None
+        self.latex = {}
+
+
+    def get_portal(self):
+        if self.portal == None:
+            self.portal = self.entry.get_portal()
+        return self.portal
+
+
+    def get_latex(self, word, lang):
+        if (word, lang) not in self.latex:
+            self.latex[(word, lang)] = self.entry.get_latex(word, lang)
+        return self.latex[(word, lang)]
+
+
+class CachedDictionary:
+    """The CachedDictionary class is the view of a Dictionary that is
+    rendered: its entries are CachedEntries (in the same order) and the
+    headwords are taken from the Dictionary.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.entries = [CachedEntry(entry) for entry in data.entries]
+
+
+    def iter_range(self, lang, first = None, last = None):
+        return self.data.iter_range(lang, first, last)
+
+
+class Watcher:
+    """The Watcher class keeps the Dictionary of the spreadsheet
+    filename in memory and writes the portal output (portal) and LaTeX
+    output (latex, split into files if split is true, with only the
+    sections of langs and the range from first to last, see
+    LatexSink) whenever the spreadsheet changes.
+    """
+
+    def __init__(self, filename, portal = None, latex = None, split = False, langs = None, first = None, last = None):
+        self.filename = filename
+        self.portal = portal
+        self.latex = latex
+        self.split = split
+        self.langs = langs
+        self.first = first
+        self.last = last
+        self.data = None
+        self.view = None
+        # The files written in the last pass (see write)
+        self.files = []
+        # For each row, a tuple of the hash of the row and the index of
+        # its entry (None if the row has no entry)
+        self.rows = []
+
+
+    def build(self, rows):
+        """build builds the Dictionary from rows (see read_rows).  The
+        diagnostics are cleared first.
+        """
+        diagnostics.clear()
+        self.data = Dictionary()
+        self.rows = []
+        for (index, row) in enumerate(rows):
+            try:
+                self.data.insert_line(row, index + 2) # 2 is header and offset
+                self.rows.append((get_row_hash(row), len(self.data.entries) - 1))
+            except ValueError:
+                diagnostics.error("missing N|uu", "Missing N|uu information on line %s", index + 2, line_nr = index + 2)
+                self.rows.append((get_row_hash(row), None))
+        self.view = CachedDictionary(self.data)
+
+
+    def update(self, rows):
+        """update updates the Dictionary to rows (see read_rows).  Changed
+        rows are replaced in place if the number of rows is the same
+        and the rows have an entry before and after the change,
+        otherwise the Dictionary is rebuilt.  It returns a tuple of the
+        lists of added, removed and modified entries (see
+        delta.compare) and the previous Dictionary (whose entries
+        the removed and modified entries refer to).
+        """
+        # The previous revision (compare only uses the entries)
+        old = Dictionary()
+        old.entries = list(self.data.entries)
+        changed = [index for (index, row) in enumerate(rows) if index >= len(self.rows) or get_row_hash(row) != self.rows[index][0]]
+        in_place = len(rows) == len(self.rows) and all([self.rows[index][1] != None for index in changed])
+        if in_place:
+            modified = []
+            for index in changed:
+                entry_index = self.rows[index][1]
+                diagnostics.remove_lines([index + 2])
+                try:
+                    self.data.replace_line(entry_index, rows[index], index + 2)
+                except ValueError:
+                    in_place = False
+                    break
+                self.rows[index] = (get_row_hash(rows[index]), entry_index)
+                self.view.entries[entry_index] = CachedEntry(self.data.entries[entry_index])
+                old_fields = get_fields(old.entries[entry_index])
+                new_fields = get_fields(self.data.entries[entry_index])
+                fields = sorted([name for name in set(old_fields) | set(new_fields) if old_fields.get(name) != new_fields.get(name)])
+                if fields:
+                    modified.append((entry_index, entry_index, fields))
+            if in_place:
+                return ([], [], modified, old)
+        logging.debug("Rebuilding the dictionary")
+        self.build(rows)
+        (added, removed, modified) = compare(old, self.data)
+        return (added, removed, modified, old)
+
+
+    def write(self):
+        """write writes the output files whose contents changed and
+        removes the files of the previous pass that are no longer
+        written (for instance the block of an initial that no longer
+        occurs).  It returns the list of written and removed files.
+        """
+        changed = []
+        files = []
+        sinks = []
+        if self.latex != None:
+            if self.split:
+                sinks.append(ChangedSplitLatexSink(self.latex, changed, files, self.langs, self.first, self.last))
+            else:
+                sinks.append(ChangedLatexSink(self.latex, changed, files, self.langs, self.first, self.last))
+        if self.portal != None:
+            sinks.append(ChangedPortalSink(self.portal, changed, files))
+        render(self.view, sinks)
+        for filename in self.files:
+            if filename not in files and os.path.exists(filename):
+                logging.debug("Removing %s", filename)
+                os.remove(filename)
+                changed.append(filename)
+        self.files = files
+        return changed
+
+
+    def watch(self, interval = 0.5, output = sys.stdout):
+        """watch builds the Dictionary and writes the output files, and
+        then polls the spreadsheet every interval seconds.  When it
+        changed (and its modification time and size are stable for an
+        interval), the Dictionary and the output files are updated and
+        a summary of the changed entries is written to output.  It
+        runs until it is interrupted.
+        """
+        self.build(read_rows(self.filename))
+        changed = self.write()
+        output.write("Wrote " + str(len(changed)) + " files, watching " + self.filename + "\n")
+        output.flush()
+        state = get_state(self.filename)
+        try:
+            while True:
+                time.sleep(interval)
+                new_state = get_state(self.filename)
+                if new_state == state or new_state == None:
+                    continue
+                # Wait until the spreadsheet is completely saved
+                time.sleep(interval)
+                if get_state(self.filename) != new_state:
+                    continue
+                start = time.perf_counter()
+                try:
+                    rows = read_rows(self.filename)
+                except Exception as e:
+                    logging.warning("Cannot read %s: %s", self.filename, e)
+                    continue
+                state = new_state
+                (added, removed, modified, old) = self.update(rows)
+                changed = self.write()
+                for j in added:
+                    output.write("Added line " + self.data.entries[j].line_nr + ": " + get_key(self.data.entries[j]) + "\n")
+                for i in removed:
+                    output.write("Removed line " + old.entries[i].line_nr + ": " + get_key(old.entries[i]) + "\n")
+                for (i, j, fields) in modified:
+                    output.write("Modified line " + self.data.entries[j].line_nr + ": " + get_key(self.data.entries[j]) + " changed " + ", ".join(fields) + "\n")
+                output.write("Updated " + str(len(added) + len(removed) + len(modified)) + " entries and wrote " + str(len(changed)) + " files in " + "%.2f" % (time.perf_counter() - start) + "s\n")
+                output.flush()
+        except KeyboardInterrupt:
+            pass